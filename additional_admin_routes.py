@@ -1,12 +1,14 @@
 # Add these routes to support the admin functionality
 
+from batching import run_in_chunks
+
 @app.route('/api/coupons/<coupon_id>')
 def get_coupon_api(coupon_id):
     """API endpoint to get coupon data for editing"""
     try:
-        result = supabase.table('coupons').select('*').eq('id', coupon_id).execute()
-        if result.data:
-            return jsonify(result.data[0])
+        coupon = coupon_manager.get_coupon_by_id(coupon_id)
+        if coupon:
+            return jsonify(coupon)
         else:
             return jsonify({'error': 'Coupon not found'}), 404
     except Exception as e:
@@ -27,6 +29,7 @@ def toggle_coupon_status():
             'status': new_status,
             'updated_at': datetime.now().isoformat()
         }).eq('id', coupon_id).execute()
+        coupon_manager.cache.invalidate(coupon_id=coupon_id)
         
         if result.data:
             # Log activity
@@ -60,6 +63,9 @@ def delete_coupon():
         
         # Delete coupon
         result = supabase.table('coupons').delete().eq('id', coupon_id).execute()
+        coupon_manager.cache.invalidate(coupon_id=coupon_id, code=coupon_code)
+        coupon_manager.short_links.forget(code=coupon_code)
+        coupon_manager.stats.record_deleted(result.data or [])
         
         if result.data:
             # Log activity
@@ -87,12 +93,9 @@ def bulk_delete_coupons():
         if not coupon_ids:
             return jsonify({'success': False, 'error': 'No coupons selected'})
         
-        # Delete coupons
-        deleted_count = 0
-        for coupon_id in coupon_ids:
-            result = supabase.table('coupons').delete().eq('id', coupon_id).execute()
-            if result.data:
-                deleted_count += 1
+        # Delete coupons in set-based chunks
+        result = coupon_manager.bulk_delete_coupons(coupon_ids, Config.BULK_CHUNK_SIZE)
+        deleted_count = result['processed_count']
         
         if deleted_count > 0:
             # Log activity
@@ -104,7 +107,8 @@ def bulk_delete_coupons():
             }
             supabase.table('activity_log').insert(activity_data).execute()
             
-            return jsonify({'success': True, 'deleted_count': deleted_count})
+            return jsonify({'success': True, 'deleted_count': deleted_count,
+                            'chunks': result['chunks'], 'failed_ids': result['failed_ids']})
         else:
             return jsonify({'success': False, 'error': 'No coupons were deleted'})
             
@@ -121,15 +125,18 @@ def bulk_update_status():
         if not coupon_ids or not new_status:
             return jsonify({'success': False, 'error': 'Missing parameters'})
         
-        # Update coupons
-        updated_count = 0
-        for coupon_id in coupon_ids:
+        # Update coupons in set-based chunks
+        def update_chunk(chunk):
             result = supabase.table('coupons').update({
                 'status': new_status,
                 'updated_at': datetime.now().isoformat()
-            }).eq('id', coupon_id).execute()
-            if result.data:
-                updated_count += 1
+            }).in_('id', chunk).execute()
+            for coupon_id in chunk:
+                coupon_manager.cache.invalidate(coupon_id=coupon_id)
+            return set(str(r['id']) for r in (result.data or []))
+        
+        result = run_in_chunks(coupon_ids, Config.BULK_CHUNK_SIZE, update_chunk)
+        updated_count = result['processed_count']
         
         if updated_count > 0:
             # Log activity
@@ -141,7 +148,8 @@ def bulk_update_status():
             }
             supabase.table('activity_log').insert(activity_data).execute()
             
-            return jsonify({'success': True, 'updated_count': updated_count})
+            return jsonify({'success': True, 'updated_count': updated_count,
+                            'chunks': result['chunks'], 'failed_ids': result['failed_ids']})
         else:
             return jsonify({'success': False, 'error': 'No coupons were updated'})
             
@@ -0,0 +1,205 @@
+# asgi_app.py - ASGI entry point for the hot coupon API routes
+#
+# Serves claim, use and lookup-by-email from AsyncSupabaseService so a single
+# worker keeps many PostgREST calls in flight. The Flask app keeps serving the
+# admin pages and everything else; route the paths below here at the proxy.
+#     uvicorn asgi_app:app --workers 4
+# Plain ASGI, so no web framework beyond the server is needed.
+
+import json
+import logging
+import re
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import parse_qs, unquote
+
+from async_supabase_service import async_supabase_service
+from config_py import Config
+from coupon_columns import parse_fields
+from coupon_validity import is_expired
+from db_functions import ALREADY_USED, EXPIRED, NOT_FOUND
+from pagination import next_link, parse_limit
+from supabase_pool import pool_stats
+
+logger = logging.getLogger(__name__)
+
+# (status, payload) or (status, payload, extra headers)
+Response = Union[Tuple[int, Any], Tuple[int, Any, Dict[str, str]]]
+Handler = Callable[..., Awaitable[Response]]
+
+ROUTES: List[Tuple[str, 're.Pattern', Handler]] = []
+
+
+def route(method: str, pattern: str):
+    """Register a handler; <name> segments are passed as keyword arguments"""
+    regex = re.compile('^' + re.sub(r'<(\w+)>', r'(?P<\1>[^/]+)', pattern) + '$')
+
+    def register(handler: Handler) -> Handler:
+        ROUTES.append((method, regex, handler))
+        return handler
+    return register
+
+
+@route('POST', '/api/coupons/claim')
+async def claim_coupon(request: Dict[str, Any]) -> Response:
+    """Claim a coupon for an email and return the email's coupons"""
+    data = request['json'] or {}
+    email = data.get('email')
+    coupon_code = data.get('coupon_code')
+
+    if not email:
+        return 400, {'success': False, 'message': 'Email is required'}
+
+    if coupon_code:
+        coupon = await async_supabase_service.get_coupon_by_code(coupon_code)
+        if not coupon:
+            return 404, {'success': False, 'message': 'Invalid coupon code'}
+        if coupon['is_used']:
+            return 400, {'success': False, 'message': 'Coupon has already been used'}
+        if is_expired(coupon):
+            return 400, {'success': False, 'message': 'Coupon has expired'}
+        if not coupon['assigned_to_email']:
+            # Conditional on still being unassigned, so a concurrent claim loses here
+            if not await async_supabase_service.assign_coupon(coupon_code, email):
+                return 409, {'success': False, 'message': 'Coupon already claimed'}
+
+    user_coupons = await async_supabase_service.get_coupons_by_email(email)
+    return 200, {
+        'success': True,
+        'message': f'Found {len(user_coupons)} coupons for {email}',
+        'coupons': user_coupons
+    }
+
+
+@route('POST', '/api/coupons/<coupon_id>/use')
+async def use_coupon(request: Dict[str, Any], coupon_id: str) -> Response:
+    """Redeem a coupon"""
+    result = await async_supabase_service.redeem_coupon(coupon_id)
+    outcome = result['outcome']
+
+    if outcome == NOT_FOUND:
+        return 404, {'success': False, 'message': 'Coupon not found'}
+    if outcome == ALREADY_USED:
+        return 400, {'success': False, 'message': 'Coupon already used'}
+    if outcome == EXPIRED:
+        return 400, {'success': False, 'message': 'Coupon has expired'}
+    if outcome == 'error':
+        return 500, {'success': False, 'error': result.get('error')}
+
+    return 200, {'success': True, 'message': 'Coupon marked as used', 'coupon': result['coupon']}
+
+
+@route('GET', '/api/coupons/<coupon_id>')
+async def get_coupon(request: Dict[str, Any], coupon_id: str) -> Response:
+    """Get a single coupon"""
+    coupon = await async_supabase_service.get_coupon_by_id(coupon_id)
+    if not coupon:
+        return 404, {'error': 'Coupon not found'}
+    return 200, coupon
+
+
+@route('GET', '/api/user/<email>/coupons')
+async def get_user_coupons(request: Dict[str, Any], email: str) -> Response:
+    """One page of an email's coupons as a bare list, next page in the Link header, as the Flask route"""
+    try:
+        limit = parse_limit(request['args'].get('limit'), Config.COUPONS_PER_PAGE, Config.MAX_COUPONS_PER_PAGE)
+        columns = parse_fields(request['args'].get('fields'))
+        coupons, next_cursor = await async_supabase_service.get_coupons_page(
+            limit, request['args'].get('cursor'), email, columns)
+    except ValueError as e:
+        return 400, {'error': str(e)}
+    link = next_link(request['path'], request['args'], next_cursor)
+    return 200, coupons, {'Link': link} if link else {}
+
+
+@route('GET', '/api/user/<email>')
+async def get_user_overview(request: Dict[str, Any], email: str) -> Response:
+    """An email's coupons and referrals in one response"""
+    return 200, await async_supabase_service.get_user_overview(email)
+
+
+@route('GET', '/api/pool/stats')
+async def connection_pool_stats(request: Dict[str, Any]) -> Response:
+    return 200, {'success': True, 'data': pool_stats()}
+
+
+@route('GET', '/api/analytics')
+async def get_analytics(request: Dict[str, Any]) -> Response:
+    return 200, await async_supabase_service.get_coupon_analytics()
+
+
+async def _read_body(receive) -> bytes:
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def _send_json(send, status: int, payload: Any, headers: Optional[Dict[str, str]] = None) -> None:
+    body = json.dumps(payload, default=str).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'),
+                    (b'content-length', str(len(body)).encode())]
+                   + [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def _match(method: str, path: str) -> Tuple[Optional[Handler], Dict[str, str], bool]:
+    path_exists = False
+    for route_method, regex, handler in ROUTES:
+        match = regex.match(path)
+        if match:
+            path_exists = True
+            if route_method == method:
+                return handler, {k: unquote(v) for k, v in match.groupdict().items()}, True
+    return None, {}, path_exists
+
+
+async def _lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            async_supabase_service.init(Config.SUPABASE_URL, Config.SUPABASE_KEY,
+                                        cache_size=Config.COUPON_CACHE_SIZE,
+                                        cache_ttl=Config.COUPON_CACHE_TTL,
+                                        cache_negative_ttl=Config.COUPON_CACHE_NEGATIVE_TTL,
+                                        pool_settings=Config.supabase_settings())
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await async_supabase_service.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send) -> None:
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+
+    handler, params, path_exists = _match(scope['method'], scope['path'])
+    if not handler:
+        status = 405 if path_exists else 404
+        await _send_json(send, status, {'error': 'Method not allowed' if path_exists else 'Not found'})
+        return
+
+    body = await _read_body(receive)
+    try:
+        request = {
+            'path': scope['path'],
+            'args': {k: v[0] for k, v in parse_qs(scope.get('query_string', b'').decode()).items()},
+            'json': json.loads(body) if body else None
+        }
+    except ValueError:
+        await _send_json(send, 400, {'error': 'Invalid JSON body'})
+        return
+
+    try:
+        status, payload, *headers = await handler(request, **params)
+    except Exception as e:
+        logger.error(f"Error in {handler.__name__}: {str(e)}")
+        status, payload, headers = 500, {'success': False, 'error': str(e)}, []
+    await _send_json(send, status, payload, *headers)
@@ -0,0 +1,289 @@
+# async_supabase_service.py - asyncio variant of SupabaseService for the hot API paths
+#
+# Uses postgrest's AsyncPostgrestClient (installed with supabase) so one event
+# loop can keep many PostgREST round trips in flight instead of blocking a
+# worker on each. Independent calls are issued together with asyncio.gather;
+# multi-row writes go through a single RPC instead.
+# Served by asgi_app.py; the Flask app keeps using the sync SupabaseService.
+
+import asyncio
+import logging
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from postgrest import AsyncPostgrestClient
+
+from coupon_cache import CouponCache, MISS
+from coupon_codes import generate_codes
+from coupon_columns import COUPON_PROJECTION
+from coupon_stats import counts_from_stats, created_delta
+from db_functions import analytics_from_counts, rpc_row, REDEEMED, NOT_FOUND
+from pagination import keyset_page, split_page
+from short_links import is_short_url_conflict, new_short_id, retry_on_collision_async, short_url_for
+from supabase_pool import build_async_http_client, use_pooled_session
+from referral_bundles import build_referral_bundle, is_unique_violation
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSupabaseService:
+    """Async counterpart of SupabaseService; method names and return shapes match"""
+
+    def __init__(self):
+        self.client: Optional[AsyncPostgrestClient] = None
+        self.cache = CouponCache()
+
+    def init(self, supabase_url: str, supabase_key: str, timeout: float = 10,
+             cache_size: int = 10000, cache_ttl: float = 30, cache_negative_ttl: float = 5,
+             pool_settings: Optional[Dict[str, Any]] = None) -> None:
+        """Create the PostgREST client; call once per process before serving
+        
+        pool_settings (Config.supabase_settings()) swaps in a pooled keep-alive session.
+        """
+        base_url = f"{supabase_url}/rest/v1"
+        headers = {'apikey': supabase_key, 'Authorization': f'Bearer {supabase_key}'}
+        self.client = AsyncPostgrestClient(base_url, headers=headers, timeout=timeout)
+        if pool_settings:
+            use_pooled_session(self.client, build_async_http_client(
+                pool_settings, base_url, dict(self.client.session.headers)))
+        self.cache.configure(cache_size, cache_ttl, cache_negative_ttl)
+
+    async def close(self) -> None:
+        if self.client:
+            await self.client.aclose()
+
+    def generate_coupon_code(self, length: int = 8) -> str:
+        """Generate a random coupon code"""
+        return generate_codes(1, length)[0]
+
+    # Coupon lookups
+    async def get_coupon_by_code(self, code: str) -> Optional[Dict[str, Any]]:
+        """Get a coupon by its code, served from the lookup cache when possible"""
+        code = code.upper()
+        cached = self.cache.get_by_code(code)
+        if cached is not MISS:
+            return cached
+        try:
+            response = await self.client.from_('coupons').select(COUPON_PROJECTION).eq('code', code).execute()
+            if not response.data:
+                self.cache.put_missing(code)
+                return None
+            self.cache.put(response.data[0])
+            return response.data[0]
+        except Exception as e:
+            logger.error(f"Error fetching coupon by code {code}: {str(e)}")
+            return None
+
+    async def get_coupon_by_id(self, coupon_id: str) -> Optional[Dict[str, Any]]:
+        """Get a coupon by its ID, served from the lookup cache when possible"""
+        cached = self.cache.get_by_id(coupon_id)
+        if cached is not MISS:
+            return cached
+        try:
+            response = await self.client.from_('coupons').select(COUPON_PROJECTION).eq('id', coupon_id).execute()
+            if not response.data:
+                return None
+            self.cache.put(response.data[0])
+            return response.data[0]
+        except Exception as e:
+            logger.error(f"Error fetching coupon by ID {coupon_id}: {str(e)}")
+            return None
+
+    async def get_coupons_by_email(self, email: str) -> List[Dict[str, Any]]:
+        """Get coupons assigned to a specific email"""
+        try:
+            response = await (self.client.from_('coupons')
+                              .select(COUPON_PROJECTION)
+                              .eq('assigned_to_email', email.lower())
+                              .execute())
+            return response.data if response.data else []
+        except Exception as e:
+            logger.error(f"Error fetching coupons for email {email}: {str(e)}")
+            return []
+
+    async def get_coupons_page(self, limit: int, cursor: Optional[str] = None, email: Optional[str] = None,
+                               columns: str = COUPON_PROJECTION) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Get one keyset page of coupons, newest first; raises ValueError for a bad cursor"""
+        query = self.client.from_('coupons').select(columns)
+        if email:
+            query = query.eq('assigned_to_email', email.lower())
+        query = keyset_page(query, cursor, limit)
+        try:
+            response = await query.execute()
+            return split_page(response.data or [], limit)
+        except Exception as e:
+            logger.error(f"Error fetching coupon page: {str(e)}")
+            return [], None
+
+    async def get_user_overview(self, email: str) -> Dict[str, Any]:
+        """Coupons and referrals for one email, fetched concurrently"""
+        coupons, sent, received = await asyncio.gather(
+            self.get_coupons_by_email(email),
+            self.get_referrals_by_email(email, as_referrer=True),
+            self.get_referrals_by_email(email, as_referrer=False)
+        )
+        return {'coupons': coupons, 'referrals_sent': sent, 'referrals_received': received}
+
+    # Coupon writes
+    async def create_coupon(self, coupon_data: Dict[str, Any], short_link: bool = False) -> Optional[Dict[str, Any]]:
+        """Create a new coupon, optionally allocating a unique short_url"""
+        try:
+            coupon_data.update({
+                'id': str(uuid.uuid4()),
+                'created_at': datetime.utcnow().isoformat(),
+                'updated_at': datetime.utcnow().isoformat()
+            })
+            if 'code' in coupon_data:
+                coupon_data['code'] = coupon_data['code'].upper()
+
+            response = await self._insert_coupon(coupon_data, short_link)
+            self.cache.invalidate(code=coupon_data.get('code'))
+            await self._apply_stats(created_delta(response.data or []))
+            return response.data[0] if response.data else None
+        except Exception as e:
+            logger.error(f"Error creating coupon: {str(e)}")
+            return None
+
+    async def _insert_coupon(self, coupon_data: Dict[str, Any], short_link: bool):
+        if not short_link:
+            return await self.client.from_('coupons').insert(coupon_data).execute()
+
+        async def attempt():
+            coupon_data['short_url'] = short_url_for(new_short_id())
+            return await self.client.from_('coupons').insert(coupon_data).execute()
+        return await retry_on_collision_async(attempt, is_short_url_conflict, 'Short URL')
+
+    async def _rpc(self, name: str, params: Dict[str, Any]):
+        """Execute an RPC; AsyncPostgrestClient.rpc is itself a coroutine in postgrest 0.10"""
+        builder = await self.client.rpc(name, params)
+        return await builder.execute()
+
+    async def assign_coupon(self, coupon_code: str, email: str) -> bool:
+        """Assign an unassigned coupon to email; returns False if it was already taken"""
+        try:
+            response = await (self.client.from_('coupons')
+                              .update({
+                                  'assigned_to_email': email.lower(),
+                                  'is_assigned': True,
+                                  'updated_at': datetime.utcnow().isoformat()
+                              })
+                              .eq('code', coupon_code.upper())
+                              .is_('assigned_to_email', 'null')
+                              .execute())
+            self.cache.invalidate(code=coupon_code.upper())
+            return bool(response.data)
+        except Exception as e:
+            logger.error(f"Error assigning coupon {coupon_code}: {str(e)}")
+            return False
+
+    async def redeem_coupon(self, coupon_id: str) -> Dict[str, Any]:
+        """Atomically redeem a coupon in one round trip (see SupabaseService.redeem_coupon)"""
+        try:
+            response = await self._rpc('redeem_coupon', {'p_coupon_id': coupon_id})
+            result = rpc_row(response.data) or {'outcome': NOT_FOUND, 'coupon': None}
+        except Exception as e:
+            if getattr(e, 'code', None) == '22P02':  # not a valid uuid
+                return {'outcome': NOT_FOUND, 'coupon': None}
+            logger.error(f"Error redeeming coupon {coupon_id}: {str(e)}")
+            return {'outcome': 'error', 'coupon': None, 'error': str(e)}
+
+        if result['outcome'] == REDEEMED:
+            self.cache.invalidate(coupon_id=coupon_id, code=result['coupon']['code'])
+        return result
+
+    async def update_coupon_usage_tracking(self, coupon_code: str, order_data: Dict[str, Any]) -> bool:
+        """Atomically bump usage tracking for a coupon and append the order event"""
+        try:
+            response = await self._rpc('track_coupon_usage', {
+                'p_coupon_code': coupon_code.upper(),
+                'p_discount': float(order_data.get('discount_amount', 0)),
+                'p_order': order_data
+            })
+            return bool(response.data)
+        except Exception as e:
+            logger.error(f"Error updating coupon usage tracking for {coupon_code}: {str(e)}")
+            return False
+
+    # Referrals
+    async def create_referral(self, referral_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Create a new referral"""
+        try:
+            referral_data.update({
+                'id': str(uuid.uuid4()),
+                'created_at': datetime.utcnow().isoformat(),
+                'updated_at': datetime.utcnow().isoformat()
+            })
+            response = await self.client.from_('referrals').insert(referral_data).execute()
+            return response.data[0] if response.data else None
+        except Exception as e:
+            logger.error(f"Error creating referral: {str(e)}")
+            return None
+
+    async def get_referrals_by_email(self, email: str, as_referrer: bool = True) -> List[Dict[str, Any]]:
+        """Get referrals by email (as referrer or referee)"""
+        try:
+            field = 'referrer_email' if as_referrer else 'referee_email'
+            response = await self.client.from_('referrals').select('*').eq(field, email.lower()).execute()
+            return response.data if response.data else []
+        except Exception as e:
+            logger.error(f"Error fetching referrals for {email}: {str(e)}")
+            return []
+
+    async def create_referral_coupon(self, referrer_email: str, referee_email: str,
+                                     discount_value: float, discount_type: str = 'fixed_amount',
+                                     referrer_gets_reward: bool = False,
+                                     referrer_reward_value: float = None) -> Dict[str, Any]:
+        """Create the referee coupon, optional referrer reward and referral in one transaction"""
+        try:
+            async def attempt():
+                bundle = build_referral_bundle(referrer_email, referee_email, discount_value, discount_type,
+                                               referrer_gets_reward, referrer_reward_value)
+                return rpc_row((await self._rpc('create_referral_bundle', {'p_bundle': bundle})).data)
+            result = await retry_on_collision_async(attempt, is_unique_violation, 'Referral bundle')
+            for coupon in (result['referee_coupon'], result['referrer_coupon']):
+                if coupon:
+                    self.cache.invalidate(code=coupon['code'])
+
+            return {
+                'success': True,
+                'referee_coupon': result['referee_coupon'],
+                'referrer_coupon': result['referrer_coupon'],
+                'message': 'Referral coupons created successfully'
+            }
+        except Exception as e:
+            logger.error(f"Error creating referral coupon: {str(e)}")
+            return {
+                'success': False,
+                'error': str(e),
+                'message': 'Failed to create referral coupon'
+            }
+
+    # Analytics
+    async def get_coupon_analytics(self) -> Dict[str, Any]:
+        """Get coupon analytics from the incrementally maintained coupon_stats row"""
+        try:
+            response = await self.client.from_('coupon_stats').select('*').eq('id', 1).execute()
+            return analytics_from_counts(counts_from_stats(response.data[0] if response.data else None))
+        except Exception as e:
+            logger.error(f"Error fetching coupon analytics: {str(e)}")
+            return analytics_from_counts(None)
+
+    async def _apply_stats(self, delta: Dict[str, Any]) -> bool:
+        """Async CouponStats.apply"""
+        delta = {key: value for key, value in delta.items() if value}
+        if not delta:
+            return True
+        try:
+            response = await self._rpc('apply_coupon_stats_delta', {'delta': delta})
+            if rpc_row(response.data) is None:
+                logger.error(f"Coupon stats delta {delta} not applied: the coupon_stats row is missing")
+                return False
+            return True
+        except Exception as e:
+            logger.error(f"Error applying coupon stats delta {delta}: {str(e)}")
+            return False
+
+
+# Global instance
+async_supabase_service = AsyncSupabaseService()
@@ -0,0 +1,50 @@
+# batching.py - Helpers for running set-based statements in bounded chunks
+#
+# PostgREST filters travel in the query string, so `in.(...)` lists must stay
+# short enough for proxies; chunking also keeps each statement's lock time small.
+
+import logging
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Set
+
+logger = logging.getLogger(__name__)
+
+
+def chunked(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Yield lists of at most size items"""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def unique_ids(ids: Iterable[Any]) -> List[str]:
+    """De-duplicate ids as strings, keeping their order"""
+    return list(dict.fromkeys(str(i) for i in ids if i))
+
+
+def run_in_chunks(ids: Iterable[Any], chunk_size: int,
+                  run_chunk: Callable[[List[str]], Set[str]]) -> Dict[str, Any]:
+    """Apply run_chunk to each chunk of ids and collect per-chunk results
+
+    run_chunk returns the ids it handled successfully; any other id in the chunk
+    is reported in failed_ids. An exception fails the whole chunk without
+    stopping the remaining ones.
+    """
+    summary = {'processed_count': 0, 'chunks': [], 'failed_ids': []}
+    for chunk in chunked(unique_ids(ids), chunk_size):
+        entry = {'requested': len(chunk), 'processed': 0}
+        try:
+            done = run_chunk(chunk)
+        except Exception as e:
+            logger.error(f"Bulk chunk of {len(chunk)} ids failed: {str(e)}")
+            done = set()
+            entry['error'] = str(e)
+        entry['processed'] = len(done)
+        summary['processed_count'] += len(done)
+        summary['failed_ids'].extend(i for i in chunk if i not in done)
+        summary['chunks'].append(entry)
+    return summary
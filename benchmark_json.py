@@ -0,0 +1,106 @@
+# benchmark_json.py - Serialization time and bytes on the wire for coupon lists
+#
+# Builds /api/coupons-shaped payloads of 1k, 10k and 100k coupon rows and
+# times Flask's stock encoder (json.dumps, sorted keys, ASCII escapes) against
+# fast_json.dumps_bytes (orjson when installed, else compact stdlib), then
+# compresses the body the way compression.init_compression would.
+#     python benchmark_json.py [--sizes 1000,10000,100000] [--repeat 5]
+# Install orjson and Brotli (requirements.txt) to see the optional backends;
+# without them the script still runs and reports the stdlib / gzip numbers.
+
+import argparse
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List
+
+from compression import BROTLI_AVAILABLE, compress
+from config_py import Config
+from coupon_codes import generate_codes
+from fast_json import ORJSON_AVAILABLE, dumps_bytes
+
+
+def coupon_rows(size: int, rng: random.Random) -> List[Dict[str, Any]]:
+    """Rows as PostgREST returns them for select('*') on coupons"""
+    now = datetime.now(timezone.utc)
+    rows = []
+    for index, code in enumerate(generate_codes(size)):
+        created = now - timedelta(seconds=size - index)
+        is_used = rng.random() < 0.3
+        email = None if rng.random() < 0.4 else f'user{index % 5000}@example.com'
+        rows.append({
+            'id': str(uuid.uuid4()),
+            'code': code,
+            'name': 'Spring promotion',
+            'description': '10% off your next order',
+            'discount_type': rng.choice(('percentage', 'fixed_amount')),
+            'discount_value': rng.choice((5, 10, 15, 20, 25.5)),
+            'minimum_spend': None,
+            'expiry_date': (now + timedelta(days=rng.randint(-30, 90))).isoformat(),
+            'is_used': is_used,
+            'used_at': created.isoformat() if is_used else None,
+            'qr_code_data': None,
+            'short_url': f'https://cpn.example.com/{code.lower()}',
+            'assigned_to_email': email,
+            'is_assigned': email is not None,
+            'created_at': created.isoformat(),
+            'updated_at': created.isoformat(),
+        })
+    return rows
+
+
+def flask_default_dumps(payload: Any) -> bytes:
+    """What DefaultJSONProvider.response() does outside debug mode"""
+    return json.dumps(payload, sort_keys=True, separators=(',', ':')).encode() + b'\n'
+
+
+def fast_dumps(payload: Any) -> bytes:
+    return dumps_bytes(payload, sort_keys=True) + b'\n'
+
+
+def best_of(repeat: int, work: Callable[[], Any]) -> float:
+    """Fastest of `repeat` runs in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        work()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark JSON encoding and compression of coupon lists')
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    encoders = [('flask default', flask_default_dumps),
+                ('orjson' if ORJSON_AVAILABLE else 'stdlib compact', fast_dumps)]
+    codings = ['gzip'] + (['br'] if BROTLI_AVAILABLE else [])
+    if not ORJSON_AVAILABLE:
+        print("orjson not installed: fast_json uses the stdlib encoder")
+    if not BROTLI_AVAILABLE:
+        print("Brotli not installed: only gzip is measured")
+
+    for size in (int(value) for value in args.sizes.split(',')):
+        payload = {'coupons': coupon_rows(size, random.Random(args.seed)), 'next_cursor': None}
+        print(f"\n{size} coupons")
+        body = b''
+        for label, encode in encoders:
+            body = encode(payload)
+            print(f"  {label:<15} encode {best_of(args.repeat, lambda: encode(payload)):9.2f} ms  "
+                  f"{len(body) / 1024:9.1f} KiB")
+        for coding in codings:
+            level = Config.COMPRESSION_BROTLI_QUALITY if coding == 'br' else Config.COMPRESSION_GZIP_LEVEL
+            compressed = compress(body, coding, Config.COMPRESSION_GZIP_LEVEL, Config.COMPRESSION_BROTLI_QUALITY)
+            elapsed = best_of(max(1, args.repeat // 2), lambda: compress(
+                body, coding, Config.COMPRESSION_GZIP_LEVEL, Config.COMPRESSION_BROTLI_QUALITY))
+            print(f"  {coding + ' level ' + str(level):<15} compress {elapsed:7.2f} ms  "
+                  f"{len(compressed) / 1024:9.1f} KiB  ({len(compressed) / len(body):.1%} of raw)")
+
+
+if __name__ == '__main__':
+    main()
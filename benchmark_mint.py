@@ -0,0 +1,73 @@
+# benchmark_mint.py - Batch minting against one insert per coupon
+#
+# Mints campaign coupons into FakeSupabaseClient two ways: coupon_codes.mint_coupons
+# (one code prefetch and one multi-row insert per chunk) and the per-row path
+# /admin/create-coupon takes (an existence check and an insert per coupon).
+# --latency-ms models the database round trip, which is what dominates once
+# there are thousands of rows. The per-row path is capped at --per-row-max
+# coupons and reported per 1k so large sizes stay quick to run.
+#     python benchmark_mint.py [--sizes 1000,10000,100000] [--latency-ms 2] [--chunk-size 500]
+
+import argparse
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict
+
+from coupon_codes import generate_codes, mint_coupons
+from fake_supabase import FakeSupabaseClient
+
+TEMPLATE: Dict[str, Any] = {
+    'name': 'Benchmark campaign',
+    'discount_type': 'fixed_amount',
+    'discount_value': 10,
+    'expiry_date': (datetime.utcnow() + timedelta(days=30)).isoformat(),
+    'is_assigned': False
+}
+
+
+def per_row_mint(client, count: int) -> None:
+    """One existence check and one insert per coupon, as the admin form does"""
+    for code in generate_codes(count):
+        if client.table('coupons').select('id').eq('code', code).execute().data:
+            continue
+        now = datetime.utcnow().isoformat()
+        client.table('coupons').insert({**TEMPLATE, 'code': code, 'is_used': False,
+                                        'created_at': now, 'updated_at': now}).execute()
+
+
+def run(size: int, latency: float, chunk_size: int, per_row_max: int) -> None:
+    client = FakeSupabaseClient(latency)
+    started = time.perf_counter()
+    summary = mint_coupons(client, TEMPLATE, size, chunk_size)
+    chunked_seconds = time.perf_counter() - started
+    chunked_calls = client.total_calls
+    assert summary['created_count'] == size, summary
+
+    sample = min(size, per_row_max)
+    client = FakeSupabaseClient(latency)
+    started = time.perf_counter()
+    per_row_mint(client, sample)
+    per_row_seconds = (time.perf_counter() - started) * size / sample
+    per_row_calls = client.total_calls * size // sample
+
+    note = '' if sample == size else f'  (per-row extrapolated from {sample:,})'
+    print(f"{size:>9,}  chunked: {chunked_seconds:8.3f}s {chunked_calls:>8,} calls  "
+          f"per-row: {per_row_seconds:8.3f}s {per_row_calls:>9,} calls  "
+          f"({per_row_seconds / chunked_seconds:6.1f}x){note}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare chunked minting with per-row inserts')
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--latency-ms', type=float, default=2, help='delay added to every backend call')
+    parser.add_argument('--chunk-size', type=int, default=500)
+    parser.add_argument('--per-row-max', type=int, default=2000, help='largest per-row run before extrapolating')
+    args = parser.parse_args()
+
+    print(f"latency {args.latency_ms} ms per call, chunk size {args.chunk_size}")
+    for size in [int(value) for value in args.sizes.split(',') if value.strip()]:
+        run(size, args.latency_ms / 1000, args.chunk_size, args.per_row_max)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+# benchmark_routes.py - End-to-end latency and backend call counts per route
+#
+# Drives app.py through the Flask test client with the Supabase client swapped
+# for FakeSupabaseClient, seeded at realistic table sizes. For every route it
+# reports p50/p95/p99 latency and how many backend calls one request makes, so
+# an N+1 query or a lost index shows up as a number, not a hunch.
+#     python benchmark_routes.py [--sizes 10000,100000,1000000] [--requests 200] [--latency-ms 2]
+#     python benchmark_routes.py --json results.json
+#     python benchmark_routes.py --baseline results.json --tolerance 0.25   # exit 1 on regression
+# With --latency-ms 0 the timings are the app's own CPU cost; the analytics
+# route runs coupon_analytics(), which scans the table in the fake just as the
+# aggregate does in Postgres, so it is sampled fewer times.
+
+import argparse
+import json
+import logging
+import random
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config_py import Config
+from coupon_changes import NIL_ID, encode_watermark
+from coupon_codes import generate_codes
+from fake_supabase import FakeSupabaseClient
+from request_loader import RequestScopedClient
+from short_links import ShortLinkResolver
+
+Request = Tuple[str, str, Optional[Dict[str, Any]]]
+
+USED_SHARE = 0.3
+EXPIRED_SHARE = 0.1
+UNASSIGNED_SHARE = 0.2
+REFERRAL_SHARE = 0.1
+COUPONS_PER_EMAIL = 10
+BULK_SIZE = 100
+REFERRAL_BATCH_SIZE = 100
+
+
+class Dataset:
+    """Seeded rows plus pools of ids and codes the scenarios draw from"""
+
+    def __init__(self, client: FakeSupabaseClient, size: int, rng: random.Random):
+        now = datetime.now(timezone.utc)
+        future = (now + timedelta(days=90)).isoformat()
+        past = (now - timedelta(days=1)).isoformat()
+        emails = max(size // COUPONS_PER_EMAIL, 1)
+
+        coupons, referrals = [], []
+        self.unused_ids: List[str] = []
+        self.claimable_codes: List[str] = []
+        self.emails = [f'user{index}@example.com' for index in range(emails)]
+        for index, code in enumerate(generate_codes(size)):
+            roll = rng.random()
+            is_used = roll < USED_SHARE
+            expired = USED_SHARE <= roll < USED_SHARE + EXPIRED_SHARE
+            email = None if rng.random() < UNASSIGNED_SHARE else self.emails[index % emails]
+            coupon = {
+                'id': str(uuid.uuid4()),
+                'code': code,
+                'name': 'Benchmark coupon',
+                'discount_type': 'fixed_amount',
+                'discount_value': 10,
+                'expiry_date': past if expired else future,
+                'is_used': is_used,
+                'is_assigned': email is not None,
+                'assigned_to_email': email,
+                'created_at': (now - timedelta(seconds=size - index)).isoformat()
+            }
+            coupons.append(coupon)
+            if not is_used and not expired:
+                self.unused_ids.append(coupon['id'])
+                self.claimable_codes.append(code)
+            if rng.random() < REFERRAL_SHARE:
+                referrals.append({
+                    'referrer_email': f'referrer{index % emails}@example.com',
+                    'referee_email': email or 'unassigned@example.com',
+                    'coupon_id': coupon['id'],
+                    'discount_applied': 10,
+                    'discount_type': 'fixed_amount',
+                    'referrer_gets_reward': False
+                })
+        client.seed('coupons', coupons)
+        client.seed('referrals', referrals)
+        rng.shuffle(self.unused_ids)
+        self.all_ids = [coupon['id'] for coupon in coupons]
+
+    def take_unused(self, count: int = 1) -> List[str]:
+        if len(self.unused_ids) < count:
+            raise ValueError('Dataset too small for this many requests; raise --sizes or lower --requests')
+        taken, self.unused_ids = self.unused_ids[-count:], self.unused_ids[:-count]
+        return taken
+
+
+def _expiry() -> str:
+    return (datetime.utcnow() + timedelta(days=30)).isoformat()
+
+
+def _recent_watermark() -> str:
+    """A delta sync client that last synced a minute ago"""
+    position = ((datetime.now(timezone.utc) - timedelta(minutes=1)).isoformat(), NIL_ID)
+    return encode_watermark(position, position)
+
+
+def _referral(rng: random.Random) -> Dict[str, Any]:
+    return {'referrer_email': f'referrer{rng.randrange(10 ** 6)}@example.com',
+            'referee_email': f'friend{rng.randrange(10 ** 6)}@example.com',
+            'discount_value': 10, 'discount_type': 'fixed_amount',
+            'referrer_gets_reward': True, 'referrer_reward_value': 5}
+
+
+# name -> (builds one request, maximum samples or None for --requests)
+SCENARIOS: Dict[str, Tuple[Callable[[Dataset, random.Random], Request], Optional[int]]] = {
+    'claim': (lambda data, rng: ('POST', '/api/coupons/claim', {
+        'email': rng.choice(data.emails), 'coupon_code': rng.choice(data.claimable_codes)}), None),
+    'use': (lambda data, rng: ('POST', f'/api/coupons/{data.take_unused()[0]}/use', None), None),
+    'lookup': (lambda data, rng: ('GET', f'/api/coupons/{rng.choice(data.all_ids)}', None), None),
+    'list_by_email': (lambda data, rng: ('GET', f'/api/coupons?email={rng.choice(data.emails)}&limit=20',
+                                         None), None),
+    'gift': (lambda data, rng: ('POST', '/api/coupons/gift', {
+        'recipient_email': rng.choice(data.emails), 'sender_email': 'sender@example.com',
+        'name': 'Gift', 'discount_type': 'fixed_amount', 'discount_value': 25,
+        'expiry_date': _expiry()}), None),
+    'referral': (lambda data, rng: ('POST', '/api/coupons/referral', _referral(rng)), None),
+    'referral_batch': (lambda data, rng: ('POST', '/api/coupons/referral/batch', {
+        'referrals': [_referral(rng) for _ in range(REFERRAL_BATCH_SIZE)]}), 50),
+    'bulk_update_status': (lambda data, rng: ('POST', '/admin/bulk-update-status', {
+        'coupon_ids': rng.sample(data.all_ids, BULK_SIZE), 'status': 'inactive'}), None),
+    'bulk_delete': (lambda data, rng: ('POST', '/admin/bulk-delete', {
+        'coupon_ids': data.take_unused(BULK_SIZE)}), 50),
+    'analytics': (lambda data, rng: ('GET', '/api/analytics', None), 20),
+    'changes': (lambda data, rng: ('GET', f'/api/coupons/changes?since={_recent_watermark()}&limit=100',
+                                   None), 20),
+}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))]
+
+
+def _succeeded(response) -> bool:
+    if response.status_code >= 300:
+        return False
+    body = response.get_json(silent=True)
+    return not (isinstance(body, dict) and body.get('success') is False)
+
+
+def run_size(app_module, size: int, requests: int, latency: float, seed: int) -> Dict[str, Dict[str, Any]]:
+    """Seed a fresh fake at this size and run every scenario against it"""
+    rng = random.Random(seed)
+    client = FakeSupabaseClient()
+    started = time.perf_counter()
+    data = Dataset(client, size, rng)
+    print(f"\n{size:,} coupons (seeded in {time.perf_counter() - started:.1f}s)")
+
+    # Wrapped the way Config.supabase_client() wraps the real client
+    app_module.supabase = app_module.coupon_manager.supabase = RequestScopedClient(client)
+    app_module.coupon_manager.cache.clear()
+    app_module.coupon_manager.short_links = ShortLinkResolver(Config.SHORT_LINK_CACHE_SIZE)
+    test_client = app_module.app.test_client()
+    client.latency = latency
+
+    results = {}
+    print(f"{'route':<20} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'calls/req':>10} {'failed':>7}")
+    for name, (build, cap) in SCENARIOS.items():
+        timings, calls, failed = [], Counter(), 0
+        per_request = []
+        for _ in range(min(requests, cap or requests)):
+            method, path, body = build(data, rng)
+            client.reset_calls()
+            begin = time.perf_counter()
+            response = test_client.open(path, method=method, json=body)
+            timings.append((time.perf_counter() - begin) * 1000)
+            per_request.append(client.total_calls)
+            calls.update(client.calls)
+            failed += not _succeeded(response)
+        timings.sort()
+        results[name] = {
+            'p50': percentile(timings, 50),
+            'p95': percentile(timings, 95),
+            'p99': percentile(timings, 99),
+            'calls_per_request': sum(per_request) / len(per_request),
+            'max_calls': max(per_request),
+            'calls': {call: count / len(per_request) for call, count in calls.most_common()},
+            'failed': failed,
+            'samples': len(timings)
+        }
+        row = results[name]
+        print(f"{name:<20} {row['p50']:9.3f} {row['p95']:9.3f} {row['p99']:9.3f} "
+              f"{row['calls_per_request']:10.2f} {failed:7d}")
+    return results
+
+
+def find_regressions(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+                     tolerance: float) -> List[str]:
+    """p95 slower than baseline by more than tolerance, or more backend calls per request"""
+    regressions = []
+    for size, routes in results.items():
+        for name, row in routes.items():
+            before = baseline.get(size, {}).get(name)
+            if not before:
+                continue
+            if row['p95'] > before['p95'] * (1 + tolerance):
+                regressions.append(f"{size} {name}: p95 {before['p95']:.3f} -> {row['p95']:.3f} ms")
+            if row['calls_per_request'] > before['calls_per_request'] + 1e-9:
+                regressions.append(f"{size} {name}: calls/request "
+                                   f"{before['calls_per_request']:.2f} -> {row['calls_per_request']:.2f}")
+            if row['failed'] > before['failed']:
+                regressions.append(f"{size} {name}: failed requests {before['failed']} -> {row['failed']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Flask routes against an in-memory Supabase')
+    parser.add_argument('--sizes', default='10000,100000', help='comma-separated coupon counts, e.g. 10000,100000,1000000')
+    parser.add_argument('--requests', type=int, default=200, help='samples per route and size')
+    parser.add_argument('--latency-ms', type=float, default=0, help='delay added to every backend call')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='results file from an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p95 slowdown against the baseline')
+    args = parser.parse_args()
+
+    logging.disable(logging.ERROR)
+    import app as app_module
+
+    results = {}
+    for size in [int(value) for value in args.sizes.split(',') if value.strip()]:
+        results[str(size)] = run_size(app_module, size, args.requests, args.latency_ms / 1000, args.seed)
+
+    if args.json:
+        with open(args.json, 'w') as handle:
+            json.dump(results, handle, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as handle:
+            regressions = find_regressions(results, json.load(handle), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
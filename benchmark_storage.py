@@ -0,0 +1,95 @@
+# benchmark_storage.py - Per-call latency of the two CouponStorage backends
+#
+# Seeds a database through SQLAlchemyStorage and runs the same lookup/redeem
+# mix against it and against SupabaseService. By default SupabaseService talks
+# to the local PostgREST stand-in from benchmark_async.py, so the comparison
+# isolates HTTP + JSON overhead; pass --supabase to use the configured project
+# (the seeded codes do not exist there, so lookups miss but still round-trip).
+#     python benchmark_storage.py [--database-url sqlite:///bench.db] [--coupons 10000] [--calls 2000]
+
+import argparse
+import statistics
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer
+
+from supabase import create_client
+
+from benchmark_async import STAND_IN_KEY, make_stand_in
+from config_py import Config
+from coupon_codes import generate_codes
+from sqlalchemy_storage import SQLAlchemyStorage
+from supabase_service import SupabaseService
+
+
+def seed(storage: SQLAlchemyStorage, count: int):
+    expiry = (datetime.now(timezone.utc) + timedelta(days=30)).isoformat()
+    coupons = []
+    for index, code in enumerate(generate_codes(count)):
+        coupon = storage.create_coupon({
+            'code': code,
+            'name': 'Benchmark coupon',
+            'discount_type': 'fixed_amount',
+            'discount_value': 10,
+            'expiry_date': expiry,
+            'is_used': False,
+            'is_assigned': True,
+            'assigned_to_email': f'user{index % 100}@example.com'
+        })
+        coupons.append(coupon)
+    return coupons
+
+
+def measure(label: str, storage, coupons, calls: int) -> None:
+    operations = (
+        ('get_coupon_by_code', lambda c: storage.get_coupon_by_code(c['code'])),
+        ('get_coupon_by_id', lambda c: storage.get_coupon_by_id(c['id'])),
+        ('get_coupons_by_email', lambda c: storage.get_coupons_by_email(c['assigned_to_email'])),
+        ('redeem_coupon', lambda c: storage.redeem_coupon(c['id'])),
+    )
+    for name, call in operations:
+        timings = []
+        for index in range(calls):
+            coupon = coupons[index % len(coupons)]
+            started = time.perf_counter()
+            call(coupon)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        print(f"{label:<11} {name:<22} p50 {statistics.median(timings):7.3f} ms  "
+              f"p95 {timings[int(len(timings) * 0.95)]:7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare SQLAlchemyStorage with SupabaseService')
+    parser.add_argument('--database-url', default='sqlite:///:memory:')
+    parser.add_argument('--coupons', type=int, default=10000)
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--latency-ms', type=float, default=0, help='stand-in delay on top of HTTP overhead')
+    parser.add_argument('--supabase', action='store_true', help='use the configured Supabase project')
+    args = parser.parse_args()
+
+    sql_storage = SQLAlchemyStorage(args.database_url)
+    sql_storage.create_schema()
+    coupons = seed(sql_storage, args.coupons)
+    measure('sqlalchemy', sql_storage, coupons, args.calls)
+    print(f"sqlalchemy  pool: {sql_storage.pool_status()}")
+
+    service = SupabaseService()
+    server = None
+    if args.supabase:
+        service.client = Config.supabase_client()
+    else:
+        server = ThreadingHTTPServer(('127.0.0.1', 0), make_stand_in(args.latency_ms / 1000))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        service.client = create_client(f"http://127.0.0.1:{server.server_address[1]}", STAND_IN_KEY)
+    service.cache.configure(0, 0, 0)
+    try:
+        measure('postgrest', service, coupons, args.calls)
+    finally:
+        if server:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
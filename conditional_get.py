@@ -0,0 +1,76 @@
+# conditional_get.py - ETag / Last-Modified revalidation for polled GET endpoints
+#
+# A route decorated with @conditional(version_source) first asks for the data
+# version (one RPC reading the newest write stamps, see coupon_changes.data_version)
+# and answers If-None-Match / If-Modified-Since with 304 before the view loads or
+# serializes anything. The ETag mixes the version with the request path and
+# query string, so every page and filter gets its own tag. Responses carry
+# Cache-Control: no-cache, so clients revalidate on every poll.
+# Results that also change with the clock (expiry in analytics) pass
+# window=seconds: the tag then rolls over at least that often. Versions built
+# from write timestamps pass at least Config.SYNC_SETTLE_SECONDS, so a write
+# that commits behind a newer stamp is served within that window.
+
+import hashlib
+import logging
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Callable, Optional
+
+from flask import make_response, request
+
+from coupon_stats import DataVersion
+
+logger = logging.getLogger(__name__)
+
+
+def _validators(version: DataVersion, window: float):
+    """(etag, last_modified) for this request"""
+    token = version.token
+    last_modified = version.last_modified
+    if window:
+        bucket = int(time.time() // window)
+        token = f'{token}:{bucket}'
+        bucket_start = datetime.fromtimestamp(bucket * window, timezone.utc)
+        last_modified = max(last_modified, bucket_start) if last_modified else bucket_start
+    etag = hashlib.sha1(f'{token}|{request.full_path}'.encode()).hexdigest()[:20]
+    return etag, last_modified.replace(microsecond=0) if last_modified else None
+
+
+def _not_modified(etag: str, last_modified: Optional[datetime]) -> bool:
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.2.2)
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def conditional(version_source: Callable[[], Optional[DataVersion]], window: float = 0):
+    """Serve 304 Not Modified when the data behind a GET route has not changed"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                version = version_source()
+            except Exception as e:
+                logger.error(f"Error reading data version for {request.path}: {str(e)}")
+                version = None
+            if version is None:
+                return view(*args, **kwargs)
+
+            etag, last_modified = _validators(version, window)
+            if _not_modified(etag, last_modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            if last_modified:
+                response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
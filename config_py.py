@@ -38,9 +38,72 @@ class Config:
     
     # Pagination
     COUPONS_PER_PAGE = 25
+    MAX_COUPONS_PER_PAGE = 100
     USERS_PER_PAGE = 20
     ACTIVITY_PER_PAGE = 50
     
+    # Bulk admin operations: ids per set-based statement
+    BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', 200))
+    
+    # CSV import: rows per prefetch + insert round trip
+    IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 500))
+    
+    # Streaming CSV reports: coupons fetched per page
+    REPORT_PAGE_SIZE = int(os.environ.get('REPORT_PAGE_SIZE', 1000))
+    
+    # Batch minting (/api/coupons/batch): minted inside the request, so capped to
+    # what finishes well inside a worker timeout (benchmark_mint.py: ~1s for 10k).
+    # Larger campaigns go through `flask mint-coupons`, which has no cap.
+    MINT_MAX_COUNT = int(os.environ.get('MINT_MAX_COUNT', 10000))
+    MINT_CHUNK_SIZE = int(os.environ.get('MINT_CHUNK_SIZE', 500))
+    
+    # Batch referral creation (/api/coupons/referral/batch): referrals per transaction
+    REFERRAL_BATCH_MAX_COUNT = int(os.environ.get('REFERRAL_BATCH_MAX_COUNT', 100000))
+    REFERRAL_BATCH_CHUNK_SIZE = int(os.environ.get('REFERRAL_BATCH_CHUNK_SIZE', 500))
+    
+    # Short link redirect map (/s/<short_id>)
+    SHORT_LINK_CACHE_SIZE = int(os.environ.get('SHORT_LINK_CACHE_SIZE', 200000))
+    
+    # Coupon lookup cache (per worker process)
+    COUPON_CACHE_SIZE = int(os.environ.get('COUPON_CACHE_SIZE', 10000))
+    COUPON_CACHE_TTL = float(os.environ.get('COUPON_CACHE_TTL', 30))
+    COUPON_CACHE_NEGATIVE_TTL = float(os.environ.get('COUPON_CACHE_NEGATIVE_TTL', 5))
+    
+    # Storage backend: 'supabase' (PostgREST over HTTP) or 'sqlalchemy' (direct connection)
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'supabase')
+    DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///coupons.db')
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    
+    # Supabase HTTP connection pool (one pooled client per worker process)
+    SUPABASE_POOL_MAX_CONNECTIONS = int(os.environ.get('SUPABASE_POOL_MAX_CONNECTIONS', 20))
+    SUPABASE_POOL_MAX_KEEPALIVE = int(os.environ.get('SUPABASE_POOL_MAX_KEEPALIVE', 10))
+    SUPABASE_KEEPALIVE_EXPIRY = float(os.environ.get('SUPABASE_KEEPALIVE_EXPIRY', 60))
+    SUPABASE_CONNECT_TIMEOUT = float(os.environ.get('SUPABASE_CONNECT_TIMEOUT', 5))
+    SUPABASE_READ_TIMEOUT = float(os.environ.get('SUPABASE_READ_TIMEOUT', 10))
+    SUPABASE_POOL_TIMEOUT = float(os.environ.get('SUPABASE_POOL_TIMEOUT', 5))
+    SUPABASE_HTTP2 = os.environ.get('SUPABASE_HTTP2', 'true').lower() == 'true'
+    
+    # Conditional GET: analytics ETags roll over at least this often (expiry is time-based)
+    ANALYTICS_ETAG_WINDOW = float(os.environ.get('ANALYTICS_ETAG_WINDOW', 60))
+    
+    # Delta sync: /api/coupons/changes holds back rows written in the last N seconds
+    # until slower transactions touching earlier timestamps have committed
+    SYNC_SETTLE_SECONDS = float(os.environ.get('SYNC_SETTLE_SECONDS', 5))
+    # Tombstones older than this are pruned (flask prune-coupon-tombstones); clients
+    # whose watermark predates the cutoff get a full resync
+    TOMBSTONE_RETENTION_DAYS = int(os.environ.get('TOMBSTONE_RETENTION_DAYS', 30))
+    
+    # Query tracer: X-Query-Trace header with duplicate/loop/over-fetch findings (development aid)
+    QUERY_TRACE = os.environ.get('QUERY_TRACE', 'false').lower() == 'true'
+    
+    # Response compression: gzip / brotli for bodies of at least this many bytes
+    COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+    COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 3))
+    COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 4))
+    
     # Logging configuration
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
     LOG_FILE = os.environ.get('LOG_FILE', 'coupon_tracker.log')
@@ -58,6 +121,30 @@ class Config:
     def init_app(app):
         """Initialize the Flask app with this configuration."""
         pass
+    
+    @classmethod
+    def supabase_settings(cls, overrides=None):
+        """Supabase credentials and pool settings, with overrides (e.g. app.config) applied."""
+        settings = {name: getattr(cls, name) for name in dir(cls) if name.startswith('SUPABASE_')}
+        for name, value in (overrides or {}).items():
+            if name.startswith('SUPABASE_'):
+                settings[name] = value
+        return settings
+    
+    @classmethod
+    def supabase_client(cls, overrides=None):
+        """The pooled Supabase client shared by this worker process, traced if QUERY_TRACE is on.
+        
+        Reads are deduplicated per request (request_loader); the tracer sits
+        underneath so it only sees calls that reach the backend.
+        """
+        from supabase_pool import shared_client
+        from request_loader import RequestScopedClient
+        client = shared_client(cls.supabase_settings(overrides))
+        if (overrides or {}).get('QUERY_TRACE', cls.QUERY_TRACE):
+            from query_tracer import TracedClient
+            client = TracedClient(client)
+        return RequestScopedClient(client)
 
 
 class DevelopmentConfig(Config):
@@ -76,6 +163,7 @@ class DevelopmentConfig(Config):
     
     # Logging
     LOG_LEVEL = 'DEBUG'
+    QUERY_TRACE = os.environ.get('QUERY_TRACE', 'true').lower() == 'true'
     
     @classmethod
     def init_app(cls, app):
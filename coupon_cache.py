@@ -0,0 +1,160 @@
+# coupon_cache.py - Bounded read-through cache for coupon lookups
+#
+# Coupons are stored once per id with a code -> id index, so a lookup by either
+# key hits the same entry and invalidating by one key drops both. Unknown codes
+# are remembered for a shorter TTL so a flood of bad codes does not reach the
+# database. Every write path must call invalidate(); TTL only bounds staleness
+# across worker processes.
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Returned by the getters when the cache has no answer either way
+MISS = object()
+
+
+class CouponCache:
+    """Thread-safe LRU cache of coupon rows keyed by id and by code"""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 30.0, negative_ttl: float = 5.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()  # id -> (expires_at, coupon)
+        self._ids_by_code: Dict[str, str] = {}
+        self._missing: 'OrderedDict[str, float]' = OrderedDict()  # code -> expires_at
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def configure(self, max_size: int, ttl: float, negative_ttl: float) -> None:
+        """Apply app configuration and start from an empty cache"""
+        with self._lock:
+            self.max_size = max_size
+            self.ttl = ttl
+            self.negative_ttl = negative_ttl
+            self._entries.clear()
+            self._ids_by_code.clear()
+            self._missing.clear()
+
+    def get_by_id(self, coupon_id: str) -> Any:
+        """Return a copy of the cached coupon, or MISS"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(coupon_id)
+            if entry is None:
+                self.misses += 1
+                return MISS
+            expires_at, coupon = entry
+            if expires_at <= now:
+                self._drop(coupon_id)
+                self.misses += 1
+                return MISS
+            self._entries.move_to_end(coupon_id)
+            self.hits += 1
+            return dict(coupon)
+
+    def get_by_code(self, code: str) -> Any:
+        """Return a copy of the cached coupon, None for a known-missing code, or MISS"""
+        now = time.monotonic()
+        with self._lock:
+            missing_until = self._missing.get(code)
+            if missing_until is not None:
+                if missing_until > now:
+                    self.negative_hits += 1
+                    return None
+                del self._missing[code]
+
+            coupon_id = self._ids_by_code.get(code)
+            entry = self._entries.get(coupon_id) if coupon_id else None
+            if entry is None:
+                self.misses += 1
+                return MISS
+            expires_at, coupon = entry
+            if expires_at <= now:
+                self._drop(coupon_id)
+                self.misses += 1
+                return MISS
+            self._entries.move_to_end(coupon_id)
+            self.hits += 1
+            return dict(coupon)
+
+    def put(self, coupon: Dict[str, Any]) -> None:
+        """Cache a coupon row under its id and code"""
+        coupon_id = coupon.get('id')
+        if not coupon_id or self.max_size <= 0:
+            return
+        coupon_id = str(coupon_id)
+        code = coupon.get('code')
+        with self._lock:
+            self._drop(coupon_id)
+            self._entries[coupon_id] = (time.monotonic() + self.ttl, dict(coupon))
+            if code:
+                self._ids_by_code[code] = coupon_id
+                self._missing.pop(code, None)
+            while len(self._entries) > self.max_size:
+                oldest_id, (_, oldest) = self._entries.popitem(last=False)
+                self._forget_code(oldest_id, oldest)
+                self.evictions += 1
+
+    def put_missing(self, code: str) -> None:
+        """Remember that no coupon has this code"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._missing[code] = time.monotonic() + self.negative_ttl
+            self._missing.move_to_end(code)
+            while len(self._missing) > self.max_size:
+                self._missing.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, coupon_id: Optional[str] = None, code: Optional[str] = None) -> None:
+        """Drop anything cached for this id and/or code"""
+        with self._lock:
+            self.invalidations += 1
+            if code:
+                self._missing.pop(code, None)
+                cached_id = self._ids_by_code.get(code)
+                if cached_id:
+                    self._drop(cached_id)
+            if coupon_id:
+                self._drop(str(coupon_id))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._ids_by_code.clear()
+            self._missing.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'negative_size': len(self._missing),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_rate': round((self.hits + self.negative_hits) / lookups * 100, 1) if lookups else 0
+            }
+
+    def _drop(self, coupon_id: str) -> None:
+        # Caller holds the lock
+        entry = self._entries.pop(coupon_id, None)
+        if entry is not None:
+            self._forget_code(coupon_id, entry[1])
+
+    def _forget_code(self, coupon_id: str, coupon: Dict[str, Any]) -> None:
+        # Caller holds the lock
+        code = coupon.get('code')
+        if code and self._ids_by_code.get(code) == coupon_id:
+            del self._ids_by_code[code]
@@ -0,0 +1,158 @@
+# coupon_changes.py - Delta sync: coupons changed since a client's watermark
+#
+# A sync returns the coupons whose updated_at is after the watermark (the
+# database stamps it on every write), tombstones for coupons deleted since,
+# and a new watermark to send next time. Both streams are read in
+# (timestamp, id) order through coupons_updated_at_id_idx and
+# coupon_tombstones_deleted_at_id_idx (db_functions.COUPON_CHANGES_SQL); when
+# either has more than `limit` rows has_more is set and the client repeats
+# the call with the new watermark straight away.
+# updated_at is the start time of the writing transaction, so a slow write can
+# commit with a timestamp older than rows already handed out. The watermark
+# therefore never moves past now - settle seconds: recent rows are returned
+# again on the next sync, and clients apply changes idempotently by id,
+# tombstones first. now is the database's clock, read through the
+# coupon_data_version() RPC, because that is the clock that wrote the stamps;
+# an app server running ahead of it would otherwise skip late commits.
+# An empty watermark starts a full sync: every coupon, and only tombstones
+# newer than the start of that sync. Positions from a watermark are checked to
+# be a timestamp and a uuid before they are spliced into an or_() filter.
+# Tombstones are kept for TOMBSTONE_RETENTION_DAYS (prune_tombstones, run by
+# `flask prune-coupon-tombstones`). A watermark older than the pruning cutoff
+# may have missed deletes, so it gets a full sync flagged resync: the client
+# drops its local copy before applying the result.
+# data_version() reads the newest stamp of each stream (plus referrals) for the
+# ETag on polled routes; it can miss the same late commits, so those routes
+# roll their tags over every settle seconds.
+
+import base64
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from coupon_columns import COUPON_PROJECTION
+from coupon_stats import DataVersion
+from coupon_validity import parse_timestamp
+from db_functions import rpc_row
+from pagination import check_position
+
+TOMBSTONE_COLUMNS = 'id,code,deleted_at'
+
+# Lowest possible id, so a position of (timestamp, NIL_ID) covers every row at that timestamp
+NIL_ID = '00000000-0000-0000-0000-000000000000'
+
+Position = Optional[Tuple[str, str]]
+
+# Keys of the coupon_data_version() result (db_functions.COUPON_VERSION_SQL)
+VERSION_STAMPS = ('coupons_at', 'deleted_at', 'referrals_at')
+
+
+def _version_row(client) -> Optional[Dict[str, Any]]:
+    return rpc_row(client.rpc('coupon_data_version', {}).execute().data)
+
+
+def data_version(client) -> Optional[DataVersion]:
+    """Newest coupon write, coupon delete and referral write, or None if the RPC returned nothing"""
+    stamps = _version_row(client)
+    if not stamps:
+        return None
+    token = '|'.join(str(stamps.get(key) or '') for key in VERSION_STAMPS + ('pruned_before',))
+    epochs = [epoch for epoch in (parse_timestamp(stamps.get(key)) for key in VERSION_STAMPS) if epoch is not None]
+    return DataVersion(token, datetime.fromtimestamp(max(epochs), timezone.utc) if epochs else None)
+
+
+def sync_clock(client) -> Tuple[float, Optional[float]]:
+    """(database now, tombstone pruning cutoff or None) as UTC epochs; raises if the database did not say"""
+    row = _version_row(client) or {}
+    now = parse_timestamp(row.get('now'))
+    if now is None:
+        raise RuntimeError('coupon_data_version() returned no database time')
+    return now, parse_timestamp(row.get('pruned_before'))
+
+
+def prune_tombstones(client, retention_days: int) -> Optional[Dict[str, Any]]:
+    """Drop tombstones older than retention_days; {'pruned_before', 'removed'}"""
+    return rpc_row(client.rpc('prune_coupon_tombstones', {'p_retention_days': retention_days}).execute().data)
+
+
+def encode_watermark(coupons: Position, tombstones: Position) -> str:
+    """Opaque watermark: the last (timestamp, id) handed out from each stream"""
+    raw = json.dumps({'c': coupons, 'd': tombstones}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_watermark(watermark: Optional[str]) -> Tuple[Position, Position]:
+    """Positions from encode_watermark; (None, None) for a full sync, ValueError if tampered with"""
+    if not watermark:
+        return None, None
+    try:
+        padded = watermark + '=' * (-len(watermark) % 4)
+        raw = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        positions = tuple(raw[key] for key in ('c', 'd'))
+    except Exception:
+        raise ValueError('Invalid watermark')
+    for position in positions:
+        if position is not None and not (isinstance(position, list) and len(position) == 2):
+            raise ValueError('Invalid watermark')
+    return tuple(check_position(*position, 'Invalid watermark') if position else None
+                 for position in positions)
+
+
+def after_position(query, column: str, position: Position, limit: int):
+    """Rows strictly after position in (column, id) order, oldest first, plus one to detect more"""
+    if position:
+        value, row_id = check_position(*position, 'Invalid watermark')
+        query = query.or_(f'{column}.gt."{value}",and({column}.eq."{value}",id.gt.{row_id})')
+    return query.order(column).order('id').limit(limit + 1)
+
+
+def _advance(rows: List[Dict[str, Any]], column: str, position: Position,
+             horizon: float) -> Position:
+    """Position after the last row old enough to be final"""
+    for row in reversed(rows):
+        stamp = parse_timestamp(row.get(column))
+        if stamp is not None and stamp <= horizon:
+            return row[column], str(row['id'])
+    return position
+
+
+def fetch_changes(client, watermark: Optional[str], limit: int, columns: str = COUPON_PROJECTION,
+                  settle: float = 5.0) -> Dict[str, Any]:
+    """{'upserted', 'deleted', 'watermark', 'has_more', 'resync'}; raises ValueError for a bad watermark"""
+    coupons_at, tombstones_at = decode_watermark(watermark)
+    now, pruned_before = sync_clock(client)
+    horizon = now - settle
+    resync = bool(watermark) and pruned_before is not None and (
+        tombstones_at is None or parse_timestamp(tombstones_at[0]) < pruned_before)
+    if resync:
+        # Deletes before the cutoff are gone, so start over from nothing
+        watermark, coupons_at, tombstones_at = None, None, None
+    if 'updated_at' not in columns.split(','):
+        columns = f'{columns},updated_at'
+
+    upserted = after_position(client.table('coupons').select(columns), 'updated_at',
+                              coupons_at, limit).execute().data or []
+    if watermark:
+        deleted = after_position(client.table('coupon_tombstones').select(TOMBSTONE_COLUMNS), 'deleted_at',
+                                 tombstones_at, limit).execute().data or []
+    else:
+        # A client starting from nothing has nothing to delete
+        deleted = []
+        tombstones_at = (datetime.fromtimestamp(horizon, timezone.utc).isoformat(), NIL_ID)
+
+    more_upserted, more_deleted = len(upserted) > limit, len(deleted) > limit
+    upserted, deleted = upserted[:limit], deleted[:limit]
+    coupons_at = _advance(upserted, 'updated_at', coupons_at, horizon)
+    tombstones_at = _advance(deleted, 'deleted_at', tombstones_at, horizon)
+    # Only ask for the next page right away when this whole page was final;
+    # otherwise the held-back rows would come straight back
+    has_more = ((more_upserted and coupons_at == (upserted[-1]['updated_at'], str(upserted[-1]['id'])))
+                or (more_deleted and tombstones_at == (deleted[-1]['deleted_at'], str(deleted[-1]['id']))))
+    return {
+        'upserted': upserted,
+        'deleted': deleted,
+        'watermark': encode_watermark(coupons_at, tombstones_at),
+        'has_more': has_more,
+        'resync': resync,
+    }
+
@@ -0,0 +1,112 @@
+# coupon_codes.py - Bulk coupon code generation and batch minting
+#
+# Codes are cut from one CSPRNG buffer per round instead of one secrets.choice()
+# call per character. Bytes are mapped onto the alphabet with bytes.translate,
+# dropping the values >= 252 that would bias a 36-character alphabet. Run this
+# module directly for a throughput comparison with the per-character path, and
+# benchmark_mint.py for chunked minting against one insert per coupon.
+
+import secrets
+import string
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+CODE_ALPHABET = string.ascii_uppercase + string.digits
+
+
+def _translation(alphabet: str):
+    size = len(alphabet)
+    limit = 256 - 256 % size
+    table = bytes(ord(alphabet[value % size]) if value < limit else 0 for value in range(256))
+    return table, bytes(range(limit, 256)), limit
+
+
+def generate_codes(count: int, length: int = 8, alphabet: str = CODE_ALPHABET,
+                   exclude: Optional[Set[str]] = None) -> List[str]:
+    """Return count distinct random codes, none of which are in exclude"""
+    table, rejected, limit = _translation(alphabet)
+    exclude = exclude or set()
+    seen = set()
+    codes: List[str] = []
+
+    while len(codes) < count:
+        missing = count - len(codes)
+        # Over-allocate for rejected bytes so one buffer is almost always enough
+        buffer = secrets.token_bytes(missing * length * 256 // limit + length * 4)
+        chars = buffer.translate(table, rejected).decode('ascii')
+        for start in range(0, len(chars) - length + 1, length):
+            code = chars[start:start + length]
+            if code in seen or code in exclude:
+                continue
+            seen.add(code)
+            codes.append(code)
+            if len(codes) == count:
+                break
+    return codes
+
+
+def mint_coupons(client, template: Dict[str, Any], count: int, chunk_size: int = 500,
+                 code_length: int = 8,
+                 on_inserted: Optional[Callable[[List[Dict[str, Any]]], None]] = None) -> Dict[str, Any]:
+    """Create count coupons from template with unique codes, inserting chunk by chunk
+
+    Each chunk costs one select to find codes that already exist (replaced before
+    insert) and one insert that does not echo the rows back. Codes are drawn per
+    chunk, so only one chunk of rows is held at a time however large count is.
+    """
+    used_codes: Set[str] = set()
+    summary = {'created_count': 0, 'chunks': [], 'failed_codes': []}
+
+    for start in range(0, count, chunk_size):
+        chunk = generate_codes(min(chunk_size, count - start), code_length, exclude=used_codes)
+        used_codes.update(chunk)
+        entry = {'requested': len(chunk), 'created': 0}
+        try:
+            chunk = _replace_existing(client, chunk, code_length, used_codes)
+            now = datetime.utcnow().isoformat()
+            rows = [{
+                **template,
+                'code': code,
+                'qr_code_data': f"https://skinandwicks.com/claim/{code}",
+                'is_used': False,
+                'created_at': now,
+                'updated_at': now
+            } for code in chunk]
+            client.table('coupons').insert(rows, returning='minimal').execute()
+            entry['created'] = len(rows)
+            summary['created_count'] += len(rows)
+            if on_inserted:
+                on_inserted(rows)
+        except Exception as e:
+            entry['error'] = str(e)
+            summary['failed_codes'].extend(chunk)
+        summary['chunks'].append(entry)
+
+    return summary
+
+
+def _replace_existing(client, chunk: List[str], code_length: int, used_codes: Set[str]) -> List[str]:
+    """Swap out codes that already exist in the table until the chunk is clean"""
+    pending = chunk
+    clean: List[str] = []
+    while pending:
+        response = client.table('coupons').select('code').in_('code', pending).execute()
+        taken = set(r['code'] for r in (response.data or []))
+        clean.extend(code for code in pending if code not in taken)
+        pending = generate_codes(len(taken), code_length, exclude=used_codes) if taken else []
+        used_codes.update(pending)
+    return clean
+
+
+def _legacy_codes(count: int, length: int = 8) -> Iterable[str]:
+    return [''.join(secrets.choice(CODE_ALPHABET) for _ in range(length)) for _ in range(count)]
+
+
+if __name__ == '__main__':
+    import timeit
+
+    for count in (10_000, 100_000, 1_000_000):
+        legacy = timeit.timeit(lambda: _legacy_codes(count), number=1)
+        bulk = timeit.timeit(lambda: generate_codes(count), number=1)
+        print(f"{count:>9} codes  per-char choice: {legacy:7.3f}s  "
+              f"bulk buffer: {bulk:7.3f}s  ({legacy / bulk:5.1f}x, {count / bulk:,.0f} codes/s)")
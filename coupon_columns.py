@@ -0,0 +1,39 @@
+# coupon_columns.py - Explicit column sets for coupon reads
+#
+# Reads name the columns they use instead of select('*'), so PostgREST sends
+# and the app parses only what the caller needs. COUPON_COLUMNS mirrors the
+# coupons table in database_models.Coupon; the projections below are subsets.
+# parse_fields() turns a client's ?fields=code,discount_value into a
+# projection for the list endpoints. id and created_at are always included
+# because the keyset cursor is built from them.
+
+from typing import Optional
+
+COUPON_COLUMNS = (
+    'id', 'code', 'name', 'description', 'discount_type', 'discount_value', 'minimum_spend',
+    'expiry_date', 'is_used', 'used_at', 'qr_code_data', 'short_url', 'assigned_to_email',
+    'is_assigned', 'created_at', 'updated_at'
+)
+
+# Whole coupon: cached lookups, /api/coupons/<id>, exports, default list pages
+COUPON_PROJECTION = ','.join(COUPON_COLUMNS)
+
+# What a customer sees of their coupons (claim response, active coupon cards)
+SUMMARY_PROJECTION = ('id,code,name,description,discount_type,discount_value,minimum_spend,'
+                      'expiry_date,is_used,short_url,assigned_to_email,created_at')
+
+# Columns split_page() needs to build the next cursor
+PAGE_KEY_COLUMNS = ('id', 'created_at')
+
+_SELECTABLE = frozenset(COUPON_COLUMNS)
+
+
+def parse_fields(value: Optional[str]) -> str:
+    """Projection for ?fields=a,b; raises ValueError naming any unknown column"""
+    if not value:
+        return COUPON_PROJECTION
+    requested = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in requested if name not in _SELECTABLE]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return ','.join(dict.fromkeys(PAGE_KEY_COLUMNS + tuple(requested)))
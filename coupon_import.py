@@ -0,0 +1,174 @@
+# coupon_import.py - Streaming, batched CSV import of coupons
+#
+# The upload is read row by row instead of being decoded into memory. Valid rows
+# are buffered into batches; each batch costs one select to find codes that
+# already exist and one multi-row insert, instead of two round trips per row.
+# Every row is validated on its own before it joins a batch, and if the
+# database still rejects a batch its rows are retried one by one, so a bad row
+# is reported against its own line instead of failing the other rows with it.
+
+import csv
+import io
+import logging
+import math
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from coupon_stats import CouponStats
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = ('code', 'discount_type', 'discount_value')
+DISCOUNT_TYPES = ('percentage', 'fixed_amount', 'minimum_spend')
+
+
+def normalize_import_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate one CSV row and build the coupon record; raises ValueError"""
+    missing = [key for key in REQUIRED_COLUMNS if not (row.get(key) or '').strip()]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+
+    code = row['code'].strip().upper()
+    discount_type = row['discount_type'].strip().lower()
+    if discount_type not in DISCOUNT_TYPES:
+        raise ValueError(f"invalid discount_type {row['discount_type']!r}, expected one of {', '.join(DISCOUNT_TYPES)}")
+    discount_value = _number(row['discount_value'], 'discount_value')
+    if discount_type == 'percentage' and discount_value > 100:
+        raise ValueError('percentage discount_value must not exceed 100')
+
+    usage_limit = (row.get('usage_limit') or '').strip()
+    expiry_date = (row.get('expiry_date') or '').strip()
+    minimum_order_value = (row.get('minimum_order_value') or '').strip()
+    try:
+        usage_limit = int(usage_limit) if usage_limit else None
+    except ValueError:
+        raise ValueError(f"invalid usage_limit {usage_limit!r}")
+    if usage_limit is not None and usage_limit < 1:
+        raise ValueError('usage_limit must be at least 1')
+    try:
+        expiry_date = datetime.strptime(expiry_date, '%Y-%m-%d').date().isoformat() if expiry_date else None
+    except ValueError:
+        raise ValueError(f"invalid expiry_date {expiry_date!r}, expected YYYY-MM-DD")
+    minimum_order_value = _number(minimum_order_value, 'minimum_order_value') if minimum_order_value else 0.0
+
+    now = datetime.now().isoformat()
+    return {
+        'code': code,
+        'description': row.get('description', '') or '',
+        'discount_type': discount_type,
+        'discount_value': discount_value,
+        'usage_limit': usage_limit,
+        'usage_count': 0,
+        'expiry_date': expiry_date,
+        'minimum_order_value': minimum_order_value,
+        'status': 'active',
+        'created_at': now,
+        'updated_at': now
+    }
+
+
+def _number(value: str, column: str) -> float:
+    """A finite, non-negative float from a CSV cell; raises ValueError naming the column"""
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f"invalid {column} {value!r}")
+    if not math.isfinite(number):
+        raise ValueError(f"invalid {column} {value!r}")
+    if number < 0:
+        raise ValueError(f'{column} must not be negative')
+    return number
+
+
+class CouponImporter:
+    """Imports coupons from a CSV byte stream in batches"""
+
+    def __init__(self, client, batch_size: int = 500, max_errors: int = 100, on_inserted=None):
+        self.client = client
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.on_inserted = on_inserted
+        self.stats = CouponStats(client)
+        self.success_count = 0
+        self.error_count = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def run(self, byte_stream) -> Dict[str, Any]:
+        """Import every row of the stream and return the counts and per-row errors"""
+        text_stream = io.TextIOWrapper(byte_stream, encoding='utf-8-sig', newline='')
+        reader = csv.DictReader(text_stream)
+        seen_codes = set()
+        batch: List[tuple] = []
+
+        for row in reader:
+            line = reader.line_num
+            try:
+                coupon = normalize_import_row(row)
+            except ValueError as e:
+                self._error(line, row.get('code'), str(e))
+                continue
+
+            if coupon['code'] in seen_codes:
+                self._error(line, coupon['code'], 'duplicate code in file')
+                continue
+            seen_codes.add(coupon['code'])
+
+            batch.append((line, coupon))
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+
+        if batch:
+            self._flush(batch)
+
+        return {
+            'success_count': self.success_count,
+            'error_count': self.error_count,
+            'errors': self.errors
+        }
+
+    def _existing_codes(self, codes: List[str]) -> set:
+        existing = self.client.table('coupons').select('code').in_('code', codes).execute()
+        return set(r['code'] for r in (existing.data or []))
+
+    def _flush(self, batch: List[tuple]) -> None:
+        try:
+            existing_codes = self._existing_codes([coupon['code'] for _, coupon in batch])
+        except Exception as e:
+            logger.error(f"Error checking codes for a batch of {len(batch)} coupons: {str(e)}")
+            for line, coupon in batch:
+                self._error(line, coupon['code'], f'batch failed: {str(e)}')
+            return
+
+        pending = []
+        for line, coupon in batch:
+            if coupon['code'] in existing_codes:
+                self._error(line, coupon['code'], 'code already exists')
+            else:
+                pending.append((line, coupon))
+        if not pending:
+            return
+
+        try:
+            self._insert([coupon for _, coupon in pending])
+        except Exception as e:
+            # Find the rows the database rejects by inserting one at a time
+            logger.warning(f"Batch of {len(pending)} coupons rejected, retrying row by row: {str(e)}")
+            for line, coupon in pending:
+                try:
+                    self._insert([coupon])
+                except Exception as row_error:
+                    self._error(line, coupon['code'], str(row_error))
+
+    def _insert(self, coupons: List[Dict[str, Any]]) -> None:
+        result = self.client.table('coupons').insert(coupons).execute()
+        inserted = result.data or []
+        self.success_count += len(inserted)
+        self.stats.record_created(inserted)
+        if self.on_inserted:
+            self.on_inserted(inserted)
+
+    def _error(self, line: int, code: Optional[str], message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'code': code, 'error': message})
@@ -0,0 +1,180 @@
+# coupon_stats.py - Incrementally maintained coupon counters
+#
+# The coupon_stats row (see db_functions.COUPON_STATS_SQL) is updated by delta
+# from every coupon write so analytics become a single-row read. A write to an
+# unused coupon that is already expired moves the expired counters with it;
+# a coupon that expires between writes is only counted as expired once
+# rebuild() recomputes everything from the coupons table.
+
+import logging
+from datetime import datetime
+from typing import Dict, Any, Iterable, List, NamedTuple, Optional, Set
+
+from coupon_validity import is_expired
+from db_functions import analytics_from_counts, rpc_row
+
+logger = logging.getLogger(__name__)
+
+STATS_FIELDS = (
+    'total_coupons',
+    'used_coupons',
+    'expired_coupons',
+    'unused_value',
+    'expired_value',
+    'gift_coupons',
+    'gift_used',
+    'referral_coupons',
+    'referral_used'
+)
+
+
+class DataVersion(NamedTuple):
+    """Changes whenever coupon data changes; backs ETag / Last-Modified"""
+    token: str
+    last_modified: Optional[datetime]
+
+
+def _value(coupon: Dict[str, Any]) -> float:
+    return float(coupon.get('discount_value') or 0)
+
+
+def created_delta(coupons: Iterable[Dict[str, Any]], sign: int = 1,
+                  referral_ids: Optional[Set[str]] = None) -> Dict[str, Any]:
+    """Delta for coupons being inserted (sign=1) or deleted (sign=-1)"""
+    referral_ids = referral_ids or set()
+    delta = dict.fromkeys(STATS_FIELDS, 0)
+    for coupon in coupons:
+        kind = 'referral' if coupon.get('id') in referral_ids else 'gift'
+        delta['total_coupons'] += sign
+        delta[f'{kind}_coupons'] += sign
+        if coupon.get('is_used'):
+            delta['used_coupons'] += sign
+            delta[f'{kind}_used'] += sign
+        else:
+            delta['unused_value'] += sign * _value(coupon)
+            if is_expired(coupon):
+                delta['expired_coupons'] += sign
+                delta['expired_value'] += sign * _value(coupon)
+    return delta
+
+
+def usage_delta(coupons: Iterable[Dict[str, Any]], is_used: bool,
+                referral_ids: Optional[Set[str]] = None) -> Dict[str, Any]:
+    """Delta for coupons whose is_used flag just flipped to is_used"""
+    referral_ids = referral_ids or set()
+    sign = 1 if is_used else -1
+    delta = dict.fromkeys(STATS_FIELDS, 0)
+    for coupon in coupons:
+        kind = 'referral' if coupon.get('id') in referral_ids else 'gift'
+        delta['used_coupons'] += sign
+        delta[f'{kind}_used'] += sign
+        delta['unused_value'] -= sign * _value(coupon)
+        if is_expired(coupon):
+            delta['expired_coupons'] -= sign
+            delta['expired_value'] -= sign * _value(coupon)
+    return delta
+
+
+def counts_from_stats(row: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Convert a coupon_stats row into the counts coupon_analytics() returns"""
+    row = row or {}
+    total = int(row.get('total_coupons') or 0)
+    used = int(row.get('used_coupons') or 0)
+    expired = int(row.get('expired_coupons') or 0)
+    unused_value = float(row.get('unused_value') or 0)
+    expired_value = float(row.get('expired_value') or 0)
+    return {
+        'total_coupons': total,
+        'used_coupons': used,
+        'expired_coupons': expired,
+        'active_coupons': max(total - used - expired, 0),
+        'total_value': max(unused_value - expired_value, 0),
+        'expired_value': expired_value,
+        'gift_coupons': int(row.get('gift_coupons') or 0),
+        'gift_used': int(row.get('gift_used') or 0),
+        'referral_coupons': int(row.get('referral_coupons') or 0),
+        'referral_used': int(row.get('referral_used') or 0)
+    }
+
+
+class CouponStats:
+    """Reads and updates the coupon_stats summary row"""
+
+    def __init__(self, client=None):
+        self.client = client
+
+    def apply(self, delta: Dict[str, Any]) -> bool:
+        """Add a delta to the summary row; a no-op delta costs nothing"""
+        delta = {key: value for key, value in delta.items() if value}
+        if not delta:
+            return True
+        try:
+            response = self.client.rpc('apply_coupon_stats_delta', {'delta': delta}).execute()
+            if rpc_row(response.data) is None:
+                logger.error(f"Coupon stats delta {delta} not applied: the coupon_stats row is missing")
+                return False
+            return True
+        except Exception as e:
+            # The write itself succeeded; reconcile will repair the drift
+            logger.error(f"Error applying coupon stats delta {delta}: {str(e)}")
+            return False
+
+    def referral_coupon_ids(self, coupons: List[Dict[str, Any]]) -> Set[str]:
+        """Return which of the given coupons are referenced by a referral"""
+        coupon_ids = [c['id'] for c in coupons if c.get('id')]
+        if not coupon_ids:
+            return set()
+        response = (self.client.table('referrals')
+                   .select('coupon_id')
+                   .in_('coupon_id', coupon_ids)
+                   .execute())
+        return set(r['coupon_id'] for r in (response.data or []))
+
+    def record_created(self, coupons: List[Dict[str, Any]]) -> bool:
+        """Count freshly inserted coupons (never referral coupons yet)"""
+        return self.apply(created_delta(coupons)) if coupons else True
+
+    def record_deleted(self, coupons: List[Dict[str, Any]]) -> bool:
+        """Uncount the rows a delete returned"""
+        if not coupons:
+            return True
+        try:
+            return self.apply(created_delta(coupons, -1, self.referral_coupon_ids(coupons)))
+        except Exception as e:
+            logger.error(f"Error recording deleted coupons in stats: {str(e)}")
+            return False
+
+    def record_usage(self, coupons: List[Dict[str, Any]], is_used: bool) -> bool:
+        """Move the rows an is_used flip returned (filtered on the opposite state)"""
+        if not coupons:
+            return True
+        try:
+            return self.apply(usage_delta(coupons, is_used, self.referral_coupon_ids(coupons)))
+        except Exception as e:
+            logger.error(f"Error recording coupon usage in stats: {str(e)}")
+            return False
+
+    def read(self) -> Dict[str, Any]:
+        """Fetch the raw summary row"""
+        response = self.client.table('coupon_stats').select('*').eq('id', 1).execute()
+        return response.data[0] if response.data else {}
+
+    def analytics(self) -> Dict[str, Any]:
+        """Analytics dict computed from the summary row"""
+        return analytics_from_counts(counts_from_stats(self.read()))
+
+    def rebuild(self) -> Dict[str, Any]:
+        """Recompute the summary from scratch and report how far it had drifted"""
+        response = self.client.rpc('rebuild_coupon_stats', {}).execute()
+        result = rpc_row(response.data) or {}
+        before = result.get('before') or {}
+        after = result.get('after') or {}
+
+        drift = {}
+        for field in STATS_FIELDS:
+            old = float(before.get(field) or 0)
+            new = float(after.get(field) or 0)
+            if old != new:
+                drift[field] = round(new - old, 2)
+
+        return {'before': before, 'after': after, 'drift': drift}
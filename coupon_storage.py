@@ -0,0 +1,76 @@
+# coupon_storage.py - Storage interface for the coupon hot paths
+#
+# SupabaseService (PostgREST over HTTP) and SQLAlchemyStorage (direct database
+# connections) both implement it. Rows are plain dicts shaped like the
+# Supabase rows: string ids, ISO timestamps and float amounts. Select the
+# backend with STORAGE_BACKEND; routes fetch it with get_storage().
+
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from flask import current_app
+
+from coupon_columns import COUPON_PROJECTION
+from coupon_stats import DataVersion
+
+
+class CouponStorage(ABC):
+    """Operations every coupon storage backend provides"""
+
+    @abstractmethod
+    def get_coupon_by_code(self, code: str) -> Optional[Dict[str, Any]]:
+        """Coupon with this code (case-insensitive), or None"""
+
+    @abstractmethod
+    def get_coupon_by_id(self, coupon_id: str) -> Optional[Dict[str, Any]]:
+        """Coupon with this id, or None (including for malformed ids)"""
+
+    @abstractmethod
+    def get_coupons_by_email(self, email: str) -> List[Dict[str, Any]]:
+        """All coupons assigned to email"""
+
+    @abstractmethod
+    def get_coupons_page(self, limit: int, cursor: Optional[str] = None, email: Optional[str] = None,
+                         columns: str = COUPON_PROJECTION) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """One keyset page, newest first, of the given columns; raises ValueError for a bad cursor"""
+
+    @abstractmethod
+    def iter_coupons(self, page_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """Every coupon, oldest first, holding at most one page in memory"""
+
+    @abstractmethod
+    def create_coupon(self, coupon_data: Dict[str, Any], short_link: bool = False) -> Optional[Dict[str, Any]]:
+        """Insert a coupon, optionally with a freshly allocated short_url"""
+
+    @abstractmethod
+    def redeem_coupon(self, coupon_id: str) -> Dict[str, Any]:
+        """Atomic redeem; {'outcome': redeemed | already_used | expired | not_found | error, 'coupon'}"""
+
+    @abstractmethod
+    def update_coupon_usage_tracking(self, coupon_code: str, order_data: Dict[str, Any]) -> bool:
+        """Count one use of the code and append the order event"""
+
+    @abstractmethod
+    def create_referral_coupon(self, referrer_email: str, referee_email: str,
+                               discount_value: float, discount_type: str = 'fixed_amount',
+                               referrer_gets_reward: bool = False,
+                               referrer_reward_value: float = None) -> Dict[str, Any]:
+        """Referee coupon, optional referrer reward and referral row, atomically"""
+
+    @abstractmethod
+    def create_referral_coupons_batch(self, referrals: List[Dict[str, Any]],
+                                      chunk_size: int = 500) -> Dict[str, Any]:
+        """Many create_referral_coupon calls, one transaction per chunk"""
+
+    @abstractmethod
+    def get_coupon_analytics(self) -> Dict[str, Any]:
+        """Counts and values in the analytics_from_counts() shape"""
+
+    @abstractmethod
+    def get_data_version(self) -> Optional[DataVersion]:
+        """Cheap token that changes whenever coupons or referrals change, or None if unknown"""
+
+
+def get_storage() -> CouponStorage:
+    """The storage backend configured for the current Flask app"""
+    return current_app.extensions['coupon_storage']
@@ -0,0 +1,153 @@
+# coupon_validity.py - Shared expiry parsing and coupon classification
+#
+# Every validity check goes through here. Timestamps are parsed once into a UTC
+# epoch float; naive values are taken as UTC, which is what the timestamptz
+# columns hold. Parses are memoized because coupon batches repeat the same few
+# expiry strings. A coupon expires when expiry <= now, matching the SQL in
+# db_functions. An expiry that cannot be parsed counts as expired, so a bad
+# value can never make a coupon redeemable. Run this module directly for
+# microbenchmarks; correctness checks live in tests/test_coupon_validity.py.
+
+import time
+from datetime import date, datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+ACTIVE = 'active'
+USED = 'used'
+EXPIRED = 'expired'
+INVALID = 'invalid'
+
+Timestamp = Union[str, datetime, date, int, float, None]
+
+
+@lru_cache(maxsize=65536)
+def _parse_string(value: str) -> Optional[float]:
+    text = value.strip()
+    if not text:
+        return None
+    if text[-1] in 'zZ':
+        text = text[:-1] + '+00:00'
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def parse_timestamp(value: Timestamp) -> Optional[float]:
+    """Return value as a UTC epoch, or None if it is empty or unparseable"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return _parse_string(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day, tzinfo=timezone.utc).timestamp()
+    if isinstance(value, (int, float)):
+        return float(value)
+    return None
+
+
+def now_epoch() -> float:
+    return time.time()
+
+
+def _now(now: Timestamp) -> float:
+    return now_epoch() if now is None else parse_timestamp(now)
+
+
+def coupon_status(coupon: Dict[str, Any], now: Timestamp = None) -> str:
+    """'used', 'expired', 'invalid' (unparseable expiry) or 'active'"""
+    if coupon.get('is_used'):
+        return USED
+    expiry = coupon.get('expiry_date')
+    if expiry is None or expiry == '':
+        return ACTIVE
+    expires_at = parse_timestamp(expiry)
+    if expires_at is None:
+        return INVALID
+    return EXPIRED if expires_at <= _now(now) else ACTIVE
+
+
+def is_expired(coupon: Dict[str, Any], now: Timestamp = None) -> bool:
+    """True if the coupon's expiry has passed or cannot be read"""
+    expiry = coupon.get('expiry_date')
+    if expiry is None or expiry == '':
+        return False
+    expires_at = parse_timestamp(expiry)
+    return expires_at is None or expires_at <= _now(now)
+
+
+def classify(coupons: Iterable[Dict[str, Any]], now: Timestamp = None) -> Dict[str, List[Dict[str, Any]]]:
+    """Split coupons into active/used/expired/invalid lists against one clock reading"""
+    now = _now(now)
+    buckets: Dict[str, List[Dict[str, Any]]] = {ACTIVE: [], USED: [], EXPIRED: [], INVALID: []}
+    parse = parse_timestamp
+    for coupon in coupons:
+        if coupon.get('is_used'):
+            buckets[USED].append(coupon)
+            continue
+        expiry = coupon.get('expiry_date')
+        if expiry is None or expiry == '':
+            buckets[ACTIVE].append(coupon)
+            continue
+        expires_at = parse(expiry)
+        if expires_at is None:
+            buckets[INVALID].append(coupon)
+        elif expires_at <= now:
+            buckets[EXPIRED].append(coupon)
+        else:
+            buckets[ACTIVE].append(coupon)
+    return buckets
+
+
+def _legacy_is_active(coupon: Dict[str, Any]) -> bool:
+    if coupon['is_used']:
+        return False
+    try:
+        expiry_str = coupon['expiry_date']
+        if expiry_str.endswith('Z'):
+            expiry_date = datetime.fromisoformat(expiry_str.replace('Z', '+00:00'))
+        else:
+            expiry_date = datetime.fromisoformat(expiry_str)
+        return not expiry_date < datetime.now()
+    except:
+        return True
+
+
+if __name__ == '__main__':
+    import random
+    import timeit
+    import uuid
+    from datetime import timedelta
+
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    # Batch-created coupons share expiries, so distinct strings are few
+    expiries = [(base + timedelta(days=day)).isoformat() for day in range(-180, 180)]
+    expiries += [expiry.replace('+00:00', 'Z') for expiry in expiries[:60]]
+    coupons = [{
+        'id': str(uuid.uuid4()),
+        'code': f'C{index:07d}',
+        'discount_value': 10.0,
+        'is_used': random.random() < 0.3,
+        'expiry_date': random.choice(expiries)
+    } for index in range(100_000)]
+
+    now = base.timestamp()
+    single = coupons[0]
+    for label, fn in (
+        ('legacy per-row fromisoformat', lambda: [_legacy_is_active(c) for c in coupons]),
+        ('coupon_status per row', lambda: [coupon_status(c, now) for c in coupons]),
+        ('classify batch', lambda: classify(coupons, now)),
+    ):
+        seconds = min(timeit.repeat(fn, number=1, repeat=3))
+        print(f"{label:<30} {len(coupons):,} coupons: {seconds * 1000:8.1f} ms")
+    seconds = min(timeit.repeat(lambda: is_expired(single, now), number=100_000, repeat=3))
+    print(f"{'is_expired single check':<30} {seconds / 100_000 * 1e9:8.0f} ns/call")
+    print(f"parse cache: {_parse_string.cache_info()}")
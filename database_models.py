@@ -1,11 +1,44 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 import uuid
-from sqlalchemy.dialects.postgresql import UUID, JSONB
-from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID, JSONB as PG_JSONB
+from sqlalchemy import JSON, String, text
+from sqlalchemy.types import TypeDecorator
+
+from coupon_validity import is_expired
 
 db = SQLAlchemy()
 
+
+class UUID(TypeDecorator):
+    """Native uuid on Postgres, 36-character text elsewhere (SQLite for local runs)"""
+    impl = String(36)
+    cache_ok = True
+    
+    def __init__(self, as_uuid=True):
+        super().__init__()
+    
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(PG_UUID(as_uuid=True))
+        return dialect.type_descriptor(String(36))
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if not isinstance(value, uuid.UUID):
+            value = uuid.UUID(str(value))
+        return value if dialect.name == 'postgresql' else str(value)
+    
+    def process_result_value(self, value, dialect):
+        if value is None or isinstance(value, uuid.UUID):
+            return value
+        return uuid.UUID(str(value))
+
+
+# JSONB on Postgres, plain JSON elsewhere
+JSONB = JSON().with_variant(PG_JSONB(), 'postgresql')
+
 class Coupon(db.Model):
     __tablename__ = 'coupons'
     
@@ -35,7 +68,7 @@ class Coupon(db.Model):
     
     @property
     def is_expired(self):
-        return datetime.utcnow() > self.expiry_date
+        return is_expired({'expiry_date': self.expiry_date})
     
     @property
     def is_valid(self):
@@ -178,6 +211,28 @@ class ShopifyOrder(db.Model):
         }
 
 
+class CouponStatsRow(db.Model):
+    """The single coupon_stats summary row (db_functions.COUPON_STATS_SQL)"""
+    __tablename__ = 'coupon_stats'
+    
+    id = db.Column(db.Integer, primary_key=True, default=1)
+    total_coupons = db.Column(db.BigInteger, nullable=False, default=0)
+    used_coupons = db.Column(db.BigInteger, nullable=False, default=0)
+    expired_coupons = db.Column(db.BigInteger, nullable=False, default=0)
+    unused_value = db.Column(db.Numeric, nullable=False, default=0)
+    expired_value = db.Column(db.Numeric, nullable=False, default=0)
+    gift_coupons = db.Column(db.BigInteger, nullable=False, default=0)
+    gift_used = db.Column(db.BigInteger, nullable=False, default=0)
+    referral_coupons = db.Column(db.BigInteger, nullable=False, default=0)
+    referral_used = db.Column(db.BigInteger, nullable=False, default=0)
+    generation = db.Column(db.BigInteger, nullable=False, default=0)
+    reconciled_at = db.Column(db.DateTime(timezone=True))
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<CouponStatsRow {self.total_coupons} coupons>'
+
+
 class CouponUsageTracking(db.Model):
     __tablename__ = 'coupon_usage_tracking'
     
@@ -0,0 +1,660 @@
+# db_functions.py - Server-side SQL functions called through Supabase RPC
+#
+# Install the Postgres side with:
+#     python db_functions.py | psql "$SUPABASE_DB_URL"
+#
+# The query-heavy functions also have SQLite stand-ins so the same statement
+# shape can be exercised locally without a Supabase project.
+
+import sqlite3
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+
+
+# Postgres functions
+#
+# Functions with a result return it as a one-row set (setof json): the pinned
+# postgrest client only accepts a JSON array as response data, so a bare object
+# fails to parse after the function has already run. Callers read rpc_row().
+# A function whose return type changed is dropped first, as create or replace
+# cannot change it.
+
+# Indexes backing keyset pagination on (created_at, id), overall and per email
+COUPON_INDEXES_SQL = """
+create index if not exists coupons_created_at_id_idx
+    on public.coupons (created_at desc, id desc);
+create index if not exists coupons_email_created_at_id_idx
+    on public.coupons (assigned_to_email, created_at desc, id desc);
+"""
+
+COUPON_ANALYTICS_SQL = """
+drop function if exists public.coupon_analytics();
+create or replace function public.coupon_analytics()
+returns setof json
+language sql
+stable
+as $$
+    with referral_ids as (
+        select distinct coupon_id from public.referrals where coupon_id is not null
+    ),
+    c as (
+        select c.is_used,
+               c.discount_value,
+               (c.expiry_date is not null and c.expiry_date <= now()) as is_expired,
+               (r.coupon_id is not null) as is_referral
+        from public.coupons c
+        left join referral_ids r on r.coupon_id = c.id
+    )
+    select json_build_object(
+        'total_coupons',    count(*),
+        'used_coupons',     count(*) filter (where is_used),
+        'expired_coupons',  count(*) filter (where not is_used and is_expired),
+        'active_coupons',   count(*) filter (where not is_used and not is_expired),
+        'total_value',      coalesce(sum(discount_value) filter (where not is_used and not is_expired), 0),
+        'expired_value',    coalesce(sum(discount_value) filter (where not is_used and is_expired), 0),
+        'gift_coupons',     count(*) filter (where not is_referral),
+        'gift_used',        count(*) filter (where not is_referral and is_used),
+        'referral_coupons', count(*) filter (where is_referral),
+        'referral_used',    count(*) filter (where is_referral and is_used)
+    )
+    from c;
+$$;
+"""
+
+# Single-row summary kept up to date by the service on every coupon write.
+# Writes to already-expired unused coupons move expired_coupons and
+# expired_value; coupons that expire between writes are picked up by
+# rebuild_coupon_stats().
+COUPON_STATS_SQL = """
+create table if not exists public.coupon_stats (
+    id integer primary key default 1 check (id = 1),
+    total_coupons bigint not null default 0,
+    used_coupons bigint not null default 0,
+    expired_coupons bigint not null default 0,
+    unused_value numeric not null default 0,
+    expired_value numeric not null default 0,
+    gift_coupons bigint not null default 0,
+    gift_used bigint not null default 0,
+    referral_coupons bigint not null default 0,
+    referral_used bigint not null default 0,
+    generation bigint not null default 0,
+    reconciled_at timestamptz,
+    updated_at timestamptz not null default now()
+);
+
+insert into public.coupon_stats (id) values (1) on conflict (id) do nothing;
+
+drop function if exists public.apply_coupon_stats_delta(jsonb);
+create or replace function public.apply_coupon_stats_delta(delta jsonb)
+returns setof public.coupon_stats
+language sql
+as $$
+    update public.coupon_stats set
+        total_coupons    = total_coupons    + coalesce((delta->>'total_coupons')::bigint, 0),
+        used_coupons     = used_coupons     + coalesce((delta->>'used_coupons')::bigint, 0),
+        expired_coupons  = expired_coupons  + coalesce((delta->>'expired_coupons')::bigint, 0),
+        unused_value     = unused_value     + coalesce((delta->>'unused_value')::numeric, 0),
+        expired_value    = expired_value    + coalesce((delta->>'expired_value')::numeric, 0),
+        gift_coupons     = gift_coupons     + coalesce((delta->>'gift_coupons')::bigint, 0),
+        gift_used        = gift_used        + coalesce((delta->>'gift_used')::bigint, 0),
+        referral_coupons = referral_coupons + coalesce((delta->>'referral_coupons')::bigint, 0),
+        referral_used    = referral_used    + coalesce((delta->>'referral_used')::bigint, 0),
+        generation       = generation + 1,
+        updated_at       = now()
+    where id = 1
+    returning *;
+$$;
+
+drop function if exists public.rebuild_coupon_stats();
+create or replace function public.rebuild_coupon_stats()
+returns setof json
+language plpgsql
+as $$
+declare
+    before_row json;
+    fresh json;
+    after_row json;
+begin
+    select row_to_json(s) into before_row from public.coupon_stats s where id = 1 for update;
+    select public.coupon_analytics() into fresh;
+
+    update public.coupon_stats set
+        total_coupons    = (fresh->>'total_coupons')::bigint,
+        used_coupons     = (fresh->>'used_coupons')::bigint,
+        expired_coupons  = (fresh->>'expired_coupons')::bigint,
+        unused_value     = (fresh->>'total_value')::numeric + (fresh->>'expired_value')::numeric,
+        expired_value    = (fresh->>'expired_value')::numeric,
+        gift_coupons     = (fresh->>'gift_coupons')::bigint,
+        gift_used        = (fresh->>'gift_used')::bigint,
+        referral_coupons = (fresh->>'referral_coupons')::bigint,
+        referral_used    = (fresh->>'referral_used')::bigint,
+        generation       = generation + 1,
+        reconciled_at    = now(),
+        updated_at       = now()
+    where id = 1;
+
+    select row_to_json(s) into after_row from public.coupon_stats s where id = 1;
+    return next json_build_object('before', before_row, 'after', after_row);
+end;
+$$;
+"""
+
+# Delta sync (/api/coupons/changes): the database stamps coupons.updated_at on
+# every insert and update, and every deleted coupon leaves a tombstone, so a
+# client can ask for rows changed after its watermark instead of re-reading the
+# table. Both run as triggers, so the admin routes' hard deletes are recorded
+# too; re-inserting an id clears its tombstone. TRUNCATE is not recorded.
+# prune_coupon_tombstones() drops tombstones older than the retention period
+# and records the cutoff, which only ever moves forward; a watermark from
+# before it gets a full resync instead of a delta with deletes missing.
+COUPON_CHANGES_SQL = """
+create table if not exists public.coupon_tombstones (
+    id uuid primary key,
+    code text,
+    deleted_at timestamptz not null default now()
+);
+
+create index if not exists coupons_updated_at_id_idx
+    on public.coupons (updated_at, id);
+create index if not exists coupon_tombstones_deleted_at_id_idx
+    on public.coupon_tombstones (deleted_at, id);
+
+create table if not exists public.coupon_tombstone_retention (
+    id integer primary key default 1 check (id = 1),
+    pruned_before timestamptz
+);
+insert into public.coupon_tombstone_retention (id) values (1) on conflict (id) do nothing;
+
+drop function if exists public.prune_coupon_tombstones(integer);
+create or replace function public.prune_coupon_tombstones(p_retention_days integer)
+returns setof json
+language plpgsql
+as $$
+declare
+    cutoff timestamptz := now() - make_interval(days => p_retention_days);
+    removed bigint;
+begin
+    update public.coupon_tombstone_retention
+       set pruned_before = greatest(coalesce(pruned_before, cutoff), cutoff)
+     where id = 1
+    returning pruned_before into cutoff;
+    delete from public.coupon_tombstones where deleted_at < cutoff;
+    get diagnostics removed = row_count;
+    return next json_build_object('pruned_before', cutoff, 'removed', removed);
+end;
+$$;
+
+create or replace function public.touch_coupon_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at := now();
+    return new;
+end;
+$$;
+
+drop trigger if exists coupons_touch_updated_at on public.coupons;
+create trigger coupons_touch_updated_at
+    before insert or update on public.coupons
+    for each row execute function public.touch_coupon_updated_at();
+
+create or replace function public.record_coupon_tombstone()
+returns trigger
+language plpgsql
+as $$
+begin
+    if tg_op = 'DELETE' then
+        insert into public.coupon_tombstones (id, code) values (old.id, old.code)
+        on conflict (id) do update set code = excluded.code, deleted_at = now();
+    else
+        delete from public.coupon_tombstones where id = new.id;
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists coupons_record_tombstone on public.coupons;
+create trigger coupons_record_tombstone
+    after insert or delete on public.coupons
+    for each row execute function public.record_coupon_tombstone();
+"""
+
+# Version token for ETags on polled endpoints: the newest coupon write, coupon
+# delete and referral write, each one backward scan of an index, plus the
+# tombstone cutoff. There is no shared counter row, so concurrent writers
+# never wait on each other. now() is the start of the writing transaction, so
+# a slow write can commit behind a newer stamp without moving the version;
+# routes using it pass window=Config.SYNC_SETTLE_SECONDS so that write shows
+# up within the window. The result also carries the database's own now(),
+# which delta sync measures its settle window against, because the stamps it
+# compares come from that clock and not the app server's.
+# This replaces the bump_coupon_generation statement triggers, which made
+# every write to coupons or referrals update the one coupon_stats row.
+COUPON_VERSION_SQL = """
+drop trigger if exists coupons_bump_generation on public.coupons;
+drop trigger if exists referrals_bump_generation on public.referrals;
+drop function if exists public.bump_coupon_generation();
+
+create index if not exists referrals_updated_at_idx
+    on public.referrals (updated_at);
+
+drop function if exists public.coupon_data_version();
+create or replace function public.coupon_data_version()
+returns setof json
+language sql
+stable
+as $$
+    select json_build_object(
+        'coupons_at', (select max(updated_at) from public.coupons),
+        'deleted_at', (select max(deleted_at) from public.coupon_tombstones),
+        'referrals_at', (select max(updated_at) from public.referrals),
+        'pruned_before', (select pruned_before from public.coupon_tombstone_retention where id = 1),
+        'now', now()
+    );
+$$;
+"""
+
+# Redemption outcomes returned by redeem_coupon()
+REDEEMED = 'redeemed'
+ALREADY_USED = 'already_used'
+EXPIRED = 'expired'
+NOT_FOUND = 'not_found'
+
+# Conditional update: the row lock taken by UPDATE serialises concurrent
+# redemptions, and only the first one still sees is_used = false. The
+# coupon_stats delta is applied in the same transaction.
+REDEEM_COUPON_SQL = """
+drop function if exists public.redeem_coupon(uuid);
+create or replace function public.redeem_coupon(p_coupon_id uuid)
+returns setof json
+language plpgsql
+as $$
+declare
+    redeemed public.coupons;
+    existing public.coupons;
+    is_referral boolean;
+begin
+    update public.coupons
+       set is_used = true, used_at = now(), updated_at = now()
+     where id = p_coupon_id
+       and not is_used
+       and (expiry_date is null or expiry_date > now())
+    returning * into redeemed;
+
+    if found then
+        is_referral := exists (select 1 from public.referrals where coupon_id = p_coupon_id);
+        perform public.apply_coupon_stats_delta(jsonb_build_object(
+            'used_coupons', 1,
+            'unused_value', -redeemed.discount_value,
+            case when is_referral then 'referral_used' else 'gift_used' end, 1
+        ));
+        return next json_build_object('outcome', 'redeemed', 'coupon', row_to_json(redeemed));
+        return;
+    end if;
+
+    select * into existing from public.coupons where id = p_coupon_id;
+    if not found then
+        return next json_build_object('outcome', 'not_found', 'coupon', null);
+    elsif existing.is_used then
+        return next json_build_object('outcome', 'already_used', 'coupon', row_to_json(existing));
+    else
+        return next json_build_object('outcome', 'expired', 'coupon', row_to_json(existing));
+    end if;
+end;
+$$;
+"""
+
+# Upsert-and-increment so concurrent redemptions never lose an update.
+# orders_data becomes an append-only array of order events; a legacy single
+# object is wrapped into the array on first update. Both return the tracking
+# rows they wrote.
+TRACK_COUPON_USAGE_SQL = """
+drop function if exists public.track_coupon_usage(text, numeric, jsonb);
+create or replace function public.track_coupon_usage(p_coupon_code text, p_discount numeric, p_order jsonb)
+returns setof public.coupon_usage_tracking
+language sql
+as $$
+    insert into public.coupon_usage_tracking as t
+        (id, coupon_code, usage_count, total_discount, last_used, orders_data, created_at, updated_at)
+    values
+        (gen_random_uuid(), upper(p_coupon_code), 1, coalesce(p_discount, 0), now(),
+         jsonb_build_array(p_order), now(), now())
+    on conflict (coupon_code) do update set
+        usage_count    = coalesce(t.usage_count, 0) + 1,
+        total_discount = coalesce(t.total_discount, 0) + excluded.total_discount,
+        last_used      = now(),
+        orders_data    = (case jsonb_typeof(t.orders_data)
+                              when 'array' then t.orders_data
+                              when 'object' then jsonb_build_array(t.orders_data)
+                              else '[]'::jsonb
+                          end) || excluded.orders_data,
+        updated_at     = now()
+    returning *;
+$$;
+
+-- p_events: [{"coupon_code": ..., "discount_amount": ..., "order_data": {...}}, ...]
+-- Events for the same code are folded into a single row update.
+drop function if exists public.track_coupon_usage_batch(jsonb);
+create or replace function public.track_coupon_usage_batch(p_events jsonb)
+returns setof public.coupon_usage_tracking
+language sql
+as $$
+    insert into public.coupon_usage_tracking as t
+        (id, coupon_code, usage_count, total_discount, last_used, orders_data, created_at, updated_at)
+    select gen_random_uuid(), ev.code, count(*), sum(ev.discount), now(), jsonb_agg(ev.order_data), now(), now()
+    from (
+        select upper(e->>'coupon_code') as code,
+               coalesce((e->>'discount_amount')::numeric, 0) as discount,
+               coalesce(e->'order_data', '{}'::jsonb) as order_data
+        from jsonb_array_elements(p_events) e
+    ) ev
+    group by ev.code
+    on conflict (coupon_code) do update set
+        usage_count    = coalesce(t.usage_count, 0) + excluded.usage_count,
+        total_discount = coalesce(t.total_discount, 0) + excluded.total_discount,
+        last_used      = now(),
+        orders_data    = (case jsonb_typeof(t.orders_data)
+                              when 'array' then t.orders_data
+                              when 'object' then jsonb_build_array(t.orders_data)
+                              else '[]'::jsonb
+                          end) || excluded.orders_data,
+        updated_at     = now()
+    returning *;
+$$;
+"""
+
+# Referee coupon, optional referrer reward coupon and the referrals row in one
+# transaction: a failure on any insert (e.g. a code or short_url collision)
+# leaves nothing behind. Rows arrive fully built by referral_bundles.py,
+# including ids, so the referral already points at both coupons. The referrer
+# reward is not referenced by referrals.coupon_id, so it counts as a gift coupon.
+CREATE_REFERRAL_BUNDLE_SQL = """
+drop function if exists public.create_referral_bundle(jsonb);
+create or replace function public.create_referral_bundle(p_bundle jsonb)
+returns setof json
+language plpgsql
+as $$
+declare
+    referee public.coupons;
+    referrer public.coupons;
+    referral public.referrals;
+begin
+    insert into public.coupons
+    select * from jsonb_populate_record(null::public.coupons, p_bundle->'referee_coupon')
+    returning * into referee;
+
+    if jsonb_typeof(p_bundle->'referrer_coupon') = 'object' then
+        insert into public.coupons
+        select * from jsonb_populate_record(null::public.coupons, p_bundle->'referrer_coupon')
+        returning * into referrer;
+    end if;
+
+    insert into public.referrals
+    select * from jsonb_populate_record(null::public.referrals, p_bundle->'referral')
+    returning * into referral;
+
+    perform public.apply_coupon_stats_delta(jsonb_build_object(
+        'total_coupons', case when referrer.id is null then 1 else 2 end,
+        'unused_value', referee.discount_value + coalesce(referrer.discount_value, 0),
+        'referral_coupons', 1,
+        'gift_coupons', case when referrer.id is null then 0 else 1 end
+    ));
+
+    return next json_build_object(
+        'referee_coupon', row_to_json(referee),
+        'referrer_coupon', case when referrer.id is null then null else row_to_json(referrer) end,
+        'referral', row_to_json(referral)
+    );
+end;
+$$;
+
+-- p_bundles: [{"referee_coupon": {...}, "referrer_coupon": {...} | null, "referral": {...}}, ...]
+-- Two set-based inserts for the whole chunk; returns counts, not rows.
+drop function if exists public.create_referral_bundles(jsonb);
+create or replace function public.create_referral_bundles(p_bundles jsonb)
+returns setof json
+language plpgsql
+as $$
+declare
+    coupon_count bigint;
+    coupon_value numeric;
+    referral_count bigint;
+begin
+    with inserted as (
+        insert into public.coupons
+        select * from jsonb_populate_recordset(null::public.coupons, (
+            select coalesce(jsonb_agg(c), '[]'::jsonb)
+            from jsonb_array_elements(p_bundles) b,
+                 lateral (values (b->'referee_coupon'), (b->'referrer_coupon')) v(c)
+            where jsonb_typeof(c) = 'object'
+        ))
+        returning discount_value
+    )
+    select count(*), coalesce(sum(discount_value), 0) into coupon_count, coupon_value from inserted;
+
+    insert into public.referrals
+    select * from jsonb_populate_recordset(null::public.referrals, (
+        select coalesce(jsonb_agg(b->'referral'), '[]'::jsonb) from jsonb_array_elements(p_bundles) b
+    ));
+    get diagnostics referral_count = row_count;
+
+    perform public.apply_coupon_stats_delta(jsonb_build_object(
+        'total_coupons', coupon_count,
+        'unused_value', coupon_value,
+        'referral_coupons', referral_count,
+        'gift_coupons', coupon_count - referral_count
+    ));
+
+    return next json_build_object('created_count', referral_count, 'coupon_count', coupon_count);
+end;
+$$;
+"""
+
+ALL_FUNCTIONS = [
+    COUPON_INDEXES_SQL,
+    COUPON_ANALYTICS_SQL,
+    COUPON_STATS_SQL,
+    COUPON_CHANGES_SQL,
+    COUPON_VERSION_SQL,
+    REDEEM_COUPON_SQL,
+    TRACK_COUPON_USAGE_SQL,
+    CREATE_REFERRAL_BUNDLE_SQL,
+]
+
+
+# SQLite stand-ins
+
+LOCAL_SCHEMA_SQL = """
+create table if not exists coupons (
+    id text primary key,
+    code text unique not null,
+    name text,
+    description text,
+    discount_type text,
+    discount_value real not null default 0,
+    minimum_spend real,
+    expiry_date text,
+    is_used integer not null default 0,
+    used_at text,
+    qr_code_data text,
+    short_url text unique,
+    assigned_to_email text,
+    is_assigned integer not null default 0,
+    created_at text,
+    updated_at text
+);
+create table if not exists referrals (
+    id text primary key,
+    referrer_email text,
+    referee_email text,
+    coupon_id text references coupons(id),
+    discount_applied real,
+    discount_type text,
+    referrer_gets_reward integer default 0,
+    referrer_reward_coupon_id text references coupons(id),
+    referrer_reward_value real,
+    redeemed_at text,
+    created_at text,
+    updated_at text,
+    notes text
+);
+"""
+
+LOCAL_COUPON_ANALYTICS_SQL = """
+with referral_ids as (
+    select distinct coupon_id from referrals where coupon_id is not null
+),
+c as (
+    select c.is_used,
+           c.discount_value,
+           (c.expiry_date is not null and julianday(c.expiry_date) <= julianday(:now)) as is_expired,
+           (r.coupon_id is not null) as is_referral
+    from coupons c
+    left join referral_ids r on r.coupon_id = c.id
+)
+select count(*)                                                              as total_coupons,
+       coalesce(sum(is_used), 0)                                             as used_coupons,
+       coalesce(sum(not is_used and is_expired), 0)                          as expired_coupons,
+       coalesce(sum(not is_used and not is_expired), 0)                      as active_coupons,
+       coalesce(sum(case when not is_used and not is_expired
+                         then discount_value else 0 end), 0)                 as total_value,
+       coalesce(sum(case when not is_used and is_expired
+                         then discount_value else 0 end), 0)                 as expired_value,
+       coalesce(sum(not is_referral), 0)                                     as gift_coupons,
+       coalesce(sum(not is_referral and is_used), 0)                         as gift_used,
+       coalesce(sum(is_referral), 0)                                         as referral_coupons,
+       coalesce(sum(is_referral and is_used), 0)                             as referral_used
+from c
+"""
+
+
+def create_local_schema(conn: sqlite3.Connection) -> None:
+    """Create the coupon tables in a local SQLite database"""
+    conn.executescript(LOCAL_SCHEMA_SQL)
+
+
+def local_coupon_analytics(conn: sqlite3.Connection, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """SQLite equivalent of the coupon_analytics() RPC"""
+    now = now or datetime.now(timezone.utc)
+    cursor = conn.execute(LOCAL_COUPON_ANALYTICS_SQL, {'now': now.isoformat()})
+    columns = [column[0] for column in cursor.description]
+    return dict(zip(columns, cursor.fetchone()))
+
+
+LOCAL_REDEEM_COUPON_SQL = """
+update coupons
+   set is_used = 1, used_at = :now, updated_at = :now
+ where id = :coupon_id
+   and not is_used
+   and (expiry_date is null or julianday(expiry_date) > julianday(:now))
+returning *
+"""
+
+
+def local_redeem_coupon(conn: sqlite3.Connection, coupon_id: str,
+                        now: Optional[datetime] = None) -> Dict[str, Any]:
+    """SQLite equivalent of the redeem_coupon() RPC"""
+    now = now or datetime.now(timezone.utc)
+    params = {'coupon_id': coupon_id, 'now': now.isoformat()}
+    with conn:
+        cursor = conn.execute(LOCAL_REDEEM_COUPON_SQL, params)
+        row = cursor.fetchone()
+        columns = [column[0] for column in cursor.description]
+    if row:
+        return {'outcome': REDEEMED, 'coupon': dict(zip(columns, row))}
+
+    cursor = conn.execute('select * from coupons where id = :coupon_id', params)
+    row = cursor.fetchone()
+    if not row:
+        return {'outcome': NOT_FOUND, 'coupon': None}
+    coupon = dict(zip([column[0] for column in cursor.description], row))
+    return {'outcome': ALREADY_USED if coupon['is_used'] else EXPIRED, 'coupon': coupon}
+
+
+def _insert_local_rows(conn: sqlite3.Connection, table: str, rows) -> None:
+    columns = [column[1] for column in conn.execute(f'pragma table_info({table})')]
+    for row in rows:
+        present = [column for column in columns if column in row]
+        conn.execute(
+            f"insert into {table} ({', '.join(present)}) values ({', '.join(':' + c for c in present)})",
+            {column: row[column] for column in present})
+
+
+def _local_row(conn: sqlite3.Connection, table: str, row_id: str) -> Optional[Dict[str, Any]]:
+    cursor = conn.execute(f'select * from {table} where id = ?', (row_id,))
+    row = cursor.fetchone()
+    return dict(zip([column[0] for column in cursor.description], row)) if row else None
+
+
+def local_create_referral_bundles(conn: sqlite3.Connection, bundles) -> Dict[str, Any]:
+    """SQLite equivalent of the create_referral_bundles() RPC"""
+    coupons = [coupon for bundle in bundles
+               for coupon in (bundle['referee_coupon'], bundle.get('referrer_coupon')) if coupon]
+    with conn:
+        _insert_local_rows(conn, 'coupons', coupons)
+        _insert_local_rows(conn, 'referrals', [bundle['referral'] for bundle in bundles])
+    return {'created_count': len(bundles), 'coupon_count': len(coupons)}
+
+
+def local_create_referral_bundle(conn: sqlite3.Connection, bundle: Dict[str, Any]) -> Dict[str, Any]:
+    """SQLite equivalent of the create_referral_bundle() RPC"""
+    local_create_referral_bundles(conn, [bundle])
+    referrer = bundle.get('referrer_coupon')
+    return {
+        'referee_coupon': _local_row(conn, 'coupons', bundle['referee_coupon']['id']),
+        'referrer_coupon': _local_row(conn, 'coupons', referrer['id']) if referrer else None,
+        'referral': _local_row(conn, 'referrals', bundle['referral']['id'])
+    }
+
+
+# Result shaping
+
+EMPTY_ANALYTICS_COUNTS = {
+    'total_coupons': 0,
+    'used_coupons': 0,
+    'expired_coupons': 0,
+    'active_coupons': 0,
+    'total_value': 0,
+    'expired_value': 0,
+    'gift_coupons': 0,
+    'gift_used': 0,
+    'referral_coupons': 0,
+    'referral_used': 0
+}
+
+
+def rpc_row(data: Any) -> Optional[Dict[str, Any]]:
+    """The row of a one-row setof RPC result, or None if it returned no rows"""
+    return data[0] if data else None
+
+
+def analytics_from_counts(counts: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Turn the raw counts returned by coupon_analytics() into the analytics dict"""
+    counts = {**EMPTY_ANALYTICS_COUNTS, **(counts or {})}
+
+    total_coupons = int(counts['total_coupons'])
+    used_coupons = int(counts['used_coupons'])
+    gift_coupons = int(counts['gift_coupons'])
+    referral_coupons = int(counts['referral_coupons'])
+
+    gift_redemption_rate = (int(counts['gift_used']) / gift_coupons * 100) if gift_coupons > 0 else 0
+    referral_redemption_rate = (int(counts['referral_used']) / referral_coupons * 100) if referral_coupons > 0 else 0
+    overall_redemption_rate = (used_coupons / total_coupons * 100) if total_coupons > 0 else 0
+
+    return {
+        'total_coupons': total_coupons,
+        'active_coupons': int(counts['active_coupons']),
+        'used_coupons': used_coupons,
+        'expired_coupons': int(counts['expired_coupons']),
+        'total_value': round(float(counts['total_value']), 2),
+        'gift_coupons': gift_coupons,
+        'referral_coupons': referral_coupons,
+        'gift_redemption_rate': round(gift_redemption_rate, 1),
+        'referral_redemption_rate': round(referral_redemption_rate, 1),
+        'overall_redemption_rate': round(overall_redemption_rate, 1)
+    }
+
+
+if __name__ == '__main__':
+    print('\n'.join(ALL_FUNCTIONS))
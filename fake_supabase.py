@@ -0,0 +1,661 @@
+# fake_supabase.py - In-memory stand-in for the Supabase client
+#
+# Implements the part of the supabase-py surface this codebase uses:
+# table()/from_() with select, insert, upsert, update and delete; the eq, neq,
+# gt, gte, lt, lte, is_, in_, not_ and or_ filters; order and limit; and rpc()
+# for the functions in db_functions.py. Every execute() is counted and can be
+# delayed to model a network round trip, so benchmarks see both the app's own
+# cost and how many backend calls a route makes.
+#     client = FakeSupabaseClient(latency=0.002)
+#     client.seed('coupons', rows)
+#     coupon_manager.supabase = client
+# Unique constraints raise FakeAPIError with the Postgres error codes the app
+# checks for (23505 duplicate key, 22P02 malformed uuid). Each statement and
+# RPC runs under one lock, so it is atomic across threads as it is in Postgres.
+# Response data must be a list of rows, as the pinned postgrest client
+# requires, so an RPC returning any other shape fails here as it does there.
+
+import heapq
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from coupon_stats import STATS_FIELDS
+from coupon_validity import is_expired, parse_timestamp
+from db_functions import ALREADY_USED, EXPIRED, NOT_FOUND, REDEEMED
+
+# Per-table constraints, mirroring the Supabase schema
+UNIQUE_COLUMNS = {
+    'coupons': ('code', 'short_url'),
+    'coupon_usage_tracking': ('coupon_code',),
+    'shopify_orders': ('shopify_order_id',),
+}
+INDEXED_COLUMNS = {
+    'coupons': ('assigned_to_email',),
+    'referrals': ('coupon_id', 'referrer_email', 'referee_email'),
+}
+UUID_COLUMNS = {
+    'coupons': ('id',),
+    'referrals': ('id', 'coupon_id', 'referrer_reward_coupon_id'),
+    'coupon_usage_tracking': ('id',),
+}
+TIMESTAMP_COLUMNS = frozenset((
+    'created_at', 'updated_at', 'expiry_date', 'used_at', 'redeemed_at', 'last_used', 'reconciled_at'
+))
+DEFAULTS = {
+    'coupons': {'is_used': False, 'is_assigned': False},
+}
+TIMESTAMPED_TABLES = frozenset(('coupons', 'referrals', 'coupon_usage_tracking', 'shopify_orders', 'shopify_config'))
+# Tables whose updated_at is set by the database on every write (db_functions.COUPON_CHANGES_SQL)
+TOUCHED_TABLES = frozenset(('coupons',))
+
+Predicate = Callable[[Dict[str, Any]], bool]
+
+
+class FakeAPIError(Exception):
+    """Shaped like postgrest.exceptions.APIError: code, message, details, hint"""
+
+    def __init__(self, code: str, message: str, details: Optional[str] = None):
+        super().__init__(f"{code}: {message}")
+        self.code = code
+        self.message = message
+        self.details = details
+        self.hint = None
+
+
+class FakeResponse:
+    """Shaped like postgrest.APIResponse, which only accepts a list of row objects as data"""
+
+    def __init__(self, data: Any, count: Optional[int] = None):
+        if not isinstance(data, list) or not all(isinstance(row, dict) for row in data):
+            raise ValueError(f"APIResponse.data must be a list of rows, got {type(data).__name__}")
+        self.data = data
+        self.count = count
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec='microseconds')
+
+
+def _normalize_timestamp(value: Any) -> Any:
+    """Store timestamps the way Postgres returns timestamptz, so strings sort by time"""
+    epoch = parse_timestamp(value) if isinstance(value, (str, datetime)) else None
+    if epoch is None:
+        return value
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat(timespec='microseconds')
+
+
+def _is_uuid(value: Any) -> bool:
+    try:
+        uuid.UUID(str(value))
+        return True
+    except ValueError:
+        return False
+
+
+def _coerce(stored: Any, value: Any) -> Any:
+    """Convert a filter value (often a string from or_()) to the stored value's type"""
+    if isinstance(value, str):
+        if isinstance(stored, bool):
+            return value.lower() == 'true'
+        if isinstance(stored, (int, float)):
+            return float(value)
+    return value
+
+
+def _compare(op: str, stored: Any, value: Any) -> bool:
+    if op == 'is':
+        expected = {'null': None, 'true': True, 'false': False}.get(str(value).lower(), value)
+        return stored is expected
+    if stored is None:
+        return False  # NULL compares as unknown
+    if op == 'in':
+        return any(stored == _coerce(stored, item) for item in value)
+    value = _coerce(stored, value)
+    if op == 'eq':
+        return stored == value
+    if op == 'neq':
+        return stored != value
+    if op == 'gt':
+        return stored > value
+    if op == 'gte':
+        return stored >= value
+    if op == 'lt':
+        return stored < value
+    if op == 'lte':
+        return stored <= value
+    raise FakeAPIError('PGRST100', f'unsupported operator: {op}')
+
+
+def _split_top_level(text: str) -> List[str]:
+    parts, current, depth, quoted = [], '', 0, False
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == '(':
+            depth += 1
+        elif not quoted and char == ')':
+            depth -= 1
+        if char == ',' and depth == 0 and not quoted:
+            parts.append(current)
+            current = ''
+        else:
+            current += char
+    parts.append(current)
+    return [part.strip() for part in parts if part.strip()]
+
+
+def _parse_condition(text: str) -> Predicate:
+    """Parse one PostgREST logic-tree term, e.g. `and(created_at.eq."...",id.lt.x)`"""
+    for group, combine in (('and(', all), ('or(', any)):
+        if text.startswith(group) and text.endswith(')'):
+            terms = [_parse_condition(term) for term in _split_top_level(text[len(group):-1])]
+            return lambda row: combine(term(row) for term in terms)
+
+    column, op, value = text.split('.', 2)
+    negate = op == 'not'
+    if negate:
+        op, value = value.split('.', 1)
+    if op == 'in':
+        value = [item.strip('"') for item in _split_top_level(value.strip('()'))]
+    else:
+        value = value.strip('"')
+    if column in TIMESTAMP_COLUMNS and op not in ('is', 'in'):
+        value = _normalize_timestamp(value)
+    return lambda row: _compare(op, row.get(column), value) != negate
+
+
+class FakeTable:
+    """Rows keyed by primary key, with hash indexes for unique and lookup columns"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.rows: Dict[Any, Dict[str, Any]] = {}
+        self.unique = {column: {} for column in UNIQUE_COLUMNS.get(name, ())}
+        self.indexes = {column: {} for column in INDEXED_COLUMNS.get(name, ())}
+        self.uuid_columns = UUID_COLUMNS.get(name, ())
+
+    def candidates(self, column: str, value: Any) -> Optional[Iterable[Dict[str, Any]]]:
+        """Rows that can match column = value, or None if no index covers it"""
+        if column == 'id':
+            row = self.rows.get(value)
+            return [row] if row else []
+        if column in self.unique:
+            key = self.unique[column].get(value)
+            return [self.rows[key]] if key is not None else []
+        if column in self.indexes:
+            return [self.rows[key] for key in self.indexes[column].get(value, ())]
+        return None
+
+    def prepare(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        prepared = dict(DEFAULTS.get(self.name, {}))
+        prepared.update({column: _normalize_timestamp(value) if column in TIMESTAMP_COLUMNS else value
+                         for column, value in row.items()})
+        if prepared.get('id') is None:
+            prepared['id'] = str(uuid.uuid4())
+        if self.name in TIMESTAMPED_TABLES:
+            prepared.setdefault('created_at', _now())
+            prepared.setdefault('updated_at', prepared['created_at'])
+        if self.name in TOUCHED_TABLES:
+            prepared['updated_at'] = _now()
+        return prepared
+
+    def _check_unique(self, rows: List[Dict[str, Any]], replacing: Iterable[Any] = ()) -> None:
+        replacing = set(replacing)
+        columns = ['id'] + list(self.unique)
+        for column in columns:
+            seen = set()
+            for row in rows:
+                value = row.get(column)
+                if value is None:
+                    continue
+                existing = self.rows.get(value, {}).get('id') if column == 'id' else self.unique[column].get(value)
+                if value in seen or (existing is not None and existing not in replacing):
+                    raise FakeAPIError('23505', f'duplicate key value violates unique constraint '
+                                                f'"{self.name}_{column}_key"',
+                                       f'Key ({column})=({value}) already exists.')
+                seen.add(value)
+
+    def _index(self, row: Dict[str, Any], sign: int) -> None:
+        for column, index in self.unique.items():
+            value = row.get(column)
+            if value is not None:
+                if sign > 0:
+                    index[value] = row['id']
+                else:
+                    index.pop(value, None)
+        for column, index in self.indexes.items():
+            value = row.get(column)
+            if sign > 0:
+                index.setdefault(value, set()).add(row['id'])
+            elif value in index:
+                index[value].discard(row['id'])
+
+    def insert(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert all rows or none of them"""
+        rows = [self.prepare(row) for row in rows]
+        self._check_unique(rows)
+        for row in rows:
+            self.rows[row['id']] = row
+            self._index(row, 1)
+        return rows
+
+    def update(self, rows: List[Dict[str, Any]], values: Dict[str, Any]) -> List[Dict[str, Any]]:
+        values = {column: _normalize_timestamp(value) if column in TIMESTAMP_COLUMNS else value
+                  for column, value in values.items()}
+        if self.name in TOUCHED_TABLES:
+            values['updated_at'] = _now()
+        updated = [dict(row, **values) for row in rows]
+        self._check_unique(updated, replacing=[row['id'] for row in rows])
+        for old in rows:
+            self._index(old, -1)
+            del self.rows[old['id']]
+        for new in updated:
+            self.rows[new['id']] = new
+            self._index(new, 1)
+        return updated
+
+    def delete(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        for row in rows:
+            self._index(row, -1)
+            del self.rows[row['id']]
+        return rows
+
+
+class FakeQuery:
+    """Chainable builder ending in execute(), like postgrest's request builders"""
+
+    def __init__(self, client: 'FakeSupabaseClient', table: str):
+        self.client = client
+        self.table_name = table
+        self.operation = 'select'
+        self.columns = '*'
+        self.count_mode = None
+        self.payload: Any = None
+        self.returning = 'representation'
+        self.on_conflict = None
+        self.filters: List[Predicate] = []
+        self.lookups: List[Tuple[str, List[Any]]] = []
+        self.ordering: List[Tuple[str, bool]] = []
+        self.row_limit: Optional[int] = None
+        self.negate_next = False
+
+    # Operations
+
+    def select(self, *columns: str, count: Optional[str] = None) -> 'FakeQuery':
+        self.columns = ','.join(columns) or '*'
+        self.count_mode = count
+        return self
+
+    def insert(self, rows, returning: str = 'representation', **kwargs) -> 'FakeQuery':
+        self.operation, self.payload, self.returning = 'insert', rows, returning
+        return self
+
+    def upsert(self, rows, on_conflict: str = 'id', returning: str = 'representation', **kwargs) -> 'FakeQuery':
+        self.operation, self.payload, self.returning = 'upsert', rows, returning
+        self.on_conflict = on_conflict
+        return self
+
+    def update(self, values: Dict[str, Any], **kwargs) -> 'FakeQuery':
+        self.operation, self.payload = 'update', values
+        return self
+
+    def delete(self, **kwargs) -> 'FakeQuery':
+        self.operation = 'delete'
+        return self
+
+    # Filters
+
+    @property
+    def not_(self) -> 'FakeQuery':
+        self.negate_next = True
+        return self
+
+    def _filter(self, op: str, column: str, value: Any) -> 'FakeQuery':
+        negate, self.negate_next = self.negate_next, False
+        if column in self.client.table_for(self.table_name).uuid_columns and op in ('eq', 'neq', 'in'):
+            for item in (value if op == 'in' else [value]):
+                if not _is_uuid(item):
+                    raise FakeAPIError('22P02', f'invalid input syntax for type uuid: "{item}"')
+        if column in TIMESTAMP_COLUMNS and op not in ('is', 'in'):
+            value = _normalize_timestamp(value)
+        if op in ('eq', 'in') and not negate:
+            self.lookups.append((column, value if op == 'in' else [value]))
+        self.filters.append(lambda row: _compare(op, row.get(column), value) != negate)
+        return self
+
+    def eq(self, column: str, value: Any) -> 'FakeQuery':
+        return self._filter('eq', column, value)
+
+    def neq(self, column: str, value: Any) -> 'FakeQuery':
+        return self._filter('neq', column, value)
+
+    def gt(self, column: str, value: Any) -> 'FakeQuery':
+        return self._filter('gt', column, value)
+
+    def gte(self, column: str, value: Any) -> 'FakeQuery':
+        return self._filter('gte', column, value)
+
+    def lt(self, column: str, value: Any) -> 'FakeQuery':
+        return self._filter('lt', column, value)
+
+    def lte(self, column: str, value: Any) -> 'FakeQuery':
+        return self._filter('lte', column, value)
+
+    def is_(self, column: str, value: Any) -> 'FakeQuery':
+        return self._filter('is', column, value)
+
+    def in_(self, column: str, values: Iterable[Any]) -> 'FakeQuery':
+        return self._filter('in', column, list(values))
+
+    def or_(self, filters: str, reference_table: Optional[str] = None) -> 'FakeQuery':
+        terms = [_parse_condition(term) for term in _split_top_level(filters)]
+        negate, self.negate_next = self.negate_next, False
+        self.filters.append(lambda row: any(term(row) for term in terms) != negate)
+        return self
+
+    # Modifiers
+
+    def order(self, column: str, desc: bool = False, **kwargs) -> 'FakeQuery':
+        self.ordering.append((column, desc))
+        return self
+
+    def limit(self, size: int, **kwargs) -> 'FakeQuery':
+        self.row_limit = size
+        return self
+
+    # Execution
+
+    def _matching(self, table: FakeTable) -> List[Dict[str, Any]]:
+        rows: Optional[Iterable[Dict[str, Any]]] = None
+        for column, values in self.lookups:
+            found = {}
+            for value in values:
+                matches = table.candidates(column, value)
+                if matches is None:
+                    break
+                found.update((row['id'], row) for row in matches)
+            else:
+                rows = found.values()
+                break
+        if rows is None:
+            rows = table.rows.values()
+        return [row for row in rows if all(test(row) for test in self.filters)]
+
+    def _sorted(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not self.ordering:
+            return rows[:self.row_limit] if self.row_limit is not None else rows
+
+        # Postgres puts NULLs last ascending and first descending
+        def key(row):
+            return tuple((row.get(column) is None, row.get(column)) for column, _ in self.ordering)
+
+        directions = {desc for _, desc in self.ordering}
+        if len(directions) == 1 and self.row_limit is not None:
+            pick = heapq.nlargest if directions.pop() else heapq.nsmallest
+            return pick(self.row_limit, rows, key=key)
+        for column, desc in reversed(self.ordering):
+            rows = sorted(rows, key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+        return rows[:self.row_limit] if self.row_limit is not None else rows
+
+    def _project(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        columns = [column.strip() for column in self.columns.split(',') if column.strip()]
+        if '*' in columns:
+            return [dict(row) for row in rows]
+        columns = [column for column in columns if '(' not in column]
+        return [{column: row.get(column) for column in columns} for row in rows]
+
+    def _write(self, table: FakeTable) -> List[Dict[str, Any]]:
+        if self.operation == 'insert':
+            return table.insert(self.payload if isinstance(self.payload, list) else [self.payload])
+        if self.operation == 'upsert':
+            written = []
+            for row in self.payload if isinstance(self.payload, list) else [self.payload]:
+                value = row.get(self.on_conflict)
+                existing = table.candidates(self.on_conflict, value)
+                if existing is None:
+                    existing = [r for r in table.rows.values() if r.get(self.on_conflict) == value]
+                written.extend(table.update(existing, row) if existing else table.insert([row]))
+            return written
+        if self.operation == 'update':
+            return table.update(self._matching(table), self.payload)
+        return table.delete(self._matching(table))
+
+    def execute(self) -> FakeResponse:
+        self.client.record(self.operation, self.table_name)
+        with self.client.lock:
+            table = self.client.table_for(self.table_name)
+
+            if self.operation != 'select':
+                rows = self._write(table)
+                self.client.record_tombstones(self.table_name, self.operation, rows)
+                minimal = self.operation in ('insert', 'upsert') and self.returning == 'minimal'
+                return FakeResponse([] if minimal else [dict(row) for row in rows])
+
+            rows = self._matching(table)
+            count = len(rows) if self.count_mode else None
+            return FakeResponse(self._project(self._sorted(rows)), count)
+
+
+class FakeRPC:
+    def __init__(self, client: 'FakeSupabaseClient', name: str, params: Dict[str, Any]):
+        self.client = client
+        self.name = name
+        self.params = params or {}
+
+    def execute(self) -> FakeResponse:
+        self.client.record('rpc', self.name)
+        handler = getattr(self.client, f'_rpc_{self.name}', None)
+        if handler is None:
+            raise FakeAPIError('PGRST202', f'Could not find the function public.{self.name}')
+        with self.client.lock:
+            return FakeResponse(handler(**self.params))
+
+
+class FakeSupabaseClient:
+    """In-process Supabase client with optional per-call latency and call counters"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.lock = threading.RLock()
+        self.tables: Dict[str, FakeTable] = {}
+        self.calls: Counter = Counter()
+        stats = dict.fromkeys(STATS_FIELDS, 0)
+        self.table_for('coupon_stats').rows[1] = dict(stats, id=1, generation=0,
+                                                      reconciled_at=None, updated_at=_now())
+        self.table_for('coupon_tombstone_retention').rows[1] = {'id': 1, 'pruned_before': None}
+
+    def table_for(self, name: str) -> FakeTable:
+        if name not in self.tables:
+            self.tables[name] = FakeTable(name)
+        return self.tables[name]
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    from_ = table
+
+    def rpc(self, name: str, params: Optional[Dict[str, Any]] = None) -> FakeRPC:
+        return FakeRPC(self, name, params)
+
+    def record(self, operation: str, target: str) -> None:
+        self.calls[f'{operation} {target}'] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def record_tombstones(self, table: str, operation: str, rows: List[Dict[str, Any]]) -> None:
+        """What the record_coupon_tombstone trigger does for each deleted or inserted coupon"""
+        if table != 'coupons' or operation not in ('insert', 'upsert', 'delete'):
+            return
+        tombstones = self.table_for('coupon_tombstones').rows
+        for row in rows:
+            if operation == 'delete':
+                tombstones[row['id']] = {'id': row['id'], 'code': row.get('code'), 'deleted_at': _now()}
+            else:
+                tombstones.pop(row['id'], None)
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def reset_calls(self) -> None:
+        self.calls.clear()
+
+    def seed(self, name: str, rows: Iterable[Dict[str, Any]]) -> int:
+        """Bulk-load rows without counting calls, then rebuild coupon_stats"""
+        count = len(self.table_for(name).insert(list(rows)))
+        if name in ('coupons', 'referrals'):
+            self._rpc_rebuild_coupon_stats()
+        return count
+
+    # RPC implementations, matching db_functions.py
+
+    def _is_referral(self, coupon_id: str) -> bool:
+        return bool(self.table_for('referrals').indexes['coupon_id'].get(coupon_id))
+
+    def _rpc_coupon_analytics(self) -> List[Dict[str, Any]]:
+        return [self._analytics_counts()]
+
+    def _analytics_counts(self) -> Dict[str, Any]:
+        now = time.time()
+        counts = dict.fromkeys(('total_coupons', 'used_coupons', 'expired_coupons', 'active_coupons',
+                                'gift_coupons', 'gift_used', 'referral_coupons', 'referral_used'), 0)
+        total_value = expired_value = 0.0
+        referral_ids = self.table_for('referrals').indexes['coupon_id']
+        for coupon in self.table_for('coupons').rows.values():
+            kind = 'referral' if referral_ids.get(coupon['id']) else 'gift'
+            counts['total_coupons'] += 1
+            counts[f'{kind}_coupons'] += 1
+            if coupon.get('is_used'):
+                counts['used_coupons'] += 1
+                counts[f'{kind}_used'] += 1
+            elif is_expired(coupon, now):
+                counts['expired_coupons'] += 1
+                expired_value += float(coupon.get('discount_value') or 0)
+            else:
+                counts['active_coupons'] += 1
+                total_value += float(coupon.get('discount_value') or 0)
+        return dict(counts, total_value=total_value, expired_value=expired_value)
+
+    def _rpc_coupon_data_version(self) -> List[Dict[str, Any]]:
+        def newest(table: str, column: str) -> Any:
+            stamps = [row[column] for row in self.table_for(table).rows.values() if row.get(column)]
+            return max(stamps, key=parse_timestamp) if stamps else None
+        return [{'coupons_at': newest('coupons', 'updated_at'),
+                 'deleted_at': newest('coupon_tombstones', 'deleted_at'),
+                 'referrals_at': newest('referrals', 'updated_at'),
+                 'pruned_before': self.table_for('coupon_tombstone_retention').rows[1]['pruned_before'],
+                 'now': _now()}]
+
+    def _rpc_prune_coupon_tombstones(self, p_retention_days: int) -> List[Dict[str, Any]]:
+        retention = self.table_for('coupon_tombstone_retention').rows[1]
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=p_retention_days)).isoformat(timespec='microseconds')
+        if retention['pruned_before'] and parse_timestamp(retention['pruned_before']) > parse_timestamp(cutoff):
+            cutoff = retention['pruned_before']
+        retention['pruned_before'] = cutoff
+        tombstones = self.table_for('coupon_tombstones').rows
+        stale = [key for key, row in tombstones.items() if parse_timestamp(row['deleted_at']) < parse_timestamp(cutoff)]
+        for key in stale:
+            del tombstones[key]
+        return [{'pruned_before': cutoff, 'removed': len(stale)}]
+
+    def _rpc_apply_coupon_stats_delta(self, delta: Dict[str, Any]) -> List[Dict[str, Any]]:
+        stats = self.table_for('coupon_stats').rows.get(1)
+        if stats is None:
+            return []
+        for field in STATS_FIELDS:
+            stats[field] += delta.get(field) or 0
+        stats['generation'] += 1
+        stats['updated_at'] = _now()
+        return [dict(stats)]
+
+    def _rpc_rebuild_coupon_stats(self) -> List[Dict[str, Any]]:
+        stats = self.table_for('coupon_stats').rows[1]
+        before = dict(stats)
+        fresh = self._analytics_counts()
+        stats.update({field: fresh[field] for field in STATS_FIELDS if field in fresh})
+        stats['unused_value'] = fresh['total_value'] + fresh['expired_value']
+        stats['generation'] += 1
+        stats['reconciled_at'] = stats['updated_at'] = _now()
+        return [{'before': before, 'after': dict(stats)}]
+
+    def _rpc_redeem_coupon(self, p_coupon_id: str) -> List[Dict[str, Any]]:
+        return [self._redeem(p_coupon_id)]
+
+    def _redeem(self, p_coupon_id: str) -> Dict[str, Any]:
+        if not _is_uuid(p_coupon_id):
+            raise FakeAPIError('22P02', f'invalid input syntax for type uuid: "{p_coupon_id}"')
+        table = self.table_for('coupons')
+        coupon = table.rows.get(p_coupon_id)
+        if coupon is None:
+            return {'outcome': NOT_FOUND, 'coupon': None}
+        if coupon.get('is_used'):
+            return {'outcome': ALREADY_USED, 'coupon': dict(coupon)}
+        if coupon.get('expiry_date') is not None and is_expired(coupon):
+            return {'outcome': EXPIRED, 'coupon': dict(coupon)}
+
+        now = _now()
+        redeemed = table.update([coupon], {'is_used': True, 'used_at': now, 'updated_at': now})[0]
+        kind = 'referral' if self._is_referral(p_coupon_id) else 'gift'
+        self._rpc_apply_coupon_stats_delta({'used_coupons': 1, f'{kind}_used': 1,
+                                            'unused_value': -float(redeemed.get('discount_value') or 0)})
+        return {'outcome': REDEEMED, 'coupon': dict(redeemed)}
+
+    def _rpc_track_coupon_usage(self, p_coupon_code: str, p_discount: Any, p_order: Any) -> List[Dict[str, Any]]:
+        return self._rpc_track_coupon_usage_batch([{'coupon_code': p_coupon_code, 'discount_amount': p_discount,
+                                             'order_data': p_order}])
+
+    def _rpc_track_coupon_usage_batch(self, p_events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        table = self.table_for('coupon_usage_tracking')
+        now = _now()
+        written: Dict[str, Dict[str, Any]] = {}
+        for event in p_events:
+            code = str(event['coupon_code']).upper()
+            discount = float(event.get('discount_amount') or 0)
+            order = event.get('order_data') or {}
+            existing = table.candidates('coupon_code', code)
+            if not existing:
+                written[code] = table.insert([{'coupon_code': code, 'usage_count': 1, 'total_discount': discount,
+                                               'last_used': now, 'orders_data': [order], 'created_at': now}])[0]
+                continue
+            row = existing[0]
+            orders = row.get('orders_data')
+            orders = orders if isinstance(orders, list) else [orders] if isinstance(orders, dict) else []
+            written[code] = table.update([row], {'usage_count': (row.get('usage_count') or 0) + 1,
+                                                 'total_discount': float(row.get('total_discount') or 0) + discount,
+                                                 'last_used': now, 'orders_data': orders + [order],
+                                                 'updated_at': now})[0]
+        return [dict(row) for row in written.values()]
+
+    def _insert_bundles(self, bundles: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Insert the coupons and referrals of referral bundles as one unit"""
+        coupons = [coupon for bundle in bundles
+                   for coupon in (bundle['referee_coupon'], bundle.get('referrer_coupon')) if coupon]
+        inserted = self.table_for('coupons').insert(coupons)
+        try:
+            referrals = self.table_for('referrals').insert([bundle['referral'] for bundle in bundles])
+        except FakeAPIError:
+            self.table_for('coupons').delete(inserted)
+            raise
+        self._rpc_apply_coupon_stats_delta({
+            'total_coupons': len(inserted),
+            'unused_value': sum(float(coupon.get('discount_value') or 0) for coupon in inserted),
+            'referral_coupons': len(referrals),
+            'gift_coupons': len(inserted) - len(referrals)
+        })
+        return inserted, referrals
+
+    def _rpc_create_referral_bundles(self, p_bundles: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        inserted, referrals = self._insert_bundles(p_bundles)
+        return [{'created_count': len(referrals), 'coupon_count': len(inserted)}]
+
+    def _rpc_create_referral_bundle(self, p_bundle: Dict[str, Any]) -> List[Dict[str, Any]]:
+        inserted, referrals = self._insert_bundles([p_bundle])
+        return [{
+            'referee_coupon': dict(inserted[0]),
+            'referrer_coupon': dict(inserted[1]) if len(inserted) > 1 else None,
+            'referral': dict(referrals[0])
+        }]
@@ -0,0 +1,91 @@
+# fast_json.py - JSON encoding for API responses, orjson when installed
+#
+# orjson serializes coupon rows several times faster than the stdlib encoder
+# and produces bytes directly. Without it the stdlib encoder is used with
+# compact separators. Either way the output matches Flask's default provider:
+# datetimes as HTTP dates, Decimal and UUID as strings, dataclasses as dicts,
+# sorted keys unless JSON_SORT_KEYS is off.
+#     init_fast_json(app)        # register on a Flask app
+#     python benchmark_json.py   # serialization and compression numbers
+
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date, datetime, timezone
+from email.utils import format_datetime
+from typing import Any
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def _http_date(value: date) -> str:
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day, tzinfo=timezone.utc)
+    elif value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def _default(value: Any) -> Any:
+    """Types Flask's default provider knows how to serialize"""
+    if isinstance(value, date):
+        return _http_date(value)
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if hasattr(value, '__html__'):
+        return str(value.__html__())
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+if ORJSON_AVAILABLE:
+    # Datetimes and dataclasses go through _default so output matches the stdlib path
+    _ORJSON_BASE = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+                    | orjson.OPT_NON_STR_KEYS)
+
+
+def dumps_bytes(obj: Any, sort_keys: bool = False, indent: bool = False) -> bytes:
+    """Serialize obj to UTF-8 JSON bytes"""
+    if ORJSON_AVAILABLE:
+        option = _ORJSON_BASE
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_default, option=option)
+    if indent:
+        return json.dumps(obj, default=_default, sort_keys=sort_keys, indent=2, ensure_ascii=False).encode()
+    return json.dumps(obj, default=_default, sort_keys=sort_keys, separators=(',', ':'),
+                      ensure_ascii=False).encode()
+
+
+def loads(data: Any) -> Any:
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def init_fast_json(app) -> None:
+    """Use dumps_bytes()/loads() for jsonify, request.get_json and app.json"""
+    from flask.json.provider import DefaultJSONProvider
+
+    class FastJSONProvider(DefaultJSONProvider):
+        def dumps(self, obj: Any, **kwargs: Any) -> str:
+            return dumps_bytes(obj, sort_keys=kwargs.get('sort_keys', self.sort_keys)).decode()
+
+        def loads(self, s: Any, **kwargs: Any) -> Any:
+            return loads(s)
+
+        def response(self, *args: Any, **kwargs: Any):
+            obj = self._prepare_response_obj(args, kwargs)
+            indent = self.compact is False or (self.compact is None and self._app.debug)
+            body = dumps_bytes(obj, sort_keys=self.sort_keys, indent=indent) + b'\n'
+            return self._app.response_class(body, mimetype=self.mimetype)
+
+    app.json = FastJSONProvider(app)
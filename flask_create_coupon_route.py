@@ -1,6 +1,9 @@
 from flask import request, redirect, url_for, flash
 from datetime import datetime
 
+from coupon_import import CouponImporter
+from coupon_report import iter_report_csv, parse_report_columns, parse_report_filters
+
 @app.route('/admin/create-coupon', methods=['POST'])
 def create_coupon():
     try:
@@ -24,7 +27,7 @@ def create_coupon():
         expiry_date = datetime.strptime(expiry_date, '%Y-%m-%d').date() if expiry_date else None
         
         # Check if coupon code already exists
-        existing_coupon = supabase.table('coupons').select('*').eq('code', code).execute()
+        existing_coupon = supabase.table('coupons').select('id').eq('code', code).execute()
         if existing_coupon.data:
             flash(f'Coupon code "{code}" already exists!', 'error')
             return redirect(url_for('admin'))
@@ -46,6 +49,8 @@ def create_coupon():
         
         # Insert into database
         result = supabase.table('coupons').insert(coupon_data).execute()
+        coupon_manager.cache.invalidate(code=coupon_data['code'])
+        coupon_manager.stats.record_created(result.data or [])
         
         if result.data:
             flash(f'Coupon "{code}" created successfully!', 'success')
@@ -87,54 +92,16 @@ def bulk_import_coupons():
             flash('Please upload a CSV file!', 'error')
             return redirect(url_for('admin'))
         
-        # Read CSV file
-        import csv
-        import io
-        
-        stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
-        csv_reader = csv.DictReader(stream)
+        # Stream the CSV in batches: one existence prefetch and one insert per batch
+        def invalidate_codes(rows):
+            for row in rows:
+                coupon_manager.cache.invalidate(code=row['code'])
         
-        success_count = 0
-        error_count = 0
-        
-        for row in csv_reader:
-            try:
-                # Check if required fields are present
-                if not all(key in row for key in ['code', 'discount_type', 'discount_value']):
-                    error_count += 1
-                    continue
-                
-                # Check if coupon already exists
-                existing = supabase.table('coupons').select('*').eq('code', row['code'].upper()).execute()
-                if existing.data:
-                    error_count += 1
-                    continue
-                
-                # Prepare coupon data
-                coupon_data = {
-                    'code': row['code'].upper(),
-                    'description': row.get('description', ''),
-                    'discount_type': row['discount_type'],
-                    'discount_value': float(row['discount_value']),
-                    'usage_limit': int(row['usage_limit']) if row.get('usage_limit') else None,
-                    'usage_count': 0,
-                    'expiry_date': datetime.strptime(row['expiry_date'], '%Y-%m-%d').date().isoformat() if row.get('expiry_date') else None,
-                    'minimum_order_value': float(row.get('minimum_order_value', 0)),
-                    'status': 'active',
-                    'created_at': datetime.now().isoformat(),
-                    'updated_at': datetime.now().isoformat()
-                }
-                
-                # Insert coupon
-                result = supabase.table('coupons').insert(coupon_data).execute()
-                if result.data:
-                    success_count += 1
-                else:
-                    error_count += 1
-                    
-            except Exception as e:
-                print(f"Error importing row {row}: {e}")
-                error_count += 1
+        importer = CouponImporter(supabase, batch_size=Config.IMPORT_BATCH_SIZE,
+                                  on_inserted=invalidate_codes)
+        result = importer.run(file.stream)
+        success_count = result['success_count']
+        error_count = result['error_count']
         
         if success_count > 0:
             flash(f'Successfully imported {success_count} coupons!', 'success')
@@ -150,6 +117,8 @@ def bulk_import_coupons():
         
         if error_count > 0:
             flash(f'{error_count} coupons failed to import (duplicates or invalid data)', 'warning')
+            for error in result['errors'][:10]:
+                flash(f"Line {error['line']} ({error['code'] or 'no code'}): {error['error']}", 'warning')
             
     except Exception as e:
         print(f"Error in bulk import: {e}")
@@ -161,46 +130,25 @@ def bulk_import_coupons():
 @app.route('/admin/generate-report')
 def generate_report():
     try:
-        # Get all coupons with their usage data
-        coupons = supabase.table('coupons').select('*').execute()
-        
-        # Create a simple CSV report
-        import csv
-        import io
-        from flask import Response
-        
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        writer.writerow([
-            'Code', 'Description', 'Type', 'Value', 'Usage Count', 
-            'Usage Limit', 'Status', 'Expiry Date', 'Created Date'
-        ])
-        
-        # Write coupon data
-        for coupon in coupons.data:
-            writer.writerow([
-                coupon['code'],
-                coupon.get('description', ''),
-                coupon['discount_type'],
-                coupon['discount_value'],
-                coupon.get('usage_count', 0),
-                coupon.get('usage_limit', 'Unlimited'),
-                coupon['status'],
-                coupon.get('expiry_date', 'No expiry'),
-                coupon.get('created_at', '')
-            ])
-        
-        output.seek(0)
-        
-        return Response(
-            output.getvalue(),
-            mimetype='text/csv',
-            headers={'Content-Disposition': f'attachment; filename=coupon_report_{datetime.now().strftime("%Y%m%d")}.csv'}
-        )
-        
+        columns = parse_report_columns(request.args.get('columns'))
+        filters = parse_report_filters(request.args)
+    except ValueError as e:
+        flash(f'Invalid report options: {e}', 'error')
+        return redirect(url_for('admin'))
+    
+    # Stream the CSV page by page instead of building it in memory
+    from flask import Response, stream_with_context
+    
+    try:
+        # Reads the first page now, while a failure can still redirect
+        chunks = iter_report_csv(supabase, columns, filters, Config.REPORT_PAGE_SIZE)
     except Exception as e:
         print(f"Error generating report: {e}")
         flash('Error generating report!', 'error')
-        return redirect(url_for('admin'))
\ No newline at end of file
+        return redirect(url_for('admin'))
+    
+    return Response(
+        stream_with_context(chunks),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename=coupon_report_{datetime.now().strftime("%Y%m%d")}.csv'}
+    )
@@ -0,0 +1,66 @@
+# lint_routes.py - Guard against whole-table scans in per-item request handlers
+#
+# A route whose URL contains a <parameter> serves a single coupon (or user), so
+# it must look the item up by key instead of calling get_all_coupons() and
+# scanning the result. Run as:
+#     python lint_routes.py [files...]
+# Exits non-zero when a handler breaks the rule.
+
+import ast
+import os
+import sys
+from typing import List, Optional, Tuple
+
+FORBIDDEN_CALLS = {'get_all_coupons'}
+
+DEFAULT_PATHS = ['app.py', 'updated_app_routes.py', 'additional_admin_routes.py',
+                 'flask_create_coupon_route.py']
+
+
+def _route_paths(function: ast.FunctionDef) -> List[str]:
+    paths = []
+    for decorator in function.decorator_list:
+        if (isinstance(decorator, ast.Call)
+                and isinstance(decorator.func, ast.Attribute)
+                and decorator.func.attr == 'route'
+                and decorator.args
+                and isinstance(decorator.args[0], ast.Constant)
+                and isinstance(decorator.args[0].value, str)):
+            paths.append(decorator.args[0].value)
+    return paths
+
+
+def check_source(source: str, filename: str = '<source>') -> List[Tuple[str, int, str]]:
+    """Return (filename, line, message) for every per-item handler that scans"""
+    problems = []
+    for node in ast.walk(ast.parse(source, filename)):
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        per_item_paths = [path for path in _route_paths(node) if '<' in path]
+        if not per_item_paths:
+            continue
+        for call in ast.walk(node):
+            if (isinstance(call, ast.Call)
+                    and isinstance(call.func, ast.Attribute)
+                    and call.func.attr in FORBIDDEN_CALLS):
+                problems.append((filename, call.lineno,
+                                 f"{node.name} ({per_item_paths[0]}) calls {call.func.attr}(); "
+                                 f"use an indexed lookup such as get_coupon_by_id()"))
+    return problems
+
+
+def main(paths: Optional[List[str]] = None) -> int:
+    if not paths:
+        here = os.path.dirname(os.path.abspath(__file__))
+        paths = [os.path.join(here, path) for path in DEFAULT_PATHS]
+    problems = []
+    for path in paths:
+        with open(path, encoding='utf-8') as handle:
+            problems.extend(check_source(handle.read(), path))
+    for filename, line, message in problems:
+        print(f"{filename}:{line}: {message}")
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -1,10 +1,17 @@
 # Add these imports and initialization to your existing app.py
 
+import click
 from flask import Flask
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from config import config
 from supabase_service import supabase_service
+from coupon_codes import mint_coupons
+from fast_json import init_fast_json
+from compression import init_compression
+from metrics import init_metrics
+from query_tracer import init_query_tracer
+from request_loader import init_request_loader
 import os
 from dotenv import load_dotenv
 
@@ -23,13 +30,79 @@ def create_app(config_name=None):
     
     # Initialize extensions
     CORS(app)
+    init_fast_json(app)
+    init_metrics(app)
+    init_compression(app, app.config['COMPRESSION_MIN_SIZE'], app.config['COMPRESSION_GZIP_LEVEL'],
+                     app.config['COMPRESSION_BROTLI_QUALITY'])
+    init_query_tracer(app, app.config.get('QUERY_TRACE', False))
+    init_request_loader(app)
     
     # Initialize Supabase
     supabase_service.init_app(app)
     
+    # Storage used by the hot-path routes (see coupon_storage.get_storage)
+    if app.config.get('STORAGE_BACKEND') == 'sqlalchemy':
+        from sqlalchemy_storage import SQLAlchemyStorage
+        app.extensions['coupon_storage'] = SQLAlchemyStorage.from_config(app.config)
+    else:
+        app.extensions['coupon_storage'] = supabase_service
+    
     # Optional: Initialize SQLAlchemy if you want to use both
     # db.init_app(app)
     
+    @app.cli.command('create-storage-schema')
+    def create_storage_schema():
+        """Create the SQLAlchemy storage tables and the coupon_stats row; run once per deploy, not on start"""
+        from sqlalchemy_storage import SQLAlchemyStorage
+        SQLAlchemyStorage.from_config(app.config).create_schema()
+        print('storage schema is in place')
+    
+    @app.cli.command('mint-coupons')
+    @click.option('--count', type=click.IntRange(min=1), required=True)
+    @click.option('--name', required=True)
+    @click.option('--discount-type', required=True)
+    @click.option('--discount-value', type=float, required=True)
+    @click.option('--expiry-date', required=True)
+    @click.option('--description')
+    @click.option('--minimum-spend', type=float)
+    @click.option('--chunk-size', type=int, default=lambda: app.config['MINT_CHUNK_SIZE'])
+    def mint_campaign(count, name, discount_type, discount_value, expiry_date, description, minimum_spend,
+                      chunk_size):
+        """Mint a campaign of any size (10k-1M+) chunk by chunk, outside the request cap"""
+        template = {
+            'name': name,
+            'description': description,
+            'discount_type': discount_type,
+            'discount_value': discount_value,
+            'minimum_spend': minimum_spend,
+            'expiry_date': expiry_date,
+            'is_assigned': False
+        }
+        progress = {'created': 0}
+        
+        def report(rows):
+            supabase_service.stats.record_created(rows)
+            progress['created'] += len(rows)
+            print(f"{progress['created']}/{count} minted")
+        
+        result = mint_coupons(supabase_service.client, template, count, chunk_size, on_inserted=report)
+        print(f"created {result['created_count']} of {count}; {len(result['failed_codes'])} codes failed")
+    
+    @app.cli.command('prune-coupon-tombstones')
+    def prune_coupon_tombstones():
+        """Drop delete tombstones past TOMBSTONE_RETENTION_DAYS; schedule this daily"""
+        result = supabase_service.prune_coupon_tombstones(app.config['TOMBSTONE_RETENTION_DAYS'])
+        print(f"removed {result['removed']} tombstones deleted before {result['pruned_before']}")
+    
+    @app.cli.command('reconcile-coupon-stats')
+    def reconcile_coupon_stats():
+        """Rebuild the coupon_stats summary row and report drift"""
+        result = supabase_service.reconcile_coupon_stats()
+        if not result['drift']:
+            print('coupon_stats is in sync')
+        for field, difference in result['drift'].items():
+            print(f"{field}: {result['before'].get(field)} -> {result['after'].get(field)} ({difference:+})")
+    
     return app
 
 # Create the app
@@ -0,0 +1,88 @@
+# pagination.py - Keyset (cursor) pagination helpers for coupon listings
+#
+# Pages are ordered by (created_at, id) so the next page starts strictly after
+# the last row seen, backed by the coupons_created_at_id_idx index. Cursors are
+# opaque to clients: URL-safe base64 of the last row's sort key. A decoded key
+# is checked to be a timestamp and a uuid before it is spliced into an or_()
+# filter, so a forged cursor cannot add conditions of its own.
+
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+from urllib.parse import urlencode
+
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    """Build an opaque cursor pointing just after the given row"""
+    raw = json.dumps([row['created_at'], str(row['id'])], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[str, str]]:
+    """Decode a cursor from encode_cursor; raises ValueError if it was tampered with"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, coupon_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    return check_position(created_at, coupon_id, 'Invalid cursor')
+
+
+def check_position(timestamp: Any, row_id: Any, message: str) -> Tuple[str, str]:
+    """(ISO timestamp, uuid) sort key safe to interpolate into a filter; raises ValueError(message)"""
+    if not isinstance(timestamp, str) or not isinstance(row_id, str):
+        raise ValueError(message)
+    try:
+        datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+        row_id = str(uuid.UUID(row_id))
+    except ValueError:
+        raise ValueError(message)
+    return timestamp, row_id
+
+
+def parse_limit(value: Any, default: int, maximum: int) -> int:
+    """Clamp a client-supplied page size to 1..maximum"""
+    try:
+        limit = int(value) if value not in (None, '') else default
+    except (TypeError, ValueError):
+        raise ValueError('limit must be an integer')
+    return max(1, min(limit, maximum))
+
+
+def keyset_page(query, cursor: Optional[str], limit: int, desc: bool = True):
+    """Apply keyset filter, ordering and limit to a PostgREST select query
+
+    One extra row is requested so split_page can tell whether another page exists.
+    """
+    position = decode_cursor(cursor)
+    if position:
+        created_at, coupon_id = position
+        op = 'lt' if desc else 'gt'
+        query = query.or_(
+            f'created_at.{op}."{created_at}",'
+            f'and(created_at.eq."{created_at}",id.{op}.{coupon_id})'
+        )
+    return (query
+            .order('created_at', desc=desc)
+            .order('id', desc=desc)
+            .limit(limit + 1))
+
+
+def split_page(rows: List[Dict[str, Any]], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Trim the look-ahead row and return (rows, next_cursor)"""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+
+def next_link(path: str, args: Mapping[str, str], next_cursor: Optional[str]) -> Optional[str]:
+    """RFC 8288 Link header value for the next page, keeping the other query args; None on the last page"""
+    if not next_cursor:
+        return None
+    query = urlencode({**{k: v for k, v in args.items() if k != 'cursor'}, 'cursor': next_cursor})
+    return f'<{path}?{query}>; rel="next"'
@@ -0,0 +1,324 @@
+# query_tracer.py - Request-scoped tracing of Supabase calls (development aid)
+#
+# With QUERY_TRACE on, Config.supabase_client() returns a TracedClient. While a
+# QueryTrace is active every execute() is recorded with its table, operation,
+# filters, selected columns and row count, and selected rows report which
+# columns the code actually read. The trace then flags:
+#   - duplicate reads: the same query run more than once,
+#   - single-row loops: the same query shape repeated with different values
+#     (one `eq('id', x)` per id instead of one `in_('id', ids)`),
+#   - over-fetch: select('*') where only some columns were ever read.
+# init_query_tracer(app) traces each Flask request and reports the result in
+# an X-Query-Trace response header. In tests, query_budget() asserts a budget
+# (tests/conftest.py provides it as a fixture):
+#     @pytest.fixture
+#     def query_budget():
+#         return query_tracer.query_budget
+#     def test_admin(client, query_budget):
+#         with query_budget(max_calls=2):
+#             client.get('/admin')
+
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# A query shape repeated this many times with different values is a loop
+LOOP_THRESHOLD = 3
+
+_WRITE_OPERATIONS = ('insert', 'upsert', 'update', 'delete')
+
+_active_trace: ContextVar[Optional['QueryTrace']] = ContextVar('query_trace', default=None)
+
+
+def freeze_args(value: Any) -> Any:
+    """Hashable form of a filter argument or RPC params"""
+    if isinstance(value, (list, tuple, set)):
+        return tuple(freeze_args(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze_args(item)) for key, item in value.items()))
+    return value
+
+
+class QueryRecord:
+    """One backend call: what was asked for and what came back"""
+
+    def __init__(self, table: str, operation: str = 'select', params: Optional[Dict[str, Any]] = None):
+        self.table = table
+        self.operation = operation
+        self.columns = '*'
+        self.filters: List[Tuple[str, Any]] = []
+        self.params = params
+        self.rows = 0
+        self.seconds = 0.0
+        self.columns_read: Set[str] = set()
+        self.read_all = False
+        self.row_keys: Set[str] = set()
+
+    def note(self, method: str, args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> None:
+        if method == 'select':
+            self.columns = ','.join(args) or '*'
+        elif method in _WRITE_OPERATIONS:
+            self.operation = method
+        else:
+            self.filters.append((method, freeze_args(args)))
+
+    @property
+    def key(self) -> Tuple[Any, ...]:
+        """Identical keys mean identical queries"""
+        return (self.table, self.operation, self.columns, tuple(self.filters), freeze_args(self.params))
+
+    @property
+    def shape(self) -> Tuple[Any, ...]:
+        """The query with filter values left out, e.g. coupons select eq(id)"""
+        columns = tuple((method, args[0] if args else None) for method, args in self.filters)
+        return (self.table, self.operation, self.columns, columns)
+
+    def describe(self, values: bool = True) -> str:
+        if values:
+            filters = ', '.join(f'{method}{args!r}' for method, args in self.filters)
+        else:
+            filters = ', '.join(f'{method}({args[0] if args else ""})' for method, args in self.filters)
+        target = f'rpc {self.table}' if self.operation == 'rpc' else f'{self.operation} {self.table}'
+        return f"{target} [{self.columns}] {filters}".rstrip()
+
+
+class TracedRow(dict):
+    """A selected row that records which columns are read
+
+    Whole-row access (iteration, items(), serialization, copies) counts as
+    reading every column.
+    """
+
+    __slots__ = ('_record',)
+
+    def __init__(self, row: Dict[str, Any], record: QueryRecord):
+        super().__init__(row)
+        self._record = record
+
+    def __getitem__(self, key):
+        self._record.columns_read.add(key)
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self._record.columns_read.add(key)
+        return super().get(key, default)
+
+    def _read_all(self):
+        self._record.read_all = True
+
+    def __iter__(self):
+        self._read_all()
+        return super().__iter__()
+
+    def keys(self):
+        self._read_all()
+        return super().keys()
+
+    def values(self):
+        self._read_all()
+        return super().values()
+
+    def items(self):
+        self._read_all()
+        return super().items()
+
+    def copy(self):
+        self._read_all()
+        return dict(super().items())
+
+    def __reduce__(self):
+        return dict, (dict(super().items()),)
+
+
+class QueryTrace:
+    """Calls made while this trace was active, and what looks wasteful about them"""
+
+    def __init__(self, label: str = ''):
+        self.label = label
+        self.calls: List[QueryRecord] = []
+
+    def record(self, call: QueryRecord) -> None:
+        self.calls.append(call)
+
+    def duplicates(self) -> List[Tuple[str, int]]:
+        counts: Dict[Tuple[Any, ...], List[QueryRecord]] = {}
+        for call in self.calls:
+            if call.operation in ('select', 'rpc'):
+                counts.setdefault(call.key, []).append(call)
+        return [(calls[0].describe(), len(calls)) for calls in counts.values() if len(calls) > 1]
+
+    def loops(self) -> List[Tuple[str, int]]:
+        shapes: Dict[Tuple[Any, ...], Set[Tuple[Any, ...]]] = {}
+        first: Dict[Tuple[Any, ...], QueryRecord] = {}
+        for call in self.calls:
+            if call.operation == 'rpc' or not call.filters:
+                continue
+            shapes.setdefault(call.shape, set()).add(call.key)
+            first.setdefault(call.shape, call)
+        return [(first[shape].describe(values=False), len(keys)) for shape, keys in shapes.items()
+                if len(keys) >= LOOP_THRESHOLD]
+
+    def overfetch(self) -> List[Tuple[str, List[str]]]:
+        """select('*') query shapes whose rows were only partly read, with the columns used"""
+        groups: Dict[Tuple[Any, ...], List[QueryRecord]] = {}
+        for call in self.calls:
+            if call.operation == 'select' and call.columns == '*' and call.rows:
+                groups.setdefault(call.shape, []).append(call)
+        found = []
+        for calls in groups.values():
+            if any(call.read_all for call in calls):
+                continue
+            row_keys = set().union(*(call.row_keys for call in calls))
+            read = set().union(*(call.columns_read for call in calls)) & row_keys
+            if len(read) < len(row_keys):
+                found.append((calls[0].describe(values=False), sorted(read)))
+        return found
+
+    def findings(self) -> List[str]:
+        messages = [f"duplicate x{count}: {query}" for query, count in self.duplicates()]
+        messages += [f"loop x{count}: {query}" for query, count in self.loops()]
+        messages += [f"over-fetch: {query} reads only {','.join(read) or 'nothing'}"
+                     for query, read in self.overfetch()]
+        return messages
+
+    def summary(self) -> str:
+        """Single-line form used for the X-Query-Trace header"""
+        seconds = sum(call.seconds for call in self.calls)
+        return (f"calls={len(self.calls)}; rows={sum(call.rows for call in self.calls)}; "
+                f"ms={seconds * 1000:.1f}; duplicates={len(self.duplicates())}; "
+                f"loops={len(self.loops())}; overfetch={len(self.overfetch())}")
+
+
+def current_trace() -> Optional[QueryTrace]:
+    return _active_trace.get()
+
+
+class _TracedBuilder:
+    """Wraps a postgrest request builder, recording the chain and timing execute()"""
+
+    def __init__(self, builder, record: QueryRecord):
+        self._builder = builder
+        self._record = record
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._builder, name)
+        if name == 'not_':
+            self._record.filters.append(('not', ()))
+            return _TracedBuilder(attribute, self._record)
+        if not callable(attribute):
+            return attribute
+
+        def chained(*args, **kwargs):
+            self._record.note(name, args, kwargs)
+            result = attribute(*args, **kwargs)
+            return _TracedBuilder(result, self._record) if hasattr(result, 'execute') else result
+        return chained
+
+    def execute(self):
+        trace = _active_trace.get()
+        if trace is None:
+            return self._builder.execute()
+
+        record = self._record
+        started = time.perf_counter()
+        try:
+            response = self._builder.execute()
+        finally:
+            record.seconds = time.perf_counter() - started
+            trace.record(record)
+
+        data = response.data
+        if isinstance(data, list):
+            record.rows = len(data)
+            if record.operation == 'select':
+                for row in data:
+                    if isinstance(row, dict):
+                        record.row_keys.update(dict.keys(row))
+                response.data = [TracedRow(row, record) if isinstance(row, dict) else row for row in data]
+        elif data:
+            record.rows = 1
+        return response
+
+
+class TracedClient:
+    """Supabase client proxy whose table() and rpc() calls are traced"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def table(self, name: str) -> _TracedBuilder:
+        return _TracedBuilder(self._client.table(name), QueryRecord(name))
+
+    from_ = table
+
+    def rpc(self, name: str, params: Optional[Dict[str, Any]] = None) -> _TracedBuilder:
+        return _TracedBuilder(self._client.rpc(name, params or {}), QueryRecord(name, 'rpc', params or {}))
+
+    def __getattr__(self, name: str):
+        return getattr(self._client, name)
+
+
+@contextmanager
+def trace_queries(label: str = '') -> Iterator[QueryTrace]:
+    """Trace every call made through a TracedClient inside the block"""
+    trace = QueryTrace(label)
+    token = _active_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _active_trace.reset(token)
+
+
+def assert_query_budget(trace: QueryTrace, max_calls: Optional[int] = None,
+                        allow_findings: bool = False) -> None:
+    """Raise AssertionError if the trace made too many calls or has findings"""
+    problems = []
+    if max_calls is not None and len(trace.calls) > max_calls:
+        problems.append(f"{len(trace.calls)} backend calls, budget is {max_calls}")
+    if not allow_findings:
+        problems += trace.findings()
+    if problems:
+        calls = '\n    '.join(call.describe() for call in trace.calls)
+        raise AssertionError(f"Query budget exceeded{' for ' + trace.label if trace.label else ''}:\n  "
+                             + '\n  '.join(problems) + f"\n  calls:\n    {calls}")
+
+
+@contextmanager
+def query_budget(max_calls: Optional[int] = None, allow_findings: bool = False,
+                 label: str = '') -> Iterator[QueryTrace]:
+    """trace_queries() that asserts the budget when the block exits"""
+    with trace_queries(label) as trace:
+        yield trace
+    assert_query_budget(trace, max_calls, allow_findings)
+
+
+def init_query_tracer(app, enabled: bool = True) -> None:
+    """Trace each request and report it in the X-Query-Trace response header"""
+    if not enabled:
+        return
+    from flask import g, request
+
+    @app.before_request
+    def _start_trace():
+        trace = QueryTrace(f"{request.method} {request.url_rule.rule if request.url_rule else request.path}")
+        g.query_trace = trace
+        g.query_trace_token = _active_trace.set(trace)
+
+    @app.after_request
+    def _report_trace(response):
+        trace = g.pop('query_trace', None)
+        token = g.pop('query_trace_token', None)
+        if trace is None:
+            return response
+        _active_trace.reset(token)
+        response.headers['X-Query-Trace'] = trace.summary()
+        findings = trace.findings()
+        if findings:
+            response.headers['X-Query-Trace-Findings'] = ' | '.join(findings)[:4000]
+            for finding in findings:
+                logger.warning(f"{trace.label}: {finding}")
+        return response
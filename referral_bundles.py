@@ -0,0 +1,124 @@
+# referral_bundles.py - Atomic referral creation through one RPC call
+#
+# A referral is a referee coupon, an optional referrer reward coupon and the
+# referrals row. The rows are built here, ids included, and written by the
+# create_referral_bundle(s) functions in db_functions in one transaction, so
+# a failed insert cannot leave orphaned coupons behind. A unique violation
+# (code or short_url collision) aborts the whole bundle; it is rebuilt with
+# fresh codes and retried.
+
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from batching import chunked
+from coupon_codes import generate_codes
+from db_functions import rpc_row
+from short_links import new_short_id, retry_on_collision, short_url_for
+
+logger = logging.getLogger(__name__)
+
+REFERRAL_EXPIRY_DAYS = 30
+
+
+def is_unique_violation(error: Exception) -> bool:
+    return getattr(error, 'code', None) == '23505'
+
+
+def _coupon(code: str, name: str, description: str, discount_type: str, discount_value: float,
+            expiry_date: str, email: str, now: str) -> Dict[str, Any]:
+    return {
+        'id': str(uuid.uuid4()),
+        'code': code,
+        'name': name,
+        'description': description,
+        'discount_type': discount_type,
+        'discount_value': discount_value,
+        'expiry_date': expiry_date,
+        'assigned_to_email': email,
+        'is_assigned': True,
+        'is_used': False,
+        'qr_code_data': f"https://skinandwicks.com/claim/{code}",
+        'short_url': short_url_for(new_short_id()),
+        'created_at': now,
+        'updated_at': now
+    }
+
+
+def build_referral_bundle(referrer_email: str, referee_email: str, discount_value: float,
+                          discount_type: str = 'fixed_amount', referrer_gets_reward: bool = False,
+                          referrer_reward_value: float = None) -> Dict[str, Any]:
+    """Build the rows for one referral, ready for create_referral_bundle()"""
+    referrer_email = referrer_email.lower()
+    referee_email = referee_email.lower()
+    now = datetime.utcnow().isoformat()
+    expiry_date = (datetime.utcnow() + timedelta(days=REFERRAL_EXPIRY_DAYS)).isoformat()
+    unit = "%" if discount_type == "percentage" else "$"
+    with_reward = bool(referrer_gets_reward and referrer_reward_value)
+    codes = generate_codes(2 if with_reward else 1)
+
+    referee_coupon = _coupon(codes[0], f'Referral Discount - {discount_value}{unit} Off',
+                             f'Special referral discount from {referrer_email}',
+                             discount_type, discount_value, expiry_date, referee_email, now)
+    referrer_coupon = None
+    if with_reward:
+        referrer_coupon = _coupon(codes[1], f'Referrer Reward - {referrer_reward_value}{unit} Off',
+                                  f'Thank you for referring {referee_email}',
+                                  discount_type, referrer_reward_value, expiry_date, referrer_email, now)
+
+    referral = {
+        'id': str(uuid.uuid4()),
+        'referrer_email': referrer_email,
+        'referee_email': referee_email,
+        'coupon_id': referee_coupon['id'],
+        'discount_applied': discount_value,
+        'discount_type': discount_type,
+        'referrer_gets_reward': referrer_gets_reward,
+        'referrer_reward_coupon_id': referrer_coupon['id'] if referrer_coupon else None,
+        'referrer_reward_value': referrer_reward_value,
+        'redeemed_at': now,
+        'created_at': now,
+        'updated_at': now
+    }
+    return {'referee_coupon': referee_coupon, 'referrer_coupon': referrer_coupon, 'referral': referral}
+
+
+def create_referral_bundle(client, **referral) -> Dict[str, Any]:
+    """Create one referral atomically; returns {referee_coupon, referrer_coupon, referral}
+
+    Takes build_referral_bundle()'s arguments. Raises on failure, after retrying
+    code collisions.
+    """
+    def attempt():
+        bundle = build_referral_bundle(**referral)
+        return rpc_row(client.rpc('create_referral_bundle', {'p_bundle': bundle}).execute().data)
+    return retry_on_collision(attempt, is_unique_violation, 'Referral bundle')
+
+
+def create_referral_bundles(client, referrals: List[Dict[str, Any]], chunk_size: int = 500) -> Dict[str, Any]:
+    """Create many referrals, one transaction and one round trip per chunk
+
+    Each item holds build_referral_bundle()'s arguments. Returns
+    {'created_count', 'chunks': [{'requested', 'created', 'error'?}], 'failed_referrals'}.
+    """
+    summary: Dict[str, Any] = {'created_count': 0, 'chunks': [], 'failed_referrals': []}
+
+    for chunk in chunked(referrals, chunk_size):
+        entry: Dict[str, Any] = {'requested': len(chunk), 'created': 0}
+
+        def attempt():
+            bundles = [build_referral_bundle(**referral) for referral in chunk]
+            return rpc_row(client.rpc('create_referral_bundles', {'p_bundles': bundles}).execute().data) or {}
+        try:
+            result = retry_on_collision(attempt, is_unique_violation, 'Referral chunk')
+            entry['created'] = int(result.get('created_count', len(chunk)))
+        except Exception as e:
+            entry['error'] = str(e)
+        if 'error' in entry:
+            logger.error(f"Error creating referral chunk of {len(chunk)}: {entry['error']}")
+            summary['failed_referrals'].extend(chunk)
+        summary['created_count'] += entry['created']
+        summary['chunks'].append(entry)
+
+    return summary
@@ -0,0 +1,103 @@
+# request_loader.py - Request-scoped memoization of Supabase reads
+#
+# Within one request, identical select queries (same table, filters, columns,
+# ordering and limit) reach the backend once; later calls get the first
+# response back. Any write - insert, update, upsert, delete or an RPC that is
+# not known to be read-only - clears the memo, so a read after a write in the
+# same request always sees the write. Outside a request scope (CLI commands,
+# background threads) every call goes straight through.
+# Config.supabase_client() returns a RequestScopedClient; init_request_loader
+# opens a scope per Flask request. Treat memoized rows as read-only.
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from query_tracer import freeze_args
+
+# RPCs that only read and can be memoized like selects
+READ_ONLY_RPCS = frozenset(('coupon_analytics', 'coupon_data_version'))
+
+_WRITE_METHODS = frozenset(('insert', 'upsert', 'update', 'delete'))
+
+_memo: ContextVar[Optional[Dict[Tuple[Any, ...], Any]]] = ContextVar('request_memo', default=None)
+
+
+class _LoaderBuilder:
+    """Wraps a postgrest request builder; execute() consults the request memo"""
+
+    def __init__(self, builder, key: Tuple[Any, ...], read_only: bool = True):
+        self._builder = builder
+        self._key = key
+        self._read_only = read_only
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._builder, name)
+        if name == 'not_':
+            return _LoaderBuilder(attribute, self._key + (('not',),), self._read_only)
+        if not callable(attribute):
+            return attribute
+
+        def chained(*args, **kwargs):
+            result = attribute(*args, **kwargs)
+            if not hasattr(result, 'execute'):
+                return result
+            return _LoaderBuilder(result, self._key + ((name, freeze_args(args), freeze_args(kwargs)),),
+                                  self._read_only and name not in _WRITE_METHODS)
+        return chained
+
+    def execute(self):
+        memo = _memo.get()
+        if memo is None:
+            return self._builder.execute()
+        if not self._read_only:
+            memo.clear()
+            return self._builder.execute()
+        if self._key not in memo:
+            memo[self._key] = self._builder.execute()
+        return memo[self._key]
+
+
+class RequestScopedClient:
+    """Supabase client proxy that deduplicates identical reads within a request scope"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def table(self, name: str) -> _LoaderBuilder:
+        return _LoaderBuilder(self._client.table(name), ('table', name))
+
+    from_ = table
+
+    def rpc(self, name: str, params: Optional[Dict[str, Any]] = None) -> _LoaderBuilder:
+        return _LoaderBuilder(self._client.rpc(name, params or {}), ('rpc', name, freeze_args(params or {})),
+                              name in READ_ONLY_RPCS)
+
+    def __getattr__(self, name: str):
+        return getattr(self._client, name)
+
+
+@contextmanager
+def request_scope() -> Iterator[Dict[Tuple[Any, ...], Any]]:
+    """Memoize reads made through a RequestScopedClient inside the block"""
+    token = _memo.set({})
+    try:
+        yield _memo.get()
+    finally:
+        _memo.reset(token)
+
+
+def init_request_loader(app) -> None:
+    """Open a fresh memo for every Flask request"""
+    from flask import g
+
+    @app.before_request
+    def _open_request_scope():
+        g.request_loader_token = _memo.set({})
+
+    @app.teardown_request
+    def _close_request_scope(exc=None):
+        token = g.pop('request_loader_token', None)
+        if token is not None:
+            _memo.reset(token)
+
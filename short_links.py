@@ -0,0 +1,162 @@
+# short_links.py - Short URL allocation and in-memory redirect resolution
+#
+# Short ids are 7 random base62 characters (62^7 ~ 3.5e12 ids) drawn from the
+# CSPRNG. coupons.short_url is unique, so an insert that loses the (rare) race
+# for an id fails with 23505 and is retried with a fresh one. Resolution is a
+# dict lookup; the map is warmed in the background and misses fall back to one
+# indexed query.
+
+import logging
+import string
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from coupon_codes import generate_codes
+from pagination import keyset_page, split_page
+
+logger = logging.getLogger(__name__)
+
+BASE62_ALPHABET = string.digits + string.ascii_letters
+SHORT_URL_PREFIX = 'https://swicks.co/'
+SHORT_ID_LENGTH = 7
+MAX_ALLOCATION_ATTEMPTS = 5
+
+
+def new_short_id(length: int = SHORT_ID_LENGTH) -> str:
+    return generate_codes(1, length, BASE62_ALPHABET)[0]
+
+
+def short_url_for(short_id: str) -> str:
+    return f"{SHORT_URL_PREFIX}{short_id}"
+
+
+def short_id_from_url(short_url: Optional[str]) -> Optional[str]:
+    if short_url and short_url.startswith(SHORT_URL_PREFIX):
+        return short_url[len(SHORT_URL_PREFIX):]
+    return None
+
+
+def is_short_url_conflict(error: Exception) -> bool:
+    """True if an insert failed on the coupons.short_url unique constraint"""
+    return getattr(error, 'code', None) == '23505' and 'short_url' in str(error)
+
+
+def _retry_or_raise(error: Exception, attempt: int, is_collision: Callable[[Exception], bool], what: str) -> None:
+    if not is_collision(error) or attempt == MAX_ALLOCATION_ATTEMPTS - 1:
+        raise error
+    logger.warning(f"{what} collided on a unique value, retrying: {str(error)}")
+
+
+def retry_on_collision(attempt: Callable[[], Any], is_collision: Callable[[Exception], bool], what: str) -> Any:
+    """Call attempt() until it stops failing with a collision; each call must draw fresh values"""
+    for number in range(MAX_ALLOCATION_ATTEMPTS):
+        try:
+            return attempt()
+        except Exception as e:
+            _retry_or_raise(e, number, is_collision, what)
+
+
+async def retry_on_collision_async(attempt: Callable[[], Awaitable[Any]], is_collision: Callable[[Exception], bool],
+                                   what: str) -> Any:
+    """retry_on_collision for a coroutine function"""
+    for number in range(MAX_ALLOCATION_ATTEMPTS):
+        try:
+            return await attempt()
+        except Exception as e:
+            _retry_or_raise(e, number, is_collision, what)
+
+
+def insert_with_short_url(insert: Callable[[Dict[str, Any]], Any], coupon_data: Dict[str, Any]) -> Any:
+    """Assign a fresh short_url and insert, retrying on short_url collisions"""
+    def attempt():
+        coupon_data['short_url'] = short_url_for(new_short_id())
+        return insert(coupon_data)
+    return retry_on_collision(attempt, is_short_url_conflict, 'Short URL')
+
+
+class ShortLinkResolver:
+    """Bounded short id -> coupon code map for the /s/<short_id> redirect"""
+
+    def __init__(self, max_size: int = 200000, warm_page_size: int = 1000):
+        self.max_size = max_size
+        self.warm_page_size = warm_page_size
+        self._lock = threading.Lock()
+        self._codes: 'OrderedDict[str, str]' = OrderedDict()  # short id -> code
+        self._short_ids: Dict[str, str] = {}  # code -> short id
+        self._warm_started = False
+
+    def resolve(self, client, short_id: str) -> Optional[str]:
+        """Return the coupon code for a short id, or None if there is none"""
+        self._ensure_warm(client)
+        with self._lock:
+            code = self._codes.get(short_id)
+            if code is not None:
+                self._codes.move_to_end(short_id)
+                return code
+
+        response = (client.table('coupons')
+                   .select('code,short_url')
+                   .eq('short_url', short_url_for(short_id))
+                   .execute())
+        if not response.data:
+            return None
+        self.remember(response.data[0])
+        return response.data[0]['code']
+
+    def remember(self, coupon: Dict[str, Any]) -> None:
+        short_id = short_id_from_url(coupon.get('short_url'))
+        if not short_id or not coupon.get('code'):
+            return
+        with self._lock:
+            self._codes[short_id] = coupon['code']
+            self._codes.move_to_end(short_id)
+            self._short_ids[coupon['code']] = short_id
+            while len(self._codes) > self.max_size:
+                _, evicted_code = self._codes.popitem(last=False)
+                self._short_ids.pop(evicted_code, None)
+
+    def forget(self, code: Optional[str] = None, short_url: Optional[str] = None) -> None:
+        """Invalidate a mapping when its coupon is deleted or changed"""
+        with self._lock:
+            short_id = short_id_from_url(short_url) or (self._short_ids.pop(code, None) if code else None)
+            if short_id:
+                evicted_code = self._codes.pop(short_id, None)
+                if evicted_code:
+                    self._short_ids.pop(evicted_code, None)
+
+    def warm_up(self, client) -> int:
+        """Load the newest max_size short links, newest first"""
+        loaded = 0
+        cursor = None
+        try:
+            while loaded < self.max_size:
+                query = client.table('coupons').select('id,created_at,code,short_url').not_.is_('short_url', 'null')
+                response = keyset_page(query, cursor, self.warm_page_size).execute()
+                rows, cursor = split_page(response.data or [], self.warm_page_size)
+                with self._lock:
+                    for coupon in rows:
+                        short_id = short_id_from_url(coupon['short_url'])
+                        if short_id and short_id not in self._codes:
+                            # Warm entries go to the cold end so live lookups win
+                            self._codes[short_id] = coupon['code']
+                            self._codes.move_to_end(short_id, last=False)
+                            self._short_ids[coupon['code']] = short_id
+                    while len(self._codes) > self.max_size:
+                        _, evicted_code = self._codes.popitem(last=False)
+                        self._short_ids.pop(evicted_code, None)
+                loaded += len(rows)
+                if not cursor:
+                    break
+        except Exception as e:
+            logger.error(f"Error warming short link map: {str(e)}")
+        return loaded
+
+    def _ensure_warm(self, client) -> None:
+        if self._warm_started:
+            return
+        with self._lock:
+            if self._warm_started:
+                return
+            self._warm_started = True
+        threading.Thread(target=self.warm_up, args=(client,), daemon=True).start()
@@ -0,0 +1,385 @@
+# sqlalchemy_storage.py - CouponStorage talking to the database directly
+#
+# Uses the database_models tables through SQLAlchemy instead of PostgREST over
+# HTTP: a pooled engine (bounded overflow, pre-ping, recycling), server-side
+# cursors for full scans and one transaction per logical write. The same code
+# runs against Postgres (psycopg2) in production and SQLite locally. All
+# timestamps are written in UTC. Writes move the coupon_stats row by the same
+# deltas the RPCs apply, in the same transaction as the write itself.
+
+import logging
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import DateTime, and_, case, create_engine, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from batching import chunked
+from coupon_columns import COUPON_PROJECTION
+from coupon_stats import DataVersion, created_delta, usage_delta
+from coupon_storage import CouponStorage
+from database_models import db, Coupon, CouponStatsRow, CouponUsageTracking, Referral
+from db_functions import analytics_from_counts, REDEEMED, ALREADY_USED, EXPIRED, NOT_FOUND
+from pagination import decode_cursor, split_page
+from referral_bundles import build_referral_bundle
+from short_links import MAX_ALLOCATION_ATTEMPTS, new_short_id, short_url_for
+
+logger = logging.getLogger(__name__)
+
+
+def _to_datetime(value: Any) -> Any:
+    """Parse an ISO timestamp string into an aware UTC datetime"""
+    if not isinstance(value, str):
+        return value
+    text = value[:-1] + '+00:00' if value.endswith('Z') else value
+    parsed = datetime.fromisoformat(text)
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, datetime):
+        # SQLite hands back naive values; they were written as UTC
+        return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _row(obj) -> Dict[str, Any]:
+    """A mapped object as a Supabase-shaped dict"""
+    return {attr.key: _json_value(getattr(obj, attr.key)) for attr in obj.__mapper__.column_attrs}
+
+
+def _values(model, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Keep the keys that are columns of model, parsing timestamp strings"""
+    values = {}
+    for column in model.__table__.columns:
+        if column.key in data:
+            value = data[column.key]
+            values[column.key] = _to_datetime(value) if isinstance(column.type, DateTime) else value
+    return values
+
+
+class SQLAlchemyStorage(CouponStorage):
+    """CouponStorage on a pooled SQLAlchemy engine"""
+
+    def __init__(self, database_url: str, pool_size: int = 10, max_overflow: int = 20,
+                 pool_timeout: float = 5, pool_recycle: int = 1800, echo: bool = False):
+        options: Dict[str, Any] = {'echo': echo, 'future': True}
+        if database_url.startswith('sqlite'):
+            options['connect_args'] = {'check_same_thread': False}
+            if database_url in ('sqlite://', 'sqlite:///:memory:'):
+                # One shared connection, or every checkout would see an empty database
+                options['poolclass'] = StaticPool
+        else:
+            options.update(pool_size=pool_size, max_overflow=max_overflow, pool_timeout=pool_timeout,
+                           pool_recycle=pool_recycle, pool_pre_ping=True)
+        self.engine = create_engine(database_url, **options)
+        self.Session = sessionmaker(bind=self.engine, expire_on_commit=False)
+
+    @classmethod
+    def from_config(cls, config) -> 'SQLAlchemyStorage':
+        """Build from DATABASE_URL and the DB_POOL_* settings of a Flask config"""
+        return cls(config['DATABASE_URL'],
+                   pool_size=config.get('DB_POOL_SIZE', 10),
+                   max_overflow=config.get('DB_MAX_OVERFLOW', 20),
+                   pool_timeout=config.get('DB_POOL_TIMEOUT', 5),
+                   pool_recycle=config.get('DB_POOL_RECYCLE', 1800))
+
+    def create_schema(self) -> None:
+        """Create the database_models tables that do not exist yet, and the coupon_stats row"""
+        db.metadata.create_all(self.engine)
+        with self.Session.begin() as session:
+            if session.get(CouponStatsRow, 1) is None:
+                session.add(CouponStatsRow(id=1))
+
+    def _apply_stats(self, session, delta: Dict[str, Any]) -> None:
+        """Move coupon_stats by delta inside the caller's transaction, as apply_coupon_stats_delta() does"""
+        values = {field: getattr(CouponStatsRow, field) + Decimal(str(value))
+                  for field, value in delta.items() if value}
+        if not values:
+            return
+        result = session.execute(
+            update(CouponStatsRow)
+            .where(CouponStatsRow.id == 1)
+            .values(generation=CouponStatsRow.generation + 1, updated_at=datetime.now(timezone.utc), **values)
+            .execution_options(synchronize_session=False))
+        if result.rowcount == 0:
+            logger.error(f"Coupon stats delta {values} not applied: the coupon_stats row is missing")
+
+    def _referral_ids(self, session, coupon_ids: List[Any]) -> set:
+        query = select(Referral.coupon_id).where(Referral.coupon_id.in_(coupon_ids))
+        return {str(coupon_id) for coupon_id in session.execute(query).scalars()}
+
+    def pool_status(self) -> str:
+        return self.engine.pool.status()
+
+    # Lookups
+    def get_coupon_by_code(self, code: str) -> Optional[Dict[str, Any]]:
+        with self.Session() as session:
+            coupon = session.execute(select(Coupon).where(Coupon.code == code.upper())).scalar_one_or_none()
+            return _row(coupon) if coupon else None
+
+    def get_coupon_by_id(self, coupon_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            key = uuid.UUID(str(coupon_id))
+        except ValueError:
+            return None
+        with self.Session() as session:
+            coupon = session.get(Coupon, key)
+            return _row(coupon) if coupon else None
+
+    def get_coupons_by_email(self, email: str) -> List[Dict[str, Any]]:
+        with self.Session() as session:
+            query = select(Coupon).where(Coupon.assigned_to_email == email.lower())
+            return [_row(coupon) for coupon in session.execute(query).scalars()]
+
+    def get_coupons_page(self, limit: int, cursor: Optional[str] = None, email: Optional[str] = None,
+                         columns: str = COUPON_PROJECTION) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        position = decode_cursor(cursor)
+        query = select(*(Coupon.__table__.c[name] for name in columns.split(',')))
+        if email:
+            query = query.where(Coupon.assigned_to_email == email.lower())
+        if position:
+            try:
+                created_at, coupon_id = _to_datetime(position[0]), uuid.UUID(position[1])
+            except ValueError:
+                raise ValueError('Invalid cursor')
+            query = query.where(or_(Coupon.created_at < created_at,
+                                    and_(Coupon.created_at == created_at, Coupon.id < coupon_id)))
+        query = query.order_by(Coupon.created_at.desc(), Coupon.id.desc()).limit(limit + 1)
+        with self.Session() as session:
+            rows = [{key: _json_value(value) for key, value in row.items()}
+                    for row in session.execute(query).mappings()]
+            return split_page(rows, limit)
+
+    def iter_coupons(self, page_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """Every coupon, oldest first, streamed through a server-side cursor"""
+        query = (select(Coupon)
+                 .order_by(Coupon.created_at, Coupon.id)
+                 .execution_options(stream_results=True, yield_per=page_size))
+        with self.Session() as session:
+            for coupon in session.execute(query).scalars():
+                yield _row(coupon)
+                session.expunge(coupon)
+
+    # Writes
+    def create_coupon(self, coupon_data: Dict[str, Any], short_link: bool = False) -> Optional[Dict[str, Any]]:
+        now = datetime.now(timezone.utc)
+        data = {'id': str(uuid.uuid4()), 'created_at': now, 'updated_at': now, **coupon_data}
+        if 'code' in data:
+            data['code'] = data['code'].upper()
+
+        attempts = MAX_ALLOCATION_ATTEMPTS if short_link else 1
+        for attempt in range(attempts):
+            if short_link:
+                data['short_url'] = short_url_for(new_short_id())
+            try:
+                with self.Session.begin() as session:
+                    coupon = Coupon(**_values(Coupon, data))
+                    session.add(coupon)
+                    session.flush()
+                    row = _row(coupon)
+                    self._apply_stats(session, created_delta([row]))
+                    return row
+            except IntegrityError as e:
+                if short_link and 'short_url' in str(e.orig) and attempt < attempts - 1:
+                    continue
+                logger.error(f"Error creating coupon: {str(e.orig)}")
+                return None
+            except Exception as e:
+                logger.error(f"Error creating coupon: {str(e)}")
+                return None
+
+    def redeem_coupon(self, coupon_id: str) -> Dict[str, Any]:
+        """Conditional update in one transaction; the row lock serialises concurrent redeems"""
+        try:
+            key = uuid.UUID(str(coupon_id))
+        except ValueError:
+            return {'outcome': NOT_FOUND, 'coupon': None}
+        now = datetime.now(timezone.utc)
+        try:
+            with self.Session.begin() as session:
+                result = session.execute(
+                    update(Coupon)
+                    .where(Coupon.id == key,
+                           Coupon.is_used.is_(False),
+                           or_(Coupon.expiry_date.is_(None), Coupon.expiry_date > now))
+                    .values(is_used=True, used_at=now, updated_at=now)
+                    .execution_options(synchronize_session=False))
+                coupon = session.get(Coupon, key)
+                if coupon is None:
+                    return {'outcome': NOT_FOUND, 'coupon': None}
+                if result.rowcount == 1:
+                    outcome = REDEEMED
+                    self._apply_stats(session, usage_delta([_row(coupon)], True, self._referral_ids(session, [key])))
+                else:
+                    outcome = ALREADY_USED if coupon.is_used else EXPIRED
+                return {'outcome': outcome, 'coupon': _row(coupon)}
+        except Exception as e:
+            logger.error(f"Error redeeming coupon {coupon_id}: {str(e)}")
+            return {'outcome': 'error', 'coupon': None, 'error': str(e)}
+
+    def update_coupon_usage_tracking(self, coupon_code: str, order_data: Dict[str, Any]) -> bool:
+        """Locked read-modify-write; a concurrent first use is retried as an update"""
+        code = coupon_code.upper()
+        discount = Decimal(str(order_data.get('discount_amount', 0) or 0))
+        for attempt in range(2):
+            now = datetime.now(timezone.utc)
+            try:
+                with self.Session.begin() as session:
+                    tracking = session.execute(
+                        select(CouponUsageTracking)
+                        .where(CouponUsageTracking.coupon_code == code)
+                        .with_for_update()).scalar_one_or_none()
+                    if tracking is None:
+                        session.add(CouponUsageTracking(
+                            coupon_code=code, usage_count=1, total_discount=discount, last_used=now,
+                            orders_data=[order_data], created_at=now, updated_at=now))
+                    else:
+                        orders = tracking.orders_data
+                        if isinstance(orders, dict):
+                            orders = [orders]
+                        tracking.orders_data = (orders if isinstance(orders, list) else []) + [order_data]
+                        tracking.usage_count = (tracking.usage_count or 0) + 1
+                        tracking.total_discount = (tracking.total_discount or 0) + discount
+                        tracking.last_used = now
+                        tracking.updated_at = now
+                return True
+            except IntegrityError:
+                if attempt:
+                    break
+            except Exception as e:
+                logger.error(f"Error updating coupon usage tracking for {coupon_code}: {str(e)}")
+                return False
+        logger.error(f"Error updating coupon usage tracking for {coupon_code}: insert kept conflicting")
+        return False
+
+    # Referrals
+    def _insert_bundles(self, session, bundles: List[Dict[str, Any]]) -> None:
+        coupons = [_values(Coupon, coupon) for bundle in bundles
+                   for coupon in (bundle['referee_coupon'], bundle['referrer_coupon']) if coupon]
+        session.execute(Coupon.__table__.insert(), coupons)
+        session.execute(Referral.__table__.insert(), [_values(Referral, bundle['referral']) for bundle in bundles])
+        referral_ids = {str(bundle['referral']['coupon_id']) for bundle in bundles}
+        self._apply_stats(session, created_delta(
+            [coupon for bundle in bundles for coupon in (bundle['referee_coupon'], bundle['referrer_coupon']) if coupon],
+            1, referral_ids))
+
+    def create_referral_coupon(self, referrer_email: str, referee_email: str,
+                               discount_value: float, discount_type: str = 'fixed_amount',
+                               referrer_gets_reward: bool = False,
+                               referrer_reward_value: float = None) -> Dict[str, Any]:
+        try:
+            for attempt in range(MAX_ALLOCATION_ATTEMPTS):
+                bundle = build_referral_bundle(referrer_email, referee_email, discount_value, discount_type,
+                                               referrer_gets_reward, referrer_reward_value)
+                try:
+                    with self.Session.begin() as session:
+                        self._insert_bundles(session, [bundle])
+                    break
+                except IntegrityError:
+                    if attempt == MAX_ALLOCATION_ATTEMPTS - 1:
+                        raise
+            referrer = bundle['referrer_coupon']
+            return {
+                'success': True,
+                'referee_coupon': self.get_coupon_by_id(bundle['referee_coupon']['id']),
+                'referrer_coupon': self.get_coupon_by_id(referrer['id']) if referrer else None,
+                'message': 'Referral coupons created successfully'
+            }
+        except Exception as e:
+            logger.error(f"Error creating referral coupon: {str(e)}")
+            return {
+                'success': False,
+                'error': str(e),
+                'message': 'Failed to create referral coupon'
+            }
+
+    def create_referral_coupons_batch(self, referrals: List[Dict[str, Any]],
+                                      chunk_size: int = 500) -> Dict[str, Any]:
+        """Same result shape as referral_bundles.create_referral_bundles"""
+        summary: Dict[str, Any] = {'created_count': 0, 'chunks': [], 'failed_referrals': []}
+        for chunk in chunked(referrals, chunk_size):
+            entry: Dict[str, Any] = {'requested': len(chunk), 'created': 0}
+            for attempt in range(MAX_ALLOCATION_ATTEMPTS):
+                try:
+                    bundles = [build_referral_bundle(**referral) for referral in chunk]
+                    with self.Session.begin() as session:
+                        self._insert_bundles(session, bundles)
+                    entry['created'] = len(chunk)
+                    entry.pop('error', None)
+                    break
+                except Exception as e:
+                    entry['error'] = str(getattr(e, 'orig', e))
+                    if not isinstance(e, IntegrityError):
+                        break
+            if 'error' in entry:
+                logger.error(f"Error creating referral chunk of {len(chunk)}: {entry['error']}")
+                summary['failed_referrals'].extend(chunk)
+            summary['created_count'] += entry['created']
+            summary['chunks'].append(entry)
+        return summary
+
+    # Analytics
+    def get_coupon_analytics(self) -> Dict[str, Any]:
+        """One aggregate query, same counts as the coupon_analytics() RPC"""
+        now = datetime.now(timezone.utc)
+        is_referral = Coupon.id.in_(select(Referral.coupon_id).where(Referral.coupon_id.isnot(None)))
+        is_expired = and_(Coupon.expiry_date.isnot(None), Coupon.expiry_date <= now)
+        is_used = Coupon.is_used.is_(True)
+        is_unused = Coupon.is_used.is_(False)
+
+        def count_if(condition):
+            return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+        def value_if(condition):
+            return func.coalesce(func.sum(case((condition, Coupon.discount_value), else_=0)), 0)
+
+        query = select(
+            func.count(Coupon.id).label('total_coupons'),
+            count_if(is_used).label('used_coupons'),
+            count_if(and_(is_unused, is_expired)).label('expired_coupons'),
+            count_if(and_(is_unused, ~is_expired)).label('active_coupons'),
+            value_if(and_(is_unused, ~is_expired)).label('total_value'),
+            value_if(and_(is_unused, is_expired)).label('expired_value'),
+            count_if(~is_referral).label('gift_coupons'),
+            count_if(and_(~is_referral, is_used)).label('gift_used'),
+            count_if(is_referral).label('referral_coupons'),
+            count_if(and_(is_referral, is_used)).label('referral_used')
+        )
+        try:
+            with self.Session() as session:
+                return analytics_from_counts(dict(session.execute(query).one()._mapping))
+        except Exception as e:
+            logger.error(f"Error fetching coupon analytics: {str(e)}")
+            return analytics_from_counts(None)
+
+    def get_data_version(self) -> Optional[DataVersion]:
+        """Row counts and newest updated_at of coupons and referrals, in one statement
+
+        Counts catch deletes, updated_at catches the rest.
+        """
+        query = select(
+            select(func.count(Coupon.id)).scalar_subquery(),
+            select(func.max(Coupon.updated_at)).scalar_subquery(),
+            select(func.count(Referral.id)).scalar_subquery(),
+            select(func.max(Referral.updated_at)).scalar_subquery()
+        )
+        try:
+            with self.Session() as session:
+                coupons, coupons_updated, referrals, referrals_updated = session.execute(query).one()
+        except Exception as e:
+            logger.error(f"Error fetching data version: {str(e)}")
+            return None
+        stamps = [_to_datetime(_json_value(stamp)) for stamp in (coupons_updated, referrals_updated) if stamp]
+        return DataVersion(f"c{coupons}:{_json_value(coupons_updated)}:r{referrals}:{_json_value(referrals_updated)}",
+                           max(stamps) if stamps else None)
@@ -0,0 +1,198 @@
+# supabase_pool.py - Pooled, keep-alive HTTP sessions for the Supabase clients
+#
+# supabase-py gives every client its own default httpx session: no bound on
+# connections, a 5 s keep-alive, one timeout for every phase and HTTP/1.1.
+# The session behind client.postgrest is swapped for one built from the
+# SUPABASE_POOL_* / SUPABASE_*_TIMEOUT settings in config_py.Config. One client
+# is shared per worker process; a forked worker builds its own instead of
+# reusing sockets it inherited. HTTP/2 is used when the h2 package is installed.
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from postgrest.utils import AsyncClient, SyncClient
+from supabase import Client, create_client
+
+from metrics import observe_backend_call
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401  (enables httpx http2=True)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class _PoolCounters:
+    """Request counters shared by the sync and async transports"""
+
+    def __init__(self, max_connections: Optional[int]):
+        self.max_connections = max_connections
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.waits = 0
+        self._lock = threading.Lock()
+
+    def enter(self) -> None:
+        with self._lock:
+            self.requests += 1
+            # Every connection is busy, so this request queues for one
+            if self.max_connections and self.in_flight >= self.max_connections:
+                self.waits += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def leave(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self, pool) -> Dict[str, Any]:
+        connections = list(getattr(pool, 'connections', []))
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return {
+            'max_connections': self.max_connections,
+            'connections': len(connections),
+            'in_use': len(connections) - idle,
+            'idle': idle,
+            'in_flight': self.in_flight,
+            'peak_in_flight': self.peak_in_flight,
+            'requests': self.requests,
+            'waits': self.waits
+        }
+
+
+class PoolStatsTransport(httpx.HTTPTransport):
+    """HTTPTransport that counts requests in flight and requests that had to wait
+
+    Every request is also recorded in metrics.py, labeled by table and route.
+    """
+
+    def __init__(self, limits: httpx.Limits, **kwargs):
+        super().__init__(limits=limits, **kwargs)
+        self.counters = _PoolCounters(limits.max_connections)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.counters.enter()
+        started = time.perf_counter()
+        response = None
+        try:
+            response = super().handle_request(request)
+            return response
+        finally:
+            self.counters.leave()
+            observe_backend_call(request, response, time.perf_counter() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.counters.stats(self._pool)
+
+
+class AsyncPoolStatsTransport(httpx.AsyncHTTPTransport):
+    """Async counterpart of PoolStatsTransport"""
+
+    def __init__(self, limits: httpx.Limits, **kwargs):
+        super().__init__(limits=limits, **kwargs)
+        self.counters = _PoolCounters(limits.max_connections)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.counters.enter()
+        started = time.perf_counter()
+        response = None
+        try:
+            response = await super().handle_async_request(request)
+            return response
+        finally:
+            self.counters.leave()
+            observe_backend_call(request, response, time.perf_counter() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.counters.stats(self._pool)
+
+
+def _limits_and_timeout(settings: Dict[str, Any]) -> Tuple[httpx.Limits, httpx.Timeout, bool]:
+    limits = httpx.Limits(
+        max_connections=settings['SUPABASE_POOL_MAX_CONNECTIONS'],
+        max_keepalive_connections=settings['SUPABASE_POOL_MAX_KEEPALIVE'],
+        keepalive_expiry=settings['SUPABASE_KEEPALIVE_EXPIRY']
+    )
+    timeout = httpx.Timeout(
+        connect=settings['SUPABASE_CONNECT_TIMEOUT'],
+        read=settings['SUPABASE_READ_TIMEOUT'],
+        write=settings['SUPABASE_READ_TIMEOUT'],
+        pool=settings['SUPABASE_POOL_TIMEOUT']
+    )
+    http2 = bool(settings['SUPABASE_HTTP2']) and HTTP2_AVAILABLE
+    return limits, timeout, http2
+
+
+# (pid, label, transport) for every pooled session built by this process
+_transports: List[Tuple[int, str, Any]] = []
+_shared: Dict[Tuple[str, str], Client] = {}
+_shared_pid: Optional[int] = None
+_lock = threading.Lock()
+
+
+def build_http_client(settings: Dict[str, Any], base_url: str, headers: Dict[str, str],
+                      label: str = 'postgrest') -> SyncClient:
+    """A pooled sync session for PostgREST built from the pool settings"""
+    limits, timeout, http2 = _limits_and_timeout(settings)
+    transport = PoolStatsTransport(limits, http2=http2)
+    _transports.append((os.getpid(), label, transport))
+    return SyncClient(base_url=base_url, headers=headers, timeout=timeout, transport=transport)
+
+
+def build_async_http_client(settings: Dict[str, Any], base_url: str, headers: Dict[str, str],
+                            label: str = 'postgrest-async') -> AsyncClient:
+    """A pooled async session for PostgREST built from the pool settings"""
+    limits, timeout, http2 = _limits_and_timeout(settings)
+    transport = AsyncPoolStatsTransport(limits, http2=http2)
+    _transports.append((os.getpid(), label, transport))
+    return AsyncClient(base_url=base_url, headers=headers, timeout=timeout, transport=transport)
+
+
+def use_pooled_session(postgrest, session) -> None:
+    """Replace a postgrest client's default session with a pooled one"""
+    default_session = postgrest.session
+    postgrest.session = session
+    if isinstance(default_session, httpx.Client):
+        default_session.close()  # never used, so there is nothing in flight
+
+
+def shared_client(settings: Dict[str, Any]) -> Client:
+    """The Supabase client for these credentials, created once per worker process"""
+    global _shared_pid
+    key = (settings['SUPABASE_URL'], settings['SUPABASE_KEY'])
+    with _lock:
+        if _shared_pid != os.getpid():
+            # Forked from the process that built them; sockets must not be shared
+            _shared.clear()
+            _transports[:] = [entry for entry in _transports if entry[0] == os.getpid()]
+            _shared_pid = os.getpid()
+        client = _shared.get(key)
+        if client is None:
+            client = create_client(*key)
+            postgrest = client.postgrest
+            use_pooled_session(postgrest, build_http_client(
+                settings, str(postgrest.session.base_url), dict(postgrest.session.headers)))
+            _shared[key] = client
+            _, _, http2 = _limits_and_timeout(settings)
+            logger.info(f"Supabase connection pool ready (pid {os.getpid()}, "
+                        f"max {settings['SUPABASE_POOL_MAX_CONNECTIONS']} connections, "
+                        f"http2={'on' if http2 else 'off'})")
+        return client
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Connection pool counters for every pooled session in this process"""
+    pid = os.getpid()
+    return {
+        'pid': pid,
+        'http2_available': HTTP2_AVAILABLE,
+        'pools': [dict(transport.stats(), name=label)
+                  for owner, label, transport in _transports if owner == pid]
+    }
@@ -1,15 +1,27 @@
-from supabase import create_client, Client
+from supabase import Client
 from flask import current_app
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from datetime import datetime
-import logging
 import uuid
-import secrets
-import string
 
-class SupabaseService:
+from batching import chunked, run_in_chunks
+from coupon_cache import CouponCache, MISS
+from coupon_codes import generate_codes, mint_coupons
+from short_links import insert_with_short_url
+from coupon_stats import CouponStats, DataVersion
+from db_functions import analytics_from_counts, rpc_row, REDEEMED, NOT_FOUND
+from pagination import keyset_page, split_page
+from coupon_columns import COUPON_PROJECTION, SUMMARY_PROJECTION
+from coupon_changes import data_version, fetch_changes, prune_tombstones
+from referral_bundles import create_referral_bundle, create_referral_bundles
+from config_py import Config
+from coupon_storage import CouponStorage
+
+class SupabaseService(CouponStorage):
     def __init__(self):
         self.client: Optional[Client] = None
+        self.stats = CouponStats()
+        self.cache = CouponCache()
     
     def init_app(self, app):
         """Initialize Supabase client with Flask app"""
@@ -21,7 +33,12 @@ class SupabaseService:
                 app.logger.warning("Supabase credentials not provided")
                 return
             
-            self.client = create_client(supabase_url, supabase_key)
+            # Shared with any other user of these credentials in this worker process
+            self.client = Config.supabase_client(app.config)
+            self.stats.client = self.client
+            self.cache.configure(app.config.get('COUPON_CACHE_SIZE', 10000),
+                                 app.config.get('COUPON_CACHE_TTL', 30),
+                                 app.config.get('COUPON_CACHE_NEGATIVE_TTL', 5))
             app.logger.info("Supabase client initialized successfully")
         except Exception as e:
             app.logger.error(f"Failed to initialize Supabase client: {str(e)}")
@@ -34,33 +51,101 @@ class SupabaseService:
     
     def generate_coupon_code(self, length: int = 8) -> str:
         """Generate a random coupon code"""
-        characters = string.ascii_uppercase + string.digits
-        return ''.join(secrets.choice(characters) for _ in range(length))
+        return generate_codes(1, length)[0]
+    
+    def mint_coupons(self, template: Dict[str, Any], count: int, chunk_size: int = 500) -> Dict[str, Any]:
+        """Create count coupons sharing template, with codes unique in the batch and the table"""
+        return mint_coupons(self.client, template, count, chunk_size, on_inserted=self.stats.record_created)
     
     # Coupon operations (updated for your schema)
     def get_all_coupons(self) -> List[Dict[str, Any]]:
         """Get all coupons from Supabase"""
         try:
-            response = self.client.table('coupons').select('*').order('created_at', desc=True).execute()
+            response = self.client.table('coupons').select(COUPON_PROJECTION).order('created_at', desc=True).execute()
             return response.data if response.data else []
         except Exception as e:
             current_app.logger.error(f"Error fetching coupons: {str(e)}")
             return []
     
+    def get_active_coupons(self, limit: int) -> List[Dict[str, Any]]:
+        """Get the newest unused, unexpired coupons"""
+        try:
+            response = (self.client.table('coupons')
+                       .select(SUMMARY_PROJECTION)
+                       .eq('is_used', False)
+                       .gt('expiry_date', datetime.utcnow().isoformat())
+                       .order('created_at', desc=True)
+                       .limit(limit)
+                       .execute())
+            return response.data if response.data else []
+        except Exception as e:
+            current_app.logger.error(f"Error fetching active coupons: {str(e)}")
+            return []
+    
+    def get_coupons_page(self, limit: int, cursor: Optional[str] = None, email: Optional[str] = None,
+                         columns: str = COUPON_PROJECTION) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Get one page of coupons, newest first, and the cursor for the next page
+        
+        Raises ValueError for a malformed cursor; other errors yield an empty page.
+        """
+        query = self.client.table('coupons').select(columns)
+        if email:
+            query = query.eq('assigned_to_email', email.lower())
+        query = keyset_page(query, cursor, limit)
+        try:
+            response = query.execute()
+            return split_page(response.data or [], limit)
+        except Exception as e:
+            current_app.logger.error(f"Error fetching coupon page: {str(e)}")
+            return [], None
+    
+    def iter_coupons(self, page_size: int = 1000):
+        """Every coupon, oldest first, one keyset page per round trip"""
+        cursor = None
+        while True:
+            query = keyset_page(self.client.table('coupons').select(COUPON_PROJECTION), cursor, page_size, desc=False)
+            rows, cursor = split_page(query.execute().data or [], page_size)
+            yield from rows
+            if not cursor:
+                break
+    
+    def get_coupon_changes(self, watermark: Optional[str], limit: int, columns: str = COUPON_PROJECTION,
+                           settle: float = 5.0) -> Dict[str, Any]:
+        """Coupons upserted and deleted since watermark, and the watermark to sync from next
+        
+        Raises ValueError for a malformed watermark; other errors propagate so a
+        client never mistakes a failed sync for an empty one.
+        """
+        return fetch_changes(self.client, watermark, limit, columns, settle)
+    
     def get_coupon_by_code(self, code: str) -> Optional[Dict[str, Any]]:
-        """Get a coupon by its code"""
+        """Get a coupon by its code, served from the lookup cache when possible"""
+        code = code.upper()
+        cached = self.cache.get_by_code(code)
+        if cached is not MISS:
+            return cached
         try:
-            response = self.client.table('coupons').select('*').eq('code', code.upper()).execute()
-            return response.data[0] if response.data else None
+            response = self.client.table('coupons').select(COUPON_PROJECTION).eq('code', code).execute()
+            if not response.data:
+                self.cache.put_missing(code)
+                return None
+            self.cache.put(response.data[0])
+            return response.data[0]
         except Exception as e:
             current_app.logger.error(f"Error fetching coupon by code {code}: {str(e)}")
             return None
     
     def get_coupon_by_id(self, coupon_id: str) -> Optional[Dict[str, Any]]:
-        """Get a coupon by its ID"""
+        """Get a coupon by its ID, served from the lookup cache when possible"""
+        cached = self.cache.get_by_id(coupon_id)
+        if cached is not MISS:
+            return cached
         try:
-            response = self.client.table('coupons').select('*').eq('id', coupon_id).execute()
-            return response.data[0] if response.data else None
+            response = self.client.table('coupons').select(COUPON_PROJECTION).eq('id', coupon_id).execute()
+            if not response.data:
+                return None
+            self.cache.put(response.data[0])
+            return response.data[0]
         except Exception as e:
             current_app.logger.error(f"Error fetching coupon by ID {coupon_id}: {str(e)}")
             return None
@@ -69,7 +154,7 @@ class SupabaseService:
         """Get coupons assigned to a specific email"""
         try:
             response = (self.client.table('coupons')
-                       .select('*')
+                       .select(COUPON_PROJECTION)
                        .eq('assigned_to_email', email.lower())
                        .execute())
             return response.data if response.data else []
@@ -77,8 +162,8 @@ class SupabaseService:
             current_app.logger.error(f"Error fetching coupons for email {email}: {str(e)}")
             return []
     
-    def create_coupon(self, coupon_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        """Create a new coupon"""
+    def create_coupon(self, coupon_data: Dict[str, Any], short_link: bool = False) -> Optional[Dict[str, Any]]:
+        """Create a new coupon, optionally allocating a unique short_url"""
         try:
             # Add default values based on your schema
             coupon_data.update({
@@ -91,20 +176,29 @@ class SupabaseService:
             if 'code' in coupon_data:
                 coupon_data['code'] = coupon_data['code'].upper()
                 
-            response = self.client.table('coupons').insert(coupon_data).execute()
+            def insert(data: Dict[str, Any]):
+                return self.client.table('coupons').insert(data).execute()
+            
+            if short_link:
+                response = insert_with_short_url(insert, coupon_data)
+            else:
+                response = insert(coupon_data)
+            self.cache.invalidate(code=coupon_data.get('code'))
+            self.stats.record_created(response.data or [])
             return response.data[0] if response.data else None
         except Exception as e:
             current_app.logger.error(f"Error creating coupon: {str(e)}")
             return None
     
     def update_coupon(self, coupon_id: str, updates: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        """Update a coupon"""
+        """Update a coupon (use toggle_coupon_status to change is_used)"""
         try:
             updates['updated_at'] = datetime.utcnow().isoformat()
             response = (self.client.table('coupons')
                        .update(updates)
                        .eq('id', coupon_id)
                        .execute())
+            self.cache.invalidate(coupon_id=coupon_id)
             return response.data[0] if response.data else None
         except Exception as e:
             current_app.logger.error(f"Error updating coupon {coupon_id}: {str(e)}")
@@ -118,20 +212,45 @@ class SupabaseService:
                 'used_at': datetime.utcnow().isoformat(),
                 'updated_at': datetime.utcnow().isoformat()
             }
+            # Only unused rows match, so the returned rows are exactly the ones that changed
             response = (self.client.table('coupons')
                        .update(updates)
                        .eq('code', coupon_code.upper())
+                       .eq('is_used', False)
                        .execute())
+            self.cache.invalidate(code=coupon_code.upper())
+            self.stats.record_usage(response.data or [], True)
             return len(response.data) > 0
         except Exception as e:
             current_app.logger.error(f"Error marking coupon {coupon_code} as used: {str(e)}")
             return False
     
+    def redeem_coupon(self, coupon_id: str) -> Dict[str, Any]:
+        """Atomically redeem a coupon in one round trip
+        
+        Returns {'outcome': 'redeemed' | 'already_used' | 'expired' | 'not_found', 'coupon': ...};
+        of any number of concurrent calls for the same coupon exactly one is redeemed.
+        """
+        try:
+            response = self.client.rpc('redeem_coupon', {'p_coupon_id': coupon_id}).execute()
+            result = rpc_row(response.data) or {'outcome': NOT_FOUND, 'coupon': None}
+        except Exception as e:
+            if getattr(e, 'code', None) == '22P02':  # not a valid uuid
+                return {'outcome': NOT_FOUND, 'coupon': None}
+            current_app.logger.error(f"Error redeeming coupon {coupon_id}: {str(e)}")
+            return {'outcome': 'error', 'coupon': None, 'error': str(e)}
+        
+        if result['outcome'] == REDEEMED:
+            self.cache.invalidate(coupon_id=coupon_id, code=result['coupon']['code'])
+        return result
+    
     def delete_coupon(self, coupon_id: str) -> bool:
         """Delete a coupon"""
         try:
             response = self.client.table('coupons').delete().eq('id', coupon_id).execute()
-            return True  # Supabase delete doesn't return data, but no exception means success
+            self.cache.invalidate(coupon_id=coupon_id)
+            self.stats.record_deleted(response.data or [])
+            return True  # No exception means success, even if the coupon was already gone
         except Exception as e:
             current_app.logger.error(f"Error deleting coupon {coupon_id}: {str(e)}")
             return False
@@ -145,15 +264,60 @@ class SupabaseService:
                 'is_used': is_used,
                 'updated_at': datetime.utcnow().isoformat()
             }
+            # Filter on the opposite state so only rows that really flip are returned
             response = (self.client.table('coupons')
                        .update(updates)
                        .eq('id', coupon_id)
+                       .eq('is_used', not is_used)
                        .execute())
-            return len(response.data) > 0
+            self.cache.invalidate(coupon_id=coupon_id)
+            if response.data:
+                self.stats.record_usage(response.data, is_used)
+                return True
+            # Nothing flipped: succeed if the coupon already has the requested status
+            return self.get_coupon_by_id(coupon_id) is not None
         except Exception as e:
             current_app.logger.error(f"Error toggling coupon status {coupon_id}: {str(e)}")
             return False
     
+    def bulk_delete_coupons(self, coupon_ids: List[str], chunk_size: int = 200) -> Dict[str, Any]:
+        """Delete coupons with one `id in (...)` statement per chunk"""
+        def delete_chunk(chunk: List[str]) -> set:
+            response = self.client.table('coupons').delete().in_('id', chunk).execute()
+            rows = response.data or []
+            for coupon_id in chunk:
+                self.cache.invalidate(coupon_id=coupon_id)
+            self.stats.record_deleted(rows)
+            return set(str(r['id']) for r in rows)
+        
+        return run_in_chunks(coupon_ids, chunk_size, delete_chunk)
+    
+    def bulk_update_status(self, coupon_ids: List[str], new_status: str,
+                           chunk_size: int = 200) -> Dict[str, Any]:
+        """Set active/inactive status with one `id in (...)` statement per chunk"""
+        is_used = new_status == 'inactive'
+        
+        def update_chunk(chunk: List[str]) -> set:
+            response = (self.client.table('coupons')
+                       .update({'is_used': is_used, 'updated_at': datetime.utcnow().isoformat()})
+                       .in_('id', chunk)
+                       .eq('is_used', not is_used)
+                       .execute())
+            rows = response.data or []
+            for coupon_id in chunk:
+                self.cache.invalidate(coupon_id=coupon_id)
+            self.stats.record_usage(rows, is_used)
+            done = set(str(r['id']) for r in rows)
+            
+            # Rows already in the requested state were filtered out but are not failures
+            remaining = [i for i in chunk if i not in done]
+            if remaining:
+                existing = self.client.table('coupons').select('id').in_('id', remaining).execute()
+                done.update(str(r['id']) for r in (existing.data or []))
+            return done
+        
+        return run_in_chunks(coupon_ids, chunk_size, update_chunk)
+    
     # Referral operations (updated for your schema)
     def create_referral(self, referral_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Create a new referral"""
@@ -239,162 +403,58 @@ class SupabaseService:
             return None
     
     def update_coupon_usage_tracking(self, coupon_code: str, order_data: Dict[str, Any]) -> bool:
-        """Update coupon usage tracking"""
+        """Atomically bump usage tracking for a coupon and append the order event"""
         try:
-            # Get existing tracking data
-            existing = (self.client.table('coupon_usage_tracking')
-                       .select('*')
-                       .eq('coupon_code', coupon_code.upper())
-                       .execute())
-            
-            if existing.data:
-                # Update existing record
-                current_data = existing.data[0]
-                new_usage_count = current_data['usage_count'] + 1
-                new_total_discount = float(current_data['total_discount']) + float(order_data.get('discount_amount', 0))
-                
-                updates = {
-                    'usage_count': new_usage_count,
-                    'total_discount': new_total_discount,
-                    'last_used': datetime.utcnow().isoformat(),
-                    'orders_data': order_data,
-                    'updated_at': datetime.utcnow().isoformat()
-                }
-                
-                response = (self.client.table('coupon_usage_tracking')
-                           .update(updates)
-                           .eq('coupon_code', coupon_code.upper())
-                           .execute())
-            else:
-                # Create new record
-                tracking_data = {
-                    'id': str(uuid.uuid4()),
-                    'coupon_code': coupon_code.upper(),
-                    'usage_count': 1,
-                    'total_discount': float(order_data.get('discount_amount', 0)),
-                    'last_used': datetime.utcnow().isoformat(),
-                    'orders_data': order_data,
-                    'created_at': datetime.utcnow().isoformat(),
-                    'updated_at': datetime.utcnow().isoformat()
-                }
-                
-                response = self.client.table('coupon_usage_tracking').insert(tracking_data).execute()
-            
-            return True  # Success if no exception
+            response = self.client.rpc('track_coupon_usage', {
+                'p_coupon_code': coupon_code.upper(),
+                'p_discount': float(order_data.get('discount_amount', 0)),
+                'p_order': order_data
+            }).execute()
+            return bool(response.data)
         except Exception as e:
             current_app.logger.error(f"Error updating coupon usage tracking for {coupon_code}: {str(e)}")
             return False
     
+    def update_coupon_usage_tracking_batch(self, events: List[Tuple[str, Dict[str, Any]]],
+                                           chunk_size: int = 1000) -> bool:
+        """Fold many (coupon_code, order_data) redemption events into one write per chunk"""
+        try:
+            for chunk in chunked(events, chunk_size):
+                payload = [{
+                    'coupon_code': coupon_code.upper(),
+                    'discount_amount': float(order_data.get('discount_amount', 0)),
+                    'order_data': order_data
+                } for coupon_code, order_data in chunk]
+                self.client.rpc('track_coupon_usage_batch', {'p_events': payload}).execute()
+            return True
+        except Exception as e:
+            current_app.logger.error(f"Error updating coupon usage tracking batch: {str(e)}")
+            return False
+    
     # Analytics operations (updated for your schema)
     def get_coupon_analytics(self) -> Dict[str, Any]:
-        """Get coupon analytics data"""
+        """Get coupon analytics from the incrementally maintained coupon_stats row"""
         try:
-            # Get all coupons
-            all_coupons = self.get_all_coupons()
-            
-            if not all_coupons:
-                return {
-                    'total_coupons': 0,
-                    'active_coupons': 0,
-                    'used_coupons': 0,
-                    'expired_coupons': 0,
-                    'total_value': 0,
-                    'gift_coupons': 0,
-                    'referral_coupons': 0,
-                    'gift_redemption_rate': 0,
-                    'referral_redemption_rate': 0,
-                    'overall_redemption_rate': 0
-                }
-            
-            now = datetime.utcnow()
-            total_coupons = len(all_coupons)
-            
-            # Count different types of coupons
-            used_coupons = 0
-            active_coupons = 0
-            expired_coupons = 0
-            total_value = 0
-            
-            # Get referral coupon IDs
-            try:
-                referrals = self.client.table('referrals').select('coupon_id').execute()
-                referral_coupon_ids = set(r['coupon_id'] for r in (referrals.data or []) if r.get('coupon_id'))
-            except:
-                referral_coupon_ids = set()
-            
-            gift_coupons_count = 0
-            referral_coupons_count = 0
-            gift_used = 0
-            referral_used = 0
-            
-            for coupon in all_coupons:
-                is_referral = coupon['id'] in referral_coupon_ids
-                
-                if is_referral:
-                    referral_coupons_count += 1
-                    if coupon.get('is_used'):
-                        referral_used += 1
-                else:
-                    gift_coupons_count += 1
-                    if coupon.get('is_used'):
-                        gift_used += 1
-                
-                if coupon.get('is_used'):
-                    used_coupons += 1
-                else:
-                    # Check if expired
-                    if coupon.get('expiry_date'):
-                        try:
-                            expiry_str = coupon['expiry_date']
-                            if expiry_str.endswith('Z'):
-                                expiry_date = datetime.fromisoformat(expiry_str.replace('Z', '+00:00'))
-                            else:
-                                expiry_date = datetime.fromisoformat(expiry_str)
-                            
-                            if expiry_date <= now:
-                                expired_coupons += 1
-                            else:
-                                active_coupons += 1
-                                total_value += float(coupon.get('discount_value', 0))
-                        except:
-                            active_coupons += 1
-                            total_value += float(coupon.get('discount_value', 0))
-                    else:
-                        active_coupons += 1
-                        total_value += float(coupon.get('discount_value', 0))
-            
-            # Calculate redemption rates
-            gift_redemption_rate = (gift_used / gift_coupons_count * 100) if gift_coupons_count > 0 else 0
-            referral_redemption_rate = (referral_used / referral_coupons_count * 100) if referral_coupons_count > 0 else 0
-            overall_redemption_rate = (used_coupons / total_coupons * 100) if total_coupons > 0 else 0
-            
-            return {
-                'total_coupons': total_coupons,
-                'active_coupons': active_coupons,
-                'used_coupons': used_coupons,
-                'expired_coupons': expired_coupons,
-                'total_value': round(total_value, 2),
-                'gift_coupons': gift_coupons_count,
-                'referral_coupons': referral_coupons_count,
-                'gift_redemption_rate': round(gift_redemption_rate, 1),
-                'referral_redemption_rate': round(referral_redemption_rate, 1),
-                'overall_redemption_rate': round(overall_redemption_rate, 1)
-            }
-            
+            return self.stats.analytics()
         except Exception as e:
             current_app.logger.error(f"Error fetching coupon analytics: {str(e)}")
-            return {
-                'total_coupons': 0,
-                'active_coupons': 0,
-                'used_coupons': 0,
-                'expired_coupons': 0,
-                'total_value': 0,
-                'gift_coupons': 0,
-                'referral_coupons': 0,
-                'gift_redemption_rate': 0,
-                'referral_redemption_rate': 0,
-                'overall_redemption_rate': 0
-            }
+            return analytics_from_counts(None)
+    
+    def get_data_version(self) -> Optional[DataVersion]:
+        """Newest coupon write, coupon delete and referral write, from one RPC"""
+        try:
+            return data_version(self.client)
+        except Exception as e:
+            current_app.logger.error(f"Error fetching data version: {str(e)}")
+            return None
+    
+    def reconcile_coupon_stats(self) -> Dict[str, Any]:
+        """Rebuild coupon_stats from the coupons table and report the drift"""
+        return self.stats.rebuild()
+    
+    def prune_coupon_tombstones(self, retention_days: int) -> Optional[Dict[str, Any]]:
+        """Drop tombstones older than retention_days; older sync watermarks then get a full resync"""
+        return prune_tombstones(self.client, retention_days)
     
     # Gift coupon creation
     def create_gift_coupon(self, recipient_email: str, sender_email: str, 
@@ -405,9 +465,8 @@ class SupabaseService:
         try:
             coupon_code = self.generate_coupon_code()
             
-            # Generate QR code data and short URL
+            # Generate QR code data; the short URL is allocated on insert
             qr_code_data = f"https://skinandwicks.com/claim/{coupon_code}"
-            short_url = f"https://swicks.co/{coupon_code[:6]}"
 
             coupon_data = {
                 'code': coupon_code,
@@ -420,11 +479,10 @@ class SupabaseService:
                 'assigned_to_email': recipient_email.lower(),
                 'is_assigned': True,
                 'is_used': False,
-                'qr_code_data': qr_code_data,
-                'short_url': short_url
+                'qr_code_data': qr_code_data
             }
 
-            result = self.create_coupon(coupon_data)
+            result = self.create_coupon(coupon_data, short_link=True)
             
             if result:
                 current_app.logger.info(f"Gift coupon created: {coupon_code} for {recipient_email}")
@@ -449,72 +507,25 @@ class SupabaseService:
                               discount_value: float, discount_type: str = 'fixed_amount',
                               referrer_gets_reward: bool = False, 
                               referrer_reward_value: float = None) -> Dict[str, Any]:
-        """Create a referral coupon system"""
+        """Create the referee coupon, optional referrer reward and referral in one transaction"""
         try:
-            from datetime import timedelta
-            
-            # Create coupon for referee
-            referee_coupon_code = self.generate_coupon_code()
-            expiry_date = (datetime.utcnow() + timedelta(days=30)).isoformat()
-
-            referee_coupon = {
-                'code': referee_coupon_code,
-                'name': f'Referral Discount - {discount_value}{"%" if discount_type == "percentage" else "$"} Off',
-                'description': f'Special referral discount from {referrer_email}',
-                'discount_type': discount_type,
-                'discount_value': discount_value,
-                'expiry_date': expiry_date,
-                'assigned_to_email': referee_email.lower(),
-                'is_assigned': True,
-                'is_used': False,
-                'qr_code_data': f"https://skinandwicks.com/claim/{referee_coupon_code}",
-                'short_url': f"https://swicks.co/{referee_coupon_code[:6]}"
-            }
-
-            # Create referee coupon
-            referee_result = self.create_coupon(referee_coupon)
-            
-            referrer_coupon_result = None
-            if referrer_gets_reward and referrer_reward_value:
-                # Create reward coupon for referrer
-                referrer_coupon_code = self.generate_coupon_code()
-
-                referrer_coupon = {
-                    'code': referrer_coupon_code,
-                    'name': f'Referrer Reward - {referrer_reward_value}{"%" if discount_type == "percentage" else "$"} Off',
-                    'description': f'Thank you for referring {referee_email}',
-                    'discount_type': discount_type,
-                    'discount_value': referrer_reward_value,
-                    'expiry_date': expiry_date,
-                    'assigned_to_email': referrer_email.lower(),
-                    'is_assigned': True,
-                    'is_used': False,
-                    'qr_code_data': f"https://skinandwicks.com/claim/{referrer_coupon_code}",
-                    'short_url': f"https://swicks.co/{referrer_coupon_code[:6]}"
-                }
-
-                referrer_coupon_result = self.create_coupon(referrer_coupon)
-
-            # Create referral tracking record
-            if referee_result:
-                referral_data = {
-                    'referrer_email': referrer_email.lower(),
-                    'referee_email': referee_email.lower(),
-                    'coupon_id': referee_result['id'],
-                    'discount_applied': discount_value,
-                    'discount_type': discount_type,
-                    'referrer_gets_reward': referrer_gets_reward,
-                    'referrer_reward_coupon_id': referrer_coupon_result['id'] if referrer_coupon_result else None,
-                    'referrer_reward_value': referrer_reward_value,
-                    'redeemed_at': datetime.utcnow().isoformat()
-                }
-
-                self.create_referral(referral_data)
+            result = create_referral_bundle(
+                self.client,
+                referrer_email=referrer_email,
+                referee_email=referee_email,
+                discount_value=discount_value,
+                discount_type=discount_type,
+                referrer_gets_reward=referrer_gets_reward,
+                referrer_reward_value=referrer_reward_value
+            )
+            for coupon in (result['referee_coupon'], result['referrer_coupon']):
+                if coupon:
+                    self.cache.invalidate(code=coupon['code'])
 
             return {
                 'success': True,
-                'referee_coupon': referee_result,
-                'referrer_coupon': referrer_coupon_result,
+                'referee_coupon': result['referee_coupon'],
+                'referrer_coupon': result['referrer_coupon'],
                 'message': 'Referral coupons created successfully'
             }
 
@@ -525,7 +536,11 @@ class SupabaseService:
                 'error': str(e),
                 'message': 'Failed to create referral coupon'
             }
-
+    
+    def create_referral_coupons_batch(self, referrals: List[Dict[str, Any]],
+                                      chunk_size: int = 500) -> Dict[str, Any]:
+        """Create many referrals (create_referral_coupon arguments each), one transaction per chunk"""
+        return create_referral_bundles(self.client, referrals, chunk_size)
 
 # Global instance
 supabase_service = SupabaseService()
\ No newline at end of file
@@ -0,0 +1,58 @@
+# conftest.py - Shared fixtures: app.py wired to an in-memory Supabase
+#
+# The routes run through the Flask test client against FakeSupabaseClient,
+# wrapped the way Config.supabase_client() wraps the real client (see
+# benchmark_routes.run_size). Tests that take query_budget get the client
+# traced as with QUERY_TRACE on, so a budget counts every backend call:
+#     def test_admin(app_client, query_budget):
+#         with query_budget(max_calls=2):
+#             app_client.get('/admin')
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import query_tracer
+from config_py import Config
+from fake_supabase import FakeSupabaseClient
+from request_loader import RequestScopedClient
+from short_links import ShortLinkResolver
+
+
+@pytest.fixture
+def fake_supabase():
+    """Empty in-memory Supabase"""
+    return FakeSupabaseClient()
+
+
+@pytest.fixture
+def app_module(request, fake_supabase):
+    """app.py with its client swapped for fake_supabase and its caches emptied"""
+    import app as module
+
+    client = fake_supabase
+    if 'query_budget' in request.fixturenames:
+        client = query_tracer.TracedClient(client)
+    saved = module.supabase, module.coupon_manager.supabase, module.coupon_manager.short_links
+    module.supabase = module.coupon_manager.supabase = RequestScopedClient(client)
+    module.coupon_manager.cache.clear()
+    module.coupon_manager.short_links = ShortLinkResolver(Config.SHORT_LINK_CACHE_SIZE)
+    yield module
+    module.supabase, module.coupon_manager.supabase, module.coupon_manager.short_links = saved
+    module.coupon_manager.cache.clear()
+
+
+@pytest.fixture
+def app_client(app_module):
+    """Flask test client for app.py"""
+    app_module.app.config['TESTING'] = True
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def query_budget():
+    """query_tracer.query_budget: fails the test if the block exceeds max_calls or has findings"""
+    return query_tracer.query_budget
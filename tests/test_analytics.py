@@ -0,0 +1,34 @@
+# test_analytics.py - /api/analytics and the admin dashboard read coupon_analytics()
+
+import pytest
+
+from fake_supabase import FakeAPIError
+
+
+@pytest.fixture
+def seeded(fake_supabase):
+    fake_supabase.seed('coupons', [{'code': f'CODE{i}', 'discount_type': 'fixed_amount', 'discount_value': 5,
+                                    'is_used': i < 2} for i in range(6)])
+    return fake_supabase
+
+
+@pytest.fixture
+def broken_analytics(seeded, monkeypatch):
+    def fail():
+        raise FakeAPIError('57014', 'canceling statement due to statement timeout')
+    monkeypatch.setattr(seeded, '_rpc_coupon_analytics', fail)
+
+
+def test_analytics_counts(app_client, seeded):
+    data = app_client.get('/api/analytics').get_json()['data']
+    assert data['total_coupons'] == 6 and data['redeemed_coupons'] == 2 and data['active_coupons'] == 4
+
+
+def test_backend_error_is_not_reported_as_zero(app_client, broken_analytics):
+    response = app_client.get('/api/analytics')
+    assert response.status_code == 500 and response.get_json()['success'] is False
+
+
+def test_admin_shows_analytics_unavailable(app_client, broken_analytics):
+    response = app_client.get('/admin')
+    assert response.status_code == 200 and b'Analytics are unavailable' in response.data
@@ -0,0 +1,74 @@
+# test_async_service.py - AsyncSupabaseService through the real AsyncPostgrestClient
+#
+# The client's HTTP session is swapped for an httpx MockTransport that answers
+# from FakeSupabaseClient, so requests are built and responses parsed by the
+# pinned postgrest exactly as in production.
+
+import asyncio
+import json
+import uuid
+
+import httpx
+import pytest
+
+from async_supabase_service import AsyncSupabaseService
+from fake_supabase import FakeAPIError
+from supabase_pool import use_pooled_session
+
+BASE_URL = 'https://example.supabase.co/rest/v1'
+
+
+def _transport(fake):
+    def handle(request: httpx.Request) -> httpx.Response:
+        path = request.url.path[len('/rest/v1/'):]
+        body = json.loads(request.content or b'null')
+        try:
+            if path.startswith('rpc/'):
+                data = fake.rpc(path[len('rpc/'):], body).execute().data
+            elif request.method == 'POST':
+                data = fake.table(path).insert(body).execute().data
+            else:
+                return httpx.Response(501, json={'message': f'{request.method} not supported by this stand-in'})
+        except FakeAPIError as e:
+            return httpx.Response(409, json={'code': e.code, 'message': e.message, 'details': e.details,
+                                             'hint': None})
+        return httpx.Response(200, json=data)
+    return httpx.MockTransport(handle)
+
+
+@pytest.fixture
+def service(fake_supabase):
+    service = AsyncSupabaseService()
+    service.init('https://example.supabase.co', 'anon-key')
+    use_pooled_session(service.client, httpx.AsyncClient(
+        base_url=BASE_URL, headers=dict(service.client.session.headers), transport=_transport(fake_supabase)))
+    return service
+
+
+def _stats(fake):
+    return fake.table('coupon_stats').select('*').eq('id', 1).execute().data[0]
+
+
+def test_redeem_once(service, fake_supabase):
+    coupon = {'id': str(uuid.uuid4()), 'code': 'ASYNC1', 'discount_value': 5}
+    fake_supabase.seed('coupons', [coupon])
+    first = asyncio.run(service.redeem_coupon(coupon['id']))
+    second = asyncio.run(service.redeem_coupon(coupon['id']))
+    assert (first['outcome'], second['outcome']) == ('redeemed', 'already_used')
+    assert first['coupon']['code'] == 'ASYNC1'
+
+
+def test_usage_tracking_and_stats(service, fake_supabase):
+    assert asyncio.run(service.update_coupon_usage_tracking('async1', {'discount_amount': 3})) is True
+    assert asyncio.run(service._apply_stats({'total_coupons': 1})) is True
+    assert _stats(fake_supabase)['total_coupons'] == 1
+
+
+def test_referral_retries_a_collision(service, fake_supabase, monkeypatch):
+    fake_supabase.seed('coupons', [{'code': 'TAKEN', 'discount_value': 1}])
+    codes = iter([['TAKEN'], ['FRESH1']])
+    monkeypatch.setattr('referral_bundles.generate_codes', lambda count: next(codes))
+    result = asyncio.run(service.create_referral_coupon('a@x.com', 'b@x.com', 10))
+    assert result['success'] is True, result
+    assert result['referee_coupon']['code'] == 'FRESH1'
+    assert _stats(fake_supabase)['referral_coupons'] == 1
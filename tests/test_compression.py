@@ -0,0 +1,75 @@
+# test_compression.py - Accept-Encoding negotiation and the size threshold
+
+import gzip
+import json
+import uuid
+
+import pytest
+
+import compression
+from compression import accepted_codings, choose_coding, compress_for
+from config_py import Config
+
+
+@pytest.fixture(params=[True, False], ids=['with-brotli', 'gzip-only'])
+def brotli(request, monkeypatch):
+    monkeypatch.setattr(compression, 'BROTLI_AVAILABLE', request.param)
+    return request.param
+
+
+def test_accepted_codings():
+    assert accepted_codings('gzip, BR;q=0.5, deflate;level=1;q=0.2, x;q=bad, y;q=7') == {
+        'gzip': 1.0, 'br': 0.5, 'deflate': 0.2, 'x': 0.0, 'y': 1.0}
+    assert accepted_codings(None) == {}
+
+
+@pytest.mark.parametrize('header, with_brotli, gzip_only', [
+    ('gzip;q=1, br;q=0.1', 'gzip', 'gzip'),
+    ('br;q=1, gzip;q=0.1', 'br', 'gzip'),
+    ('br, gzip', 'br', 'gzip'),
+    ('gzip, br', 'br', 'gzip'),
+    ('br', 'br', None),
+    ('*', 'br', 'gzip'),
+    ('*;q=0.5, gzip;q=0.8', 'gzip', 'gzip'),
+    ('*, gzip;q=0', 'br', None),
+    ('gzip;q=0, br;q=0', None, None),
+    ('identity', None, None),
+    ('identity;q=1, gzip;q=0.5', None, None),
+    ('', None, None),
+    (None, None, None),
+])
+def test_choose_coding_follows_q_values(brotli, header, with_brotli, gzip_only):
+    assert choose_coding(header) == (with_brotli if brotli else gzip_only)
+
+
+def test_threshold():
+    small, large = b'x' * 1023, b'x' * 1024
+    assert compress_for(small, 'gzip', min_size=1024) == (None, small)
+    coding, body = compress_for(large, 'gzip', min_size=1024)
+    assert coding == 'gzip' and gzip.decompress(body) == large
+    assert compress_for(large, 'identity', min_size=1024) == (None, large)
+
+
+@pytest.fixture
+def coupons(fake_supabase):
+    fake_supabase.seed('coupons', [{'id': str(uuid.uuid4()), 'code': f'CODE{i}', 'name': f'Coupon {i}',
+                                    'discount_type': 'fixed_amount', 'discount_value': 5, 'is_used': False}
+                                   for i in range(20)])
+
+
+def test_large_response_is_gzipped(app_client, coupons):
+    response = app_client.get('/api/coupons', headers={'Accept-Encoding': 'gzip;q=1, br;q=0.1'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    body = gzip.decompress(response.get_data())
+    assert len(body) >= Config.COMPRESSION_MIN_SIZE
+    assert len(json.loads(body)['data']) == 20
+
+
+def test_small_or_unaccepted_response_is_sent_as_is(app_client, coupons):
+    small = app_client.get('/api/coupons?limit=1', headers={'Accept-Encoding': 'gzip'})
+    assert len(small.get_data()) < Config.COMPRESSION_MIN_SIZE
+    assert 'Content-Encoding' not in small.headers
+    plain = app_client.get('/api/coupons', headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in plain.headers
+    assert len(json.loads(plain.get_data())['data']) == 20
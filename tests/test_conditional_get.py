@@ -0,0 +1,61 @@
+# test_conditional_get.py - Data version and ETag revalidation on polled routes
+
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from postgrest import APIResponse
+
+import fake_supabase
+from coupon_changes import data_version
+
+
+def _coupon(code):
+    return {'id': str(uuid.uuid4()), 'code': code, 'name': code, 'discount_type': 'fixed_amount',
+            'discount_value': 5, 'is_used': False}
+
+
+@pytest.fixture
+def seeded(fake_supabase):
+    fake_supabase.seed('coupons', [_coupon(f'CODE{i}') for i in range(5)])
+    return fake_supabase
+
+
+@pytest.fixture
+def frozen_clock(monkeypatch):
+    """Keep every request in the same ETag window"""
+    monkeypatch.setattr('conditional_get.time', SimpleNamespace(time=lambda: 1_000_000.0))
+
+
+@pytest.fixture
+def client_responses(monkeypatch):
+    """Hand every result back as postgrest's own APIResponse, as the real client does"""
+    for builder in (fake_supabase.FakeQuery, fake_supabase.FakeRPC):
+        def execute(self, _execute=builder.execute):
+            response = _execute(self)
+            return APIResponse(data=response.data, count=response.count)
+        monkeypatch.setattr(builder, 'execute', execute)
+
+
+def test_version_moves_with_each_write(seeded):
+    versions = [data_version(seeded)]
+    seeded.table('coupons').update({'is_used': True}).eq('code', 'CODE1').execute()
+    versions.append(data_version(seeded))
+    seeded.table('coupons').delete().eq('code', 'CODE2').execute()
+    versions.append(data_version(seeded))
+    seeded.table('referrals').insert({'referrer_email': 'a@example.com', 'referee_email': 'b@example.com'}).execute()
+    versions.append(data_version(seeded))
+    assert len({version.token for version in versions}) == len(versions)
+
+
+def test_version_read_does_not_touch_coupon_stats(seeded):
+    seeded.reset_calls()
+    data_version(seeded)
+    assert dict(seeded.calls) == {'rpc coupon_data_version': 1}
+
+
+def test_unchanged_list_revalidates_to_304(app_client, seeded, frozen_clock, client_responses):
+    etag = app_client.get('/api/coupons').headers['ETag']
+    assert app_client.get('/api/coupons', headers={'If-None-Match': etag}).status_code == 304
+    seeded.table('coupons').update({'is_used': True}).eq('code', 'CODE3').execute()
+    assert app_client.get('/api/coupons', headers={'If-None-Match': etag}).status_code == 200
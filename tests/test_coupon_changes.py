@@ -0,0 +1,135 @@
+# test_coupon_changes.py - Delta sync round trips and watermark validation
+
+import base64
+import json
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import pytest
+
+from coupon_changes import (NIL_ID, after_position, decode_watermark, encode_watermark, fetch_changes,
+                            prune_tombstones)
+from coupon_columns import COUPON_PROJECTION
+
+STAMP = '2024-05-01T12:00:00.000001+00:00'
+
+
+def _forge(raw: Any) -> str:
+    return base64.urlsafe_b64encode(json.dumps(raw).encode()).decode().rstrip('=')
+
+
+@pytest.fixture
+def backend(fake_supabase):
+    fake_supabase.seed('coupons', [{'code': f'CODE{i}', 'discount_value': 5} for i in range(25)])
+    return fake_supabase
+
+
+@pytest.fixture
+def mirror(backend):
+    """A client's local copy and a sync() that pulls every page into it"""
+    rows: Dict[str, Dict[str, Any]] = {}
+
+    def sync(watermark: Optional[str]) -> Tuple[str, int]:
+        calls = 0
+        while True:
+            changes = fetch_changes(backend, watermark, 10, settle=0.0)
+            calls += 1
+            if changes['resync']:
+                rows.clear()
+            for tombstone in changes['deleted']:
+                rows.pop(tombstone['id'], None)
+            rows.update((row['id'], row) for row in changes['upserted'])
+            watermark = changes['watermark']
+            if not changes['has_more']:
+                return watermark, calls
+
+    def in_sync() -> bool:
+        return rows == {row['id']: row for row in backend.table('coupons').select(COUPON_PROJECTION).execute().data}
+
+    return sync, in_sync
+
+
+def test_full_then_delta_sync(backend, mirror):
+    sync, in_sync = mirror
+    watermark, calls = sync(None)
+    assert in_sync() and calls == 3
+
+    backend.table('coupons').update({'is_used': True}).eq('code', 'CODE3').execute()
+    backend.table('coupons').delete().eq('code', 'CODE7').execute()
+    backend.table('coupons').insert({'code': 'NEW1', 'discount_value': 10}).execute()
+    changes = fetch_changes(backend, watermark, 10, settle=0.0)
+    assert len(changes['upserted']) == 2 and len(changes['deleted']) == 1
+    watermark, _ = sync(watermark)
+    assert in_sync()
+
+    changes = fetch_changes(backend, watermark, 10, settle=0.0)
+    assert not changes['upserted'] and not changes['deleted']
+
+
+def test_rows_inside_settle_window_are_sent_again(backend, mirror):
+    sync, _ = mirror
+    watermark, _ = sync(None)
+    backend.table('coupons').update({'is_used': True}).eq('code', 'CODE4').execute()
+    held = fetch_changes(backend, watermark, 10, settle=3600.0)
+    assert len(held['upserted']) == 1 and held['watermark'] == watermark
+    backend.table('coupons').update({'is_used': False}).neq('code', 'NONE').execute()
+    held = fetch_changes(backend, watermark, 10, settle=3600.0)
+    assert len(held['upserted']) == 10 and not held['has_more']
+
+
+def test_watermark_round_trip():
+    positions = (STAMP, NIL_ID), None
+    assert decode_watermark(encode_watermark(*positions)) == positions
+
+
+@pytest.mark.parametrize('raw', [
+    'bm90LWEtd2F0ZXJtYXJr',
+    _forge({'c': [STAMP]}),
+    _forge({'c': [STAMP, NIL_ID], 'd': ['yesterday', NIL_ID]}),
+    _forge({'c': [STAMP, f'{NIL_ID}),is_used.eq.true'], 'd': None}),
+    _forge({'c': [f'{STAMP}",or(code.neq.x', NIL_ID], 'd': None}),
+    _forge({'c': [1, 2], 'd': None}),
+])
+def test_forged_watermark_rejected(backend, raw):
+    with pytest.raises(ValueError, match='Invalid watermark'):
+        fetch_changes(backend, raw, 10)
+
+
+def test_after_position_rejects_unchecked_position(backend):
+    query = backend.table('coupons').select('id')
+    with pytest.raises(ValueError):
+        after_position(query, 'updated_at', (STAMP, 'x),is_used.eq.true'), 10)
+
+
+def test_settle_window_runs_on_database_clock(backend, mirror, monkeypatch):
+    sync, _ = mirror
+    watermark, _ = sync(None)
+    backend.table('coupons').update({'is_used': True}).eq('code', 'CODE5').execute()
+    # An app server an hour ahead of the database must not release the fresh row
+    real_time = time.time
+    monkeypatch.setattr(time, 'time', lambda: real_time() + 3600)
+    held = fetch_changes(backend, watermark, 10, settle=60.0)
+    assert len(held['upserted']) == 1 and held['watermark'] == watermark
+
+
+def test_pruned_tombstones_force_a_resync(backend, mirror):
+    sync, in_sync = mirror
+    old_watermark, _ = sync(None)
+    backend.table('coupons').delete().eq('code', 'CODE8').execute()
+    result = prune_tombstones(backend, 0)
+    assert result['removed'] == 1
+
+    changes = fetch_changes(backend, old_watermark, 10, settle=0.0)
+    assert changes['resync'] and not changes['deleted'] and len(changes['upserted']) == 10
+    watermark, calls = sync(old_watermark)
+    assert in_sync() and calls == 3
+
+    backend.table('coupons').delete().eq('code', 'CODE9').execute()
+    changes = fetch_changes(backend, watermark, 10, settle=0.0)
+    assert not changes['resync'] and [row['code'] for row in changes['deleted']] == ['CODE9']
+
+
+def test_prune_cutoff_never_moves_back(backend):
+    first = prune_tombstones(backend, 0)
+    second = prune_tombstones(backend, 30)
+    assert second['pruned_before'] == first['pruned_before']
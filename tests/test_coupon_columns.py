@@ -0,0 +1,60 @@
+# test_coupon_columns.py - ?fields= sparse fieldsets on the coupon list routes
+
+import uuid
+
+import pytest
+
+from coupon_columns import COUPON_COLUMNS, parse_fields
+
+
+@pytest.fixture
+def coupons(fake_supabase):
+    rows = [{'id': str(uuid.uuid4()), 'code': f'CODE{i:02d}', 'name': f'Coupon {i}', 'discount_type': 'fixed_amount',
+             'discount_value': i, 'is_used': False, 'assigned_to_email': 'a@example.com' if i % 2 else None}
+            for i in range(20)]
+    fake_supabase.seed('coupons', rows)
+    return rows
+
+
+def test_parse_fields():
+    assert parse_fields(None) == ','.join(COUPON_COLUMNS)
+    assert parse_fields(' code , discount_value,code,id ') == 'id,created_at,code,discount_value'
+    with pytest.raises(ValueError, match='Unknown fields: secret, password'):
+        parse_fields('code,secret,password')
+
+
+@pytest.mark.parametrize('fields', ['nope', 'code,nope', 'code,*', 'code,referrals(*)'])
+def test_unknown_field_is_400(app_client, coupons, fake_supabase, fields):
+    fake_supabase.reset_calls()
+    response = app_client.get('/api/coupons', query_string={'fields': fields})
+    assert response.status_code == 400
+    assert 'Unknown fields' in response.get_json()['message']
+    assert not fake_supabase.calls['select coupons']
+
+
+def test_id_and_created_at_always_included(app_client, coupons):
+    response = app_client.get('/api/coupons', query_string={'fields': 'code'})
+    assert response.status_code == 200
+    rows = response.get_json()['data']
+    assert rows and all(set(row) == {'id', 'created_at', 'code'} for row in rows)
+
+
+def test_cursor_pages_a_sparse_fieldset(app_client, coupons):
+    seen, cursor = [], None
+    while True:
+        query = {'fields': 'code,discount_value', 'limit': 7}
+        if cursor:
+            query['cursor'] = cursor
+        page = app_client.get('/api/coupons', query_string=query).get_json()
+        assert all(set(row) == {'id', 'created_at', 'code', 'discount_value'} for row in page['data'])
+        seen.extend(row['code'] for row in page['data'])
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+    assert sorted(seen) == sorted(coupon['code'] for coupon in coupons)
+
+
+def test_sparse_fieldset_with_email_filter(app_client, coupons):
+    page = app_client.get('/api/coupons', query_string={'fields': 'code', 'email': 'a@example.com'}).get_json()
+    assert sorted(row['code'] for row in page['data']) == sorted(
+        coupon['code'] for coupon in coupons if coupon['assigned_to_email'])
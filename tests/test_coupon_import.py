@@ -0,0 +1,76 @@
+# test_coupon_import.py - Streaming CSV import: batching, duplicates and per-row errors
+
+import io
+
+import pytest
+
+from coupon_import import CouponImporter, normalize_import_row
+
+HEADER = 'code,discount_type,discount_value,expiry_date,usage_limit,minimum_order_value\n'
+
+
+def _csv(*lines: str) -> io.BytesIO:
+    return io.BytesIO((HEADER + '\n'.join(lines) + '\n').encode('utf-8-sig'))
+
+
+def _codes(fake):
+    return sorted(row['code'] for row in fake.table('coupons').select('code').execute().data)
+
+
+def test_stream_is_imported_in_batches(fake_supabase):
+    inserted = []
+    stream = _csv(*(f'code{i},percentage,10,2099-01-01,,' for i in range(25)))
+    result = CouponImporter(fake_supabase, batch_size=10, on_inserted=inserted.append).run(stream)
+    assert (result['success_count'], result['error_count']) == (25, 0)
+    assert [len(rows) for rows in inserted] == [10, 10, 5]
+    assert fake_supabase.calls['insert coupons'] == 3
+    assert len(_codes(fake_supabase)) == 25
+
+
+def test_duplicate_codes_in_file_and_table(fake_supabase):
+    fake_supabase.seed('coupons', [{'code': 'TAKEN', 'discount_value': 1}])
+    stream = _csv('dup,fixed_amount,5,,,', 'DUP,fixed_amount,6,,,', 'taken,fixed_amount,5,,,', 'fresh,fixed_amount,5,,,')
+    result = CouponImporter(fake_supabase).run(stream)
+    assert result['success_count'] == 2
+    assert [(error['line'], error['error']) for error in result['errors']] == [
+        (3, 'duplicate code in file'), (4, 'code already exists')]
+    assert _codes(fake_supabase) == ['DUP', 'FRESH', 'TAKEN']
+
+
+@pytest.mark.parametrize('line, message', [
+    ('BAD,bogus,5,,,', 'invalid discount_type'),
+    ('BAD,percentage,150,,,', 'must not exceed 100'),
+    ('BAD,fixed_amount,-1,,,', 'must not be negative'),
+    ('BAD,fixed_amount,nan,,,', 'invalid discount_value'),
+    ('BAD,fixed_amount,ten,,,', 'invalid discount_value'),
+    ('BAD,fixed_amount,5,31/12/2099,,', 'invalid expiry_date'),
+    ('BAD,fixed_amount,5,,0,', 'usage_limit must be at least 1'),
+    ('BAD,fixed_amount,5,,,-3', 'minimum_order_value must not be negative'),
+    ('BAD,,5,,,', 'missing discount_type'),
+])
+def test_bad_row_is_reported_alone(fake_supabase, line, message):
+    stream = _csv('GOOD1,fixed_amount,5,2099-01-01,,', line, 'GOOD2,Percentage,20,,3,10')
+    result = CouponImporter(fake_supabase).run(stream)
+    assert result['success_count'] == 2 and result['error_count'] == 1
+    error, = result['errors']
+    assert error['line'] == 3 and message in error['error']
+    assert fake_supabase.calls['insert coupons'] == 1
+    assert _codes(fake_supabase) == ['GOOD1', 'GOOD2']
+
+
+def test_row_rejected_by_database_does_not_fail_its_batch(fake_supabase, monkeypatch):
+    # Another writer takes RACE after the existence prefetch has run
+    fake_supabase.seed('coupons', [{'code': 'RACE', 'discount_value': 1}])
+    monkeypatch.setattr(CouponImporter, '_existing_codes', lambda self, codes: set())
+    stream = _csv('ONE,fixed_amount,5,,,', 'race,fixed_amount,5,,,', 'TWO,fixed_amount,5,,,')
+    result = CouponImporter(fake_supabase).run(stream)
+    assert result['success_count'] == 2
+    assert [(error['line'], error['code']) for error in result['errors']] == [(3, 'RACE')]
+    assert _codes(fake_supabase) == ['ONE', 'RACE', 'TWO']
+
+
+def test_normalized_row():
+    coupon = normalize_import_row({'code': ' abc ', 'discount_type': ' Percentage ', 'discount_value': '12.5',
+                                   'expiry_date': '2099-01-01', 'usage_limit': '3'})
+    assert (coupon['code'], coupon['discount_type'], coupon['discount_value']) == ('ABC', 'percentage', 12.5)
+    assert (coupon['expiry_date'], coupon['usage_limit'], coupon['minimum_order_value']) == ('2099-01-01', 3, 0.0)
@@ -0,0 +1,50 @@
+# test_coupon_report.py - Streamed CSV reports and how they fail
+
+import csv
+import io
+
+import pytest
+
+from coupon_report import REPORT_ERROR_MARKER, iter_report_csv
+
+
+class FailingAfter:
+    """Passes table() through to the fake until `pages` queries have been built"""
+
+    def __init__(self, client, pages):
+        self.client = client
+        self.pages = pages
+
+    def table(self, name):
+        if self.pages == 0:
+            raise ConnectionError('backend went away')
+        self.pages -= 1
+        return self.client.table(name)
+
+
+@pytest.fixture
+def seeded(fake_supabase):
+    fake_supabase.seed('coupons', [{'code': f'CODE{i}', 'discount_type': 'fixed_amount',
+                                    'discount_value': i} for i in range(25)])
+    return fake_supabase
+
+
+def _rows(chunks):
+    return list(csv.reader(io.StringIO(''.join(chunks))))
+
+
+def test_streams_every_page(seeded):
+    rows = _rows(iter_report_csv(seeded, ['code', 'value'], {}, page_size=10))
+    assert rows[0] == ['Code', 'Value']
+    assert sorted(row[0] for row in rows[1:]) == sorted(f'CODE{i}' for i in range(25))
+
+
+def test_first_page_failure_raises_before_streaming(seeded):
+    with pytest.raises(ConnectionError):
+        iter_report_csv(FailingAfter(seeded, 0), ['code'], {}, page_size=10)
+
+
+def test_mid_stream_failure_ends_with_marker(seeded):
+    rows = _rows(iter_report_csv(FailingAfter(seeded, 2), ['code'], {}, page_size=10))
+    assert len(rows) == 1 + 20 + 1
+    assert rows[-1][0].startswith(REPORT_ERROR_MARKER)
@@ -0,0 +1,93 @@
+# test_coupon_stats.py - coupon_stats deltas stay in step with a full recount
+
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from postgrest import APIResponse
+
+from coupon_stats import CouponStats, created_delta, usage_delta
+from db_functions import analytics_from_counts, rpc_row
+
+NOW = datetime.now(timezone.utc)
+PAST = (NOW - timedelta(days=1)).isoformat()
+FUTURE = (NOW + timedelta(days=30)).isoformat()
+
+
+def _coupon(code, expiry=FUTURE, is_used=False, value=10):
+    return {'id': str(uuid.uuid4()), 'code': code, 'name': code, 'discount_type': 'fixed_amount',
+            'discount_value': value, 'expiry_date': expiry, 'is_used': is_used, 'is_assigned': False,
+            'created_at': NOW.isoformat()}
+
+
+def _recount(client):
+    return analytics_from_counts(rpc_row(client.rpc('coupon_analytics', {}).execute().data))
+
+
+@pytest.fixture
+def seeded(fake_supabase):
+    coupons = [_coupon('LIVE1'), _coupon('LIVE2', value=15), _coupon('OLD1', PAST, value=7),
+               _coupon('OLD2', PAST, value=3), _coupon('SPENT', is_used=True, value=20)]
+    fake_supabase.seed('coupons', coupons)
+    fake_supabase.seed('referrals', [{'referrer_email': 'a@example.com', 'referee_email': 'b@example.com',
+                                      'coupon_id': coupons[3]['id']}])
+    return {coupon['code']: coupon for coupon in coupons}
+
+
+def test_deltas_move_expired_buckets():
+    expired = _coupon('OLD', PAST, value=7)
+    assert created_delta([expired], -1)['expired_coupons'] == -1
+    assert created_delta([expired], -1)['expired_value'] == -7
+    assert usage_delta([expired], True)['expired_coupons'] == -1
+    assert usage_delta([dict(expired, is_used=True)], False)['expired_value'] == 7
+    assert created_delta([_coupon('NEW')])['expired_coupons'] == 0
+
+
+def test_admin_writes_keep_stats_in_step(app_client, fake_supabase, seeded):
+    stats = CouponStats(fake_supabase)
+    assert stats.analytics() == _recount(fake_supabase)
+
+    steps = [
+        ('/admin/toggle-coupon-status', {'coupon_id': seeded['OLD1']['id'], 'status': 'inactive'}),
+        ('/admin/toggle-coupon-status', {'coupon_id': seeded['OLD1']['id'], 'status': 'inactive'}),
+        ('/admin/toggle-coupon-status', {'coupon_id': seeded['SPENT']['id'], 'status': 'active'}),
+        ('/admin/bulk-update-status', {'coupon_ids': [seeded['LIVE1']['id'], seeded['OLD1']['id']],
+                                       'status': 'active'}),
+        ('/admin/delete-coupon', {'coupon_id': seeded['OLD2']['id']}),
+        ('/admin/bulk-delete', {'coupon_ids': [seeded['LIVE2']['id'], seeded['OLD1']['id']]}),
+    ]
+    for path, body in steps:
+        response = app_client.post(path, json=body)
+        assert response.get_json()['success'], (path, response.get_json())
+        assert stats.analytics() == _recount(fake_supabase), path
+
+
+def test_creates_and_mints_are_counted(app_client, fake_supabase, seeded):
+    stats = CouponStats(fake_supabase)
+    app_client.post('/admin/create-coupon', data={'code': 'MANUAL', 'name': 'Manual', 'discount_type':
+                                                  'fixed_amount', 'discount_value': '12'})
+    app_client.post('/api/coupons/gift', json={
+        'recipient_email': 'x@example.com', 'sender_email': 'y@example.com', 'name': 'Gift',
+        'discount_type': 'fixed_amount', 'discount_value': 25, 'expiry_date': FUTURE})
+    response = app_client.post('/api/coupons/batch', json={
+        'name': 'Campaign', 'discount_type': 'fixed_amount', 'discount_value': 5,
+        'expiry_date': PAST, 'count': 30})
+    assert response.status_code == 201
+    assert stats.analytics() == _recount(fake_supabase)
+    assert stats.analytics()['total_coupons'] == len(seeded) + 32
+
+
+def test_apply_and_rebuild_parse_as_client_responses(fake_supabase, seeded):
+    delta = {'total_coupons': 1, 'unused_value': 4}
+    applied = APIResponse(data=fake_supabase.rpc('apply_coupon_stats_delta', {'delta': delta}).execute().data)
+    assert applied.data[0]['total_coupons'] == len(seeded) + 1
+    rebuilt = APIResponse(data=fake_supabase.rpc('rebuild_coupon_stats', {}).execute().data)
+    assert rebuilt.data[0]['after']['total_coupons'] == len(seeded)
+
+
+def test_apply_tells_success_from_a_missing_row(fake_supabase, seeded):
+    stats = CouponStats(fake_supabase)
+    assert stats.apply({'total_coupons': 1}) is True
+    assert stats.rebuild()['drift'] == {'total_coupons': -1.0}
+    del fake_supabase.table_for('coupon_stats').rows[1]
+    assert stats.apply({'total_coupons': 1}) is False
@@ -0,0 +1,82 @@
+# test_coupon_validity.py - Expiry parsing and classification, and agreement with the SQL
+
+import sqlite3
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+from coupon_validity import ACTIVE, EXPIRED, INVALID, USED, classify, coupon_status, is_expired, parse_timestamp
+from db_functions import create_local_schema, local_coupon_analytics
+
+BASE = datetime(2026, 1, 1, tzinfo=timezone.utc)
+NOW = BASE.timestamp()
+
+
+@pytest.mark.parametrize('value', [
+    '2026-01-01T00:00:00+00:00',
+    '2026-01-01T00:00:00Z',
+    '2026-01-01T00:00:00z',
+    '2026-01-01T00:00:00',
+    '2026-01-01T02:00:00+02:00',
+    ' 2026-01-01T00:00:00Z ',
+    BASE,
+    BASE.replace(tzinfo=None),
+    date(2026, 1, 1),
+    NOW,
+    int(NOW),
+])
+def test_parse_timestamp_forms(value):
+    assert parse_timestamp(value) == NOW
+
+
+@pytest.mark.parametrize('value', [None, '', '   ', 'tomorrow', '2026-13-01', [NOW]])
+def test_parse_timestamp_unreadable(value):
+    assert parse_timestamp(value) is None
+
+
+@pytest.mark.parametrize('expiry, expired', [
+    (None, False),
+    ('', False),
+    ((BASE + timedelta(seconds=1)).isoformat(), False),
+    (BASE.isoformat(), True),
+    ((BASE - timedelta(days=1)).isoformat().replace('+00:00', 'Z'), True),
+    ('not a date', True),
+])
+def test_is_expired(expiry, expired):
+    assert is_expired({'expiry_date': expiry}, NOW) is expired
+
+
+def test_is_expired_defaults_to_the_clock():
+    assert is_expired({'expiry_date': '2000-01-01T00:00:00Z'})
+    assert not is_expired({'expiry_date': '2999-01-01T00:00:00Z'})
+
+
+def test_status_and_classify_agree():
+    coupons = [
+        {'is_used': True, 'expiry_date': 'not a date'},
+        {'is_used': False, 'expiry_date': None},
+        {'is_used': False, 'expiry_date': (BASE - timedelta(hours=1)).isoformat()},
+        {'is_used': False, 'expiry_date': 'not a date'},
+    ]
+    assert [coupon_status(coupon, NOW) for coupon in coupons] == [USED, ACTIVE, EXPIRED, INVALID]
+    buckets = classify(coupons, NOW)
+    assert {status: len(rows) for status, rows in buckets.items()} == {ACTIVE: 1, USED: 1, EXPIRED: 1, INVALID: 1}
+
+
+def test_classify_matches_local_coupon_analytics():
+    expiries = [(BASE + timedelta(days=day)).isoformat() for day in range(-5, 5)]
+    expiries += [expiry.replace('+00:00', 'Z') for expiry in expiries[:3]]
+    coupons = [{'id': str(uuid.uuid4()), 'code': f'C{index:04d}', 'discount_value': 10.0,
+                'is_used': index % 3 == 0, 'expiry_date': expiries[index % len(expiries)]}
+               for index in range(200)]
+
+    conn = sqlite3.connect(':memory:')
+    create_local_schema(conn)
+    conn.executemany('insert into coupons (id, code, discount_value, is_used, expiry_date) '
+                     'values (:id, :code, :discount_value, :is_used, :expiry_date)', coupons)
+    counts = local_coupon_analytics(conn, BASE)
+    buckets = classify(coupons, NOW)
+    assert counts['used_coupons'] == len(buckets[USED])
+    assert counts['expired_coupons'] == len(buckets[EXPIRED])
+    assert counts['active_coupons'] == len(buckets[ACTIVE])
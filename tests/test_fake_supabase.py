@@ -0,0 +1,34 @@
+# test_fake_supabase.py - FakeSupabaseClient keeps the real client's response contract
+
+import pytest
+from postgrest import APIResponse
+
+from fake_supabase import FakeResponse
+
+
+@pytest.mark.parametrize('data', [{'outcome': 'redeemed'}, None, 'text', [1, 2]])
+def test_non_list_data_is_rejected_like_the_real_client(data):
+    with pytest.raises(ValueError):
+        APIResponse(data=data)
+    with pytest.raises(ValueError):
+        FakeResponse(data)
+
+
+def test_rows_are_accepted_like_the_real_client():
+    rows = [{'id': 1}, {'id': 2}]
+    assert APIResponse(data=rows, count=2).data == FakeResponse(rows, 2).data
+
+
+@pytest.mark.parametrize('name, params', [
+    ('coupon_analytics', {}),
+    ('coupon_data_version', {}),
+    ('apply_coupon_stats_delta', {'delta': {'total_coupons': 0}}),
+    ('rebuild_coupon_stats', {}),
+    ('redeem_coupon', {'p_coupon_id': '00000000-0000-0000-0000-000000000000'}),
+    ('track_coupon_usage', {'p_coupon_code': 'X', 'p_discount': 1, 'p_order': {}}),
+    ('track_coupon_usage_batch', {'p_events': [{'coupon_code': 'Y'}]}),
+    ('create_referral_bundles', {'p_bundles': []}),
+])
+def test_every_rpc_returns_rows(fake_supabase, name, params):
+    data = fake_supabase.rpc(name, params).execute().data
+    assert APIResponse(data=data).data == data
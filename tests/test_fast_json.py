@@ -0,0 +1,87 @@
+# test_fast_json.py - FastJSONProvider output matches Flask's DefaultJSONProvider
+
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from markupsafe import Markup
+
+import fast_json
+
+
+@dataclasses.dataclass
+class Row:
+    code: str
+    value: decimal.Decimal
+
+
+PAYLOAD = {
+    'zeta': 1,
+    'alpha': [1.5, None, True, 'naïve ✓'],
+    'created_at': datetime(2026, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc),
+    'local': datetime(2026, 5, 1, 14, 30, tzinfo=timezone(timedelta(hours=2))),
+    'naive': datetime(2026, 5, 1, 12, 30),
+    'day': date(2026, 5, 1),
+    'amount': decimal.Decimal('10.50'),
+    'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+    'row': Row('ABC', decimal.Decimal('2.5')),
+    'html': Markup('<b>bold</b>'),
+    'nested': {'b': 2, 'a': {'d': 4, 'c': 3}},
+}
+
+
+@pytest.fixture(params=[True, False], ids=['orjson', 'stdlib'])
+def engine(request, monkeypatch):
+    if request.param and not fast_json.ORJSON_AVAILABLE:
+        pytest.skip('orjson is not installed')
+    monkeypatch.setattr(fast_json, 'ORJSON_AVAILABLE', request.param)
+
+
+@pytest.fixture
+def apps():
+    default, fast = Flask('default'), Flask('fast')
+    fast_json.init_fast_json(fast)
+    assert type(default.json) is DefaultJSONProvider
+    return default, fast
+
+
+def _keys(text):
+    """Every object's keys in document order"""
+    order = []
+    json.loads(text, object_pairs_hook=lambda pairs: order.append([key for key, _ in pairs]) or dict(pairs))
+    return order
+
+
+@pytest.mark.parametrize('sort_keys', [True, False])
+def test_dumps_matches_default_provider(engine, apps, sort_keys):
+    default, fast = apps
+    expected = default.json.dumps(PAYLOAD, sort_keys=sort_keys)
+    actual = fast.json.dumps(PAYLOAD, sort_keys=sort_keys)
+    assert json.loads(actual) == json.loads(expected)
+    assert _keys(actual) == _keys(expected)
+
+
+@pytest.mark.parametrize('debug', [False, True])
+def test_response_matches_default_provider(engine, apps, debug):
+    default, fast = apps
+    default.debug = fast.debug = debug
+    expected, actual = default.json.response(PAYLOAD), fast.json.response(PAYLOAD)
+    assert actual.mimetype == expected.mimetype
+    assert json.loads(actual.get_data()) == json.loads(expected.get_data())
+    assert _keys(actual.get_data()) == _keys(expected.get_data())
+    assert (b'\n  ' in actual.get_data()) is debug
+
+
+def test_unknown_type_raises(engine):
+    with pytest.raises(TypeError):
+        fast_json.dumps_bytes({'value': object()})
+
+
+def test_loads_round_trip(engine, apps):
+    _, fast = apps
+    assert fast.json.loads(fast.json.dumps({'a': [1, 'ü']})) == {'a': [1, 'ü']}
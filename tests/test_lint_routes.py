@@ -0,0 +1,18 @@
+# test_lint_routes.py - No per-item route scans the coupons table
+
+import lint_routes
+
+SCANNING_ROUTE = '''
+@app.route('/api/coupons/<coupon_id>')
+def get_coupon(coupon_id):
+    return [c for c in coupon_manager.get_all_coupons() if c['id'] == coupon_id]
+'''
+
+
+def test_no_table_scans():
+    assert lint_routes.main() == 0
+
+
+def test_scan_in_per_item_route_is_reported():
+    problems = lint_routes.check_source(SCANNING_ROUTE)
+    assert [(line, 'get_all_coupons' in message) for _, line, message in problems] == [(4, True)]
@@ -0,0 +1,36 @@
+# test_mint.py - Batch minting: the capped /api/coupons/batch route and the uncapped chunked path
+
+from config_py import Config
+from coupon_codes import mint_coupons
+
+TEMPLATE = {'name': 'Campaign', 'discount_type': 'fixed_amount', 'discount_value': 5,
+            'expiry_date': '2099-01-01T00:00:00'}
+
+
+def test_mint_batch_is_chunked_and_unique(app_client, fake_supabase):
+    fake_supabase.seed('coupons', [{'code': 'TAKEN1', 'discount_value': 1}])
+    response = app_client.post('/api/coupons/batch', json=dict(TEMPLATE, count=1200))
+    assert response.status_code == 201
+    assert response.get_json()['created_count'] == 1200
+
+    codes = [row['code'] for row in fake_supabase.table('coupons').select('code').execute().data]
+    assert len(codes) == len(set(codes)) == 1201
+    chunks = -(-1200 // Config.MINT_CHUNK_SIZE)
+    assert fake_supabase.calls['insert coupons'] == chunks
+
+
+def test_mint_batch_over_cap_is_rejected(app_client, fake_supabase):
+    response = app_client.post('/api/coupons/batch', json=dict(TEMPLATE, count=Config.MINT_MAX_COUNT + 1))
+    assert response.status_code == 400
+    assert not fake_supabase.calls['insert coupons']
+
+
+def test_large_mint_is_chunked_and_unique(fake_supabase):
+    count = Config.MINT_MAX_COUNT * 3
+    inserted = []
+    result = mint_coupons(fake_supabase, TEMPLATE, count, chunk_size=5000,
+                          on_inserted=lambda rows: inserted.append(len(rows)))
+    assert result['created_count'] == count and not result['failed_codes']
+    assert inserted == [5000] * (count // 5000)
+    codes = [row['code'] for row in fake_supabase.table('coupons').select('code').execute().data]
+    assert len(set(codes)) == count
@@ -0,0 +1,47 @@
+# test_pagination.py - Keyset cursors round-trip and reject forged keys
+
+import base64
+import json
+import uuid
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from pagination import decode_cursor, encode_cursor, next_link
+
+
+def _forge(created_at, coupon_id):
+    raw = json.dumps([created_at, coupon_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def test_round_trip():
+    row = {'created_at': '2024-05-01T10:00:00.123456+00:00', 'id': str(uuid.uuid4())}
+    assert decode_cursor(encode_cursor(row)) == (row['created_at'], row['id'])
+    assert decode_cursor(None) is None
+
+
+@pytest.mark.parametrize('created_at, coupon_id', [
+    ('2024-05-01T10:00:00+00:00", is_used.eq.true,and(id.eq."x', str(uuid.uuid4())),
+    ('2024-05-01T10:00:00+00:00', '1),code.neq.(x'),
+    ('yesterday', str(uuid.uuid4())),
+    (20240501, str(uuid.uuid4())),
+])
+def test_forged_cursor_rejected(created_at, coupon_id):
+    with pytest.raises(ValueError):
+        decode_cursor(_forge(created_at, coupon_id))
+
+
+def test_garbage_rejected():
+    with pytest.raises(ValueError):
+        decode_cursor('not-a-cursor')
+
+
+def test_next_link_keeps_other_args():
+    link = next_link('/api/user/a@example.com/coupons', {'limit': '5', 'fields': 'code', 'cursor': 'old'}, 'new')
+    url, rel = link.split('; ')
+    assert rel == 'rel="next"'
+    parts = urlsplit(url.strip('<>'))
+    assert parts.path == '/api/user/a@example.com/coupons'
+    assert parse_qs(parts.query) == {'limit': ['5'], 'fields': ['code'], 'cursor': ['new']}
+    assert next_link('/api/coupons', {'limit': '5'}, None) is None
@@ -0,0 +1,39 @@
+# test_query_budget.py - Backend calls per request for the polled routes
+#
+# A budget going up means a route gained a query (an N+1, a lost projection or
+# a dropped cache); lower it when a change makes a route cheaper.
+
+import random
+
+import pytest
+
+from benchmark_routes import Dataset
+
+BUDGETS = [
+    # path, max calls: data version + one page / aggregate
+    ('/admin', 2),
+    ('/api/coupons', 2),
+    ('/api/coupons?limit=10&email=user0@example.com', 2),
+    ('/api/analytics', 2),
+    ('/api/coupons/changes', 2),
+]
+
+
+@pytest.fixture
+def dataset(fake_supabase):
+    return Dataset(fake_supabase, 500, random.Random(1))
+
+
+@pytest.mark.parametrize('path, max_calls', BUDGETS)
+def test_route_budget(app_client, dataset, query_budget, path, max_calls):
+    with query_budget(max_calls=max_calls, label=path):
+        response = app_client.get(path)
+    assert response.status_code == 200
+
+
+def test_coupon_lookup_is_cached(app_client, dataset, query_budget):
+    path = f'/api/coupons/{dataset.all_ids[0]}'
+    with query_budget(max_calls=1, label=path):
+        assert app_client.get(path).status_code == 200
+    with query_budget(max_calls=0, label=path):
+        assert app_client.get(path).status_code == 200
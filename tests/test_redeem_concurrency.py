@@ -0,0 +1,94 @@
+# test_redeem_concurrency.py - N simultaneous redemptions of one coupon
+#
+# Exactly one caller may win; the rest must see already_used. Run against the
+# SQLite stand-in (one connection per thread, as separate workers would have)
+# and against FakeSupabaseClient's redeem_coupon RPC.
+
+import sqlite3
+import threading
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from postgrest import APIResponse
+
+from db_functions import (ALREADY_USED, EXPIRED, NOT_FOUND, REDEEMED, create_local_schema,
+                          local_redeem_coupon, rpc_row)
+
+THREADS = 16
+NOW = datetime.now(timezone.utc)
+
+
+def _coupon(code, days=30):
+    return {'id': str(uuid.uuid4()), 'code': code, 'discount_type': 'fixed_amount',
+            'discount_value': 10, 'is_used': False,
+            'expiry_date': (NOW + timedelta(days=days)).isoformat()}
+
+
+def _race(redeem, coupon_id):
+    """Release THREADS redemptions of coupon_id at once and count the outcomes"""
+    barrier = threading.Barrier(THREADS)
+
+    def attempt(_):
+        barrier.wait()
+        return redeem(coupon_id)['outcome']
+
+    with ThreadPoolExecutor(THREADS) as pool:
+        return Counter(pool.map(attempt, range(THREADS)))
+
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    path = str(tmp_path / 'coupons.db')
+    conn = sqlite3.connect(path)
+    create_local_schema(conn)
+    live, expired = _coupon('LIVE'), _coupon('OLD', days=-1)
+    with conn:
+        for coupon in (live, expired):
+            conn.execute('insert into coupons (id, code, discount_type, discount_value, is_used, expiry_date) '
+                         'values (:id, :code, :discount_type, :discount_value, :is_used, :expiry_date)', coupon)
+    conn.close()
+    return path, live, expired
+
+
+def test_sqlite_one_winner(sqlite_db):
+    path, live, expired = sqlite_db
+    local = threading.local()
+
+    def redeem(coupon_id):
+        if not hasattr(local, 'conn'):
+            local.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        return local_redeem_coupon(local.conn, coupon_id)
+
+    assert _race(redeem, live['id']) == {REDEEMED: 1, ALREADY_USED: THREADS - 1}
+    assert _race(redeem, expired['id']) == {EXPIRED: THREADS}
+    assert _race(redeem, str(uuid.uuid4())) == {NOT_FOUND: THREADS}
+
+
+def test_rpc_one_winner(fake_supabase):
+    live, expired = _coupon('LIVE'), _coupon('OLD', days=-1)
+    fake_supabase.seed('coupons', [live, expired])
+    # A little latency so the calls really overlap
+    fake_supabase.latency = 0.001
+
+    def redeem(coupon_id):
+        return rpc_row(fake_supabase.rpc('redeem_coupon', {'p_coupon_id': coupon_id}).execute().data)
+
+    assert _race(redeem, live['id']) == {REDEEMED: 1, ALREADY_USED: THREADS - 1}
+    assert _race(redeem, expired['id']) == {EXPIRED: THREADS}
+    assert _race(redeem, str(uuid.uuid4())) == {NOT_FOUND: THREADS}
+    assert fake_supabase.table('coupon_stats').select('used_coupons').execute().data[0]['used_coupons'] == 1
+
+
+def test_use_route_reports_a_committed_redemption(app_client, fake_supabase):
+    live = _coupon('LIVE')
+    fake_supabase.seed('coupons', [live])
+    # The result must survive the pinned client's response parsing
+    APIResponse(data=fake_supabase.rpc('redeem_coupon', {'p_coupon_id': str(uuid.uuid4())}).execute().data)
+
+    first = app_client.post(f"/api/coupons/{live['id']}/use")
+    assert first.status_code == 200 and first.get_json()['coupon']['is_used'] is True
+    retry = app_client.post(f"/api/coupons/{live['id']}/use")
+    assert retry.status_code == 400 and retry.get_json()['message'] == 'Coupon already used'
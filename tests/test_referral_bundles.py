@@ -0,0 +1,75 @@
+# test_referral_bundles.py - Single and chunked referral creation through the RPCs
+
+import pytest
+from postgrest import APIResponse
+
+import referral_bundles
+from coupon_stats import CouponStats
+from db_functions import analytics_from_counts, rpc_row
+from referral_bundles import build_referral_bundle, create_referral_bundle, create_referral_bundles
+
+
+def _referral(referee, reward=None):
+    return {'referrer_email': 'Referrer@Example.com', 'referee_email': referee, 'discount_value': 10,
+            'referrer_gets_reward': reward is not None, 'referrer_reward_value': reward}
+
+
+def _assert_stats_in_step(client):
+    recount = analytics_from_counts(rpc_row(client.rpc('coupon_analytics', {}).execute().data))
+    assert CouponStats(client).analytics() == recount
+
+
+@pytest.fixture
+def clashing(fake_supabase, monkeypatch):
+    """Every bundle for clash@example.com reuses a code that already exists"""
+    fake_supabase.seed('coupons', [{'code': 'TAKEN', 'discount_value': 1}])
+    build = referral_bundles.build_referral_bundle
+
+    def colliding(**referral):
+        bundle = build(**referral)
+        if referral['referee_email'] == 'clash@example.com':
+            bundle['referee_coupon']['code'] = 'TAKEN'
+        return bundle
+
+    monkeypatch.setattr(referral_bundles, 'build_referral_bundle', colliding)
+    return fake_supabase
+
+
+def test_rpc_results_parse_as_client_responses(fake_supabase):
+    single = fake_supabase.rpc('create_referral_bundle', {'p_bundle': build_referral_bundle(**_referral('a@x.com'))})
+    APIResponse(data=single.execute().data)
+    batch = fake_supabase.rpc('create_referral_bundles', {'p_bundles': [build_referral_bundle(**_referral('b@x.com'))]})
+    APIResponse(data=batch.execute().data)
+
+
+def test_single_referral_with_reward(fake_supabase):
+    result = create_referral_bundle(fake_supabase, **_referral('Friend@Example.com', reward=5))
+    referral = result['referral']
+    assert referral['coupon_id'] == result['referee_coupon']['id']
+    assert referral['referrer_reward_coupon_id'] == result['referrer_coupon']['id']
+    assert result['referee_coupon']['assigned_to_email'] == 'friend@example.com'
+    _assert_stats_in_step(fake_supabase)
+
+
+def test_referral_route_reports_success(app_client, fake_supabase):
+    response = app_client.post('/api/coupons/referral', json=dict(_referral('c@x.com'), discount_type='fixed_amount'))
+    assert response.status_code == 201 and response.get_json()['success'] is True
+    assert len(fake_supabase.table('referrals').select('id').execute().data) == 1
+
+
+def test_batch_creates_every_chunk(fake_supabase):
+    summary = create_referral_bundles(fake_supabase, [_referral(f'u{i}@x.com') for i in range(5)], chunk_size=2)
+    assert summary['created_count'] == 5 and not summary['failed_referrals']
+    assert [chunk['created'] for chunk in summary['chunks']] == [2, 2, 1]
+    _assert_stats_in_step(fake_supabase)
+
+
+def test_colliding_chunk_is_rolled_back(clashing):
+    referrals = [_referral('ok1@x.com'), _referral('clash@example.com'), _referral('ok2@x.com')]
+    summary = create_referral_bundles(clashing, referrals, chunk_size=2)
+    assert summary['created_count'] == 1
+    assert summary['failed_referrals'] == referrals[:2]
+    emails = {row.get('assigned_to_email') for row in clashing.table('coupons').select('*').execute().data}
+    assert emails == {None, 'ok2@x.com'}
+    assert [row['referee_email'] for row in clashing.table('referrals').select('*').execute().data] == ['ok2@x.com']
+    _assert_stats_in_step(clashing)
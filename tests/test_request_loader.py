@@ -0,0 +1,61 @@
+# test_request_loader.py - One backend read per distinct query within a request
+
+from typing import Any, List
+
+import pytest
+
+from pagination import keyset_page
+from request_loader import RequestScopedClient, request_scope
+
+
+@pytest.fixture
+def backend(fake_supabase):
+    fake_supabase.seed('coupons', [{'code': f'CODE{i}', 'discount_value': 5,
+                                    'assigned_to_email': f'u{i % 3}@x.com'} for i in range(30)])
+    fake_supabase.reset_calls()
+    return fake_supabase
+
+
+@pytest.fixture
+def client(backend):
+    return RequestScopedClient(backend)
+
+
+def admin_page(client) -> List[Any]:
+    """The reads a dashboard render makes, some of them more than once"""
+    return [
+        client.rpc('coupon_analytics', {}).execute(),
+        keyset_page(client.table('coupons').select('*'), None, 20).execute(),
+        client.rpc('coupon_analytics', {}).execute(),
+        client.table('coupons').select('*').eq('assigned_to_email', 'u1@x.com').execute(),
+        client.table('coupons').select('*').eq('assigned_to_email', 'u1@x.com').execute(),
+        client.table('coupons').select('*').eq('assigned_to_email', 'u2@x.com').execute(),
+    ]
+
+
+def test_repeated_reads_hit_the_backend_once(backend, client):
+    with request_scope():
+        admin_page(client)
+    assert backend.total_calls == 4, backend.calls
+
+
+def test_write_clears_the_memo(backend, client):
+    with request_scope():
+        client.table('coupons').select('*').eq('code', 'CODE1').execute()
+        client.table('coupons').update({'is_used': True}).eq('code', 'CODE1').execute()
+        used = client.table('coupons').select('*').eq('code', 'CODE1').execute()
+    assert backend.total_calls == 3, backend.calls
+    assert used.data[0]['is_used']
+
+
+def test_memo_does_not_outlive_its_request(backend, client):
+    with request_scope():
+        admin_page(client)
+    with request_scope():
+        admin_page(client)
+    assert backend.total_calls == 8, backend.calls
+
+
+def test_no_scope_passes_through(backend, client):
+    admin_page(client)
+    assert backend.total_calls == 6, backend.calls
@@ -0,0 +1,127 @@
+# test_sqlalchemy_storage.py - SQLAlchemyStorage on in-memory SQLite
+
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select
+
+from coupon_stats import STATS_FIELDS, counts_from_stats
+from database_models import CouponStatsRow, CouponUsageTracking, Referral
+from db_functions import (ALREADY_USED, EXPIRED, NOT_FOUND, REDEEMED, analytics_from_counts,
+                          create_local_schema, local_coupon_analytics)
+from sqlalchemy_storage import SQLAlchemyStorage, _json_value
+
+NOW = datetime.now(timezone.utc)
+
+
+def _coupon(code, days=30, is_used=False, value=10, email=None):
+    return {'code': code, 'name': code, 'discount_type': 'fixed_amount', 'discount_value': value,
+            'expiry_date': (NOW + timedelta(days=days)).isoformat(), 'is_used': is_used,
+            'assigned_to_email': email, 'is_assigned': email is not None}
+
+
+@pytest.fixture
+def storage():
+    storage = SQLAlchemyStorage('sqlite://')
+    storage.create_schema()
+    return storage
+
+
+@pytest.fixture
+def seeded(storage):
+    coupons = [_coupon('LIVE1', email='a@example.com'), _coupon('LIVE2', value=15, email='a@example.com'),
+               _coupon('OLD1', days=-1, value=7), _coupon('SPENT', is_used=True, value=20)]
+    created = {coupon['code']: storage.create_coupon(coupon) for coupon in coupons}
+    for index in range(30):
+        created[f'BULK{index}'] = storage.create_coupon(_coupon(f'BULK{index}', value=index))
+    return created
+
+
+def test_pages_cover_every_coupon_once(storage, seeded):
+    seen, cursor = [], None
+    while True:
+        rows, cursor = storage.get_coupons_page(7, cursor, columns='id,code,created_at')
+        seen.extend(row['code'] for row in rows)
+        if not cursor:
+            break
+    assert sorted(seen) == sorted(seeded)
+
+    rows, cursor = storage.get_coupons_page(10, email='a@example.com')
+    assert sorted(row['code'] for row in rows) == ['LIVE1', 'LIVE2'] and cursor is None
+    with pytest.raises(ValueError):
+        storage.get_coupons_page(10, 'forged')
+
+
+def test_redeem_outcomes(storage, seeded):
+    live = seeded['LIVE1']['id']
+    assert storage.redeem_coupon(live)['outcome'] == REDEEMED
+    assert storage.redeem_coupon(live)['outcome'] == ALREADY_USED
+    assert storage.redeem_coupon(seeded['OLD1']['id'])['outcome'] == EXPIRED
+    assert storage.redeem_coupon('not-a-uuid')['outcome'] == NOT_FOUND
+    assert storage.get_coupon_by_code('live1')['is_used'] is True
+
+
+def test_usage_tracking_appends_orders(storage, seeded):
+    assert storage.update_coupon_usage_tracking('live1', {'order_id': 1, 'discount_amount': 5})
+    assert storage.update_coupon_usage_tracking('LIVE1', {'order_id': 2, 'discount_amount': 2.5})
+    with storage.Session() as session:
+        tracking = session.execute(select(CouponUsageTracking)).scalar_one()
+    assert tracking.coupon_code == 'LIVE1' and tracking.usage_count == 2
+    assert float(tracking.total_discount) == 7.5
+    assert [order['order_id'] for order in tracking.orders_data] == [1, 2]
+
+
+def test_referral_bundle_is_created_together(storage):
+    result = storage.create_referral_coupon('ref@example.com', 'friend@example.com', 10,
+                                            referrer_gets_reward=True, referrer_reward_value=5)
+    assert result['success']
+    assert result['referee_coupon']['assigned_to_email'] == 'friend@example.com'
+    assert result['referrer_coupon']['discount_value'] == 5
+    with storage.Session() as session:
+        referral = session.execute(select(Referral)).scalar_one()
+    assert str(referral.coupon_id) == result['referee_coupon']['id']
+    assert str(referral.referrer_reward_coupon_id) == result['referrer_coupon']['id']
+
+
+def test_analytics_match_local_coupon_analytics(storage, seeded):
+    storage.create_referral_coupon('ref@example.com', 'friend@example.com', 10,
+                                   referrer_gets_reward=True, referrer_reward_value=5)
+    storage.redeem_coupon(seeded['LIVE2']['id'])
+
+    # Copy every row into the sqlite3 stand-in schema and aggregate it there too
+    conn = sqlite3.connect(':memory:')
+    create_local_schema(conn)
+    for coupon in storage.iter_coupons():
+        conn.execute('insert into coupons (id, code, discount_value, expiry_date, is_used) '
+                     'values (:id, :code, :discount_value, :expiry_date, :is_used)', coupon)
+    with storage.Session() as session:
+        for referral in session.execute(select(Referral)).scalars():
+            conn.execute('insert into referrals (id, coupon_id) values (?, ?)',
+                         (_json_value(referral.id), _json_value(referral.coupon_id)))
+
+    analytics = storage.get_coupon_analytics()
+    assert analytics == analytics_from_counts(local_coupon_analytics(conn))
+    assert analytics['total_coupons'] == len(seeded) + 2
+
+
+def test_writes_move_coupon_stats_in_step(storage, seeded):
+    storage.create_referral_coupon('ref@example.com', 'friend@example.com', 10,
+                                   referrer_gets_reward=True, referrer_reward_value=5)
+    storage.create_referral_coupons_batch([{'referrer_email': 'r2@example.com', 'referee_email': 'f2@example.com',
+                                            'discount_value': 5}])
+    storage.redeem_coupon(seeded['LIVE1']['id'])
+    storage.redeem_coupon(seeded['LIVE1']['id'])
+
+    with storage.Session() as session:
+        stats = session.get(CouponStatsRow, 1)
+        row = {field: getattr(stats, field) for field in STATS_FIELDS}
+    assert analytics_from_counts(counts_from_stats(row)) == storage.get_coupon_analytics()
+    assert row['referral_coupons'] == 2 and row['referral_used'] == 0
+
+
+def test_create_schema_seeds_stats_row_once(storage):
+    storage.create_schema()
+    with storage.Session() as session:
+        rows = session.execute(select(CouponStatsRow)).scalars().all()
+    assert [(row.id, row.total_coupons) for row in rows] == [(1, 0)]
@@ -0,0 +1,36 @@
+# test_usage_tracking.py - track_coupon_usage(_batch) through SupabaseService
+
+import pytest
+from postgrest import APIResponse
+
+from supabase_service import SupabaseService
+
+
+@pytest.fixture
+def service(fake_supabase):
+    service = SupabaseService()
+    service.client = fake_supabase
+    return service
+
+
+def _tracking(fake_supabase, code):
+    return fake_supabase.table('coupon_usage_tracking').select('*').eq('coupon_code', code).execute().data[0]
+
+
+def test_single_event_returns_the_tracking_row(service, fake_supabase):
+    params = {'p_coupon_code': 'SAVE5', 'p_discount': 5, 'p_order': {'order_id': 1}}
+    rows = APIResponse(data=fake_supabase.rpc('track_coupon_usage', params).execute().data).data
+    assert rows[0]['usage_count'] == 1
+    assert service.update_coupon_usage_tracking('save5', {'order_id': 2, 'discount_amount': 2.5}) is True
+    row = _tracking(fake_supabase, 'SAVE5')
+    assert row['usage_count'] == 2 and row['total_discount'] == 7.5 and len(row['orders_data']) == 2
+
+
+def test_batch_folds_events_per_code(service, fake_supabase):
+    events = [('a1', {'order_id': 1, 'discount_amount': 1}), ('A1', {'order_id': 2, 'discount_amount': 2}),
+              ('b2', {'order_id': 3, 'discount_amount': 3})]
+    payload = [{'coupon_code': code, 'discount_amount': 0, 'order_data': order} for code, order in events]
+    APIResponse(data=fake_supabase.rpc('track_coupon_usage_batch', {'p_events': payload[:1]}).execute().data)
+    assert service.update_coupon_usage_tracking_batch(events, chunk_size=2) is True
+    assert _tracking(fake_supabase, 'A1')['usage_count'] == 3
+    assert _tracking(fake_supabase, 'B2')['total_discount'] == 3
@@ -2,25 +2,21 @@
 
 from flask import render_template, request, jsonify, redirect, url_for, flash
 from supabase_service import supabase_service
+from pagination import next_link, parse_limit
+from coupon_columns import parse_fields
+from db_functions import REDEEMED, ALREADY_USED, EXPIRED, NOT_FOUND
+from coupon_validity import is_expired
+from supabase_pool import pool_stats
+from coupon_storage import get_storage
+from conditional_get import conditional
 from datetime import datetime, timedelta
-import uuid
 
 # Home page - showing available coupons
 @app.route('/')
 def index():
     try:
-        # Get all active (not used and not expired) coupons
-        all_coupons = supabase_service.get_all_coupons()
-        
-        # Filter active coupons
-        active_coupons = []
-        current_time = datetime.utcnow()
-        
-        for coupon in all_coupons:
-            if not coupon.get('is_used') and coupon.get('expiry_date'):
-                expiry_date = datetime.fromisoformat(coupon['expiry_date'].replace('Z', '+00:00'))
-                if expiry_date > current_time:
-                    active_coupons.append(coupon)
+        # Get active (not used and not expired) coupons, filtered in the database
+        active_coupons = supabase_service.get_active_coupons(app.config['COUPONS_PER_PAGE'])
         
         # Get analytics data
         analytics = supabase_service.get_coupon_analytics()
@@ -36,8 +32,12 @@ def index():
 @app.route('/admin')
 def admin():
     try:
-        # Get all coupons for admin view
-        coupons = supabase_service.get_all_coupons()
+        # Get one page of coupons for admin view
+        cursor = request.args.get('cursor')
+        try:
+            coupons, next_cursor = supabase_service.get_coupons_page(app.config['COUPONS_PER_PAGE'], cursor)
+        except ValueError:
+            return redirect(url_for('admin'))
         
         # Get analytics
         analytics = supabase_service.get_coupon_analytics()
@@ -48,7 +48,9 @@ def admin():
         return render_template('admin.html', 
                              coupons=coupons, 
                              analytics=analytics,
-                             recent_activity=recent_activity)
+                             recent_activity=recent_activity,
+                             cursor=cursor,
+                             next_cursor=next_cursor)
     except Exception as e:
         app.logger.error(f"Error in admin route: {str(e)}")
         return render_template('admin.html', coupons=[], analytics={}, recent_activity=[])
@@ -66,8 +68,8 @@ def claim_page():
         if not coupon_code:
             return render_template('claim.html', error="Please enter a coupon code")
         
-        # Get coupon from Supabase
-        coupon = supabase_service.get_coupon_by_code(coupon_code)
+        # Get coupon from the configured storage backend
+        coupon = get_storage().get_coupon_by_code(coupon_code)
         
         if not coupon:
             return render_template('claim.html', error="Coupon code not found")
@@ -76,11 +78,8 @@ def claim_page():
         if coupon.get('is_used'):
             return render_template('claim.html', error="This coupon has already been used")
         
-        # Check expiry date
-        if coupon.get('expiry_date'):
-            expiry_date = datetime.fromisoformat(coupon['expiry_date'].replace('Z', '+00:00'))
-            if expiry_date <= datetime.utcnow():
-                return render_template('claim.html', error="This coupon has expired")
+        if is_expired(coupon):
+            return render_template('claim.html', error="This coupon has expired")
         
         # Check if coupon is assigned to specific email
         if coupon.get('is_assigned') and coupon.get('assigned_to_email'):
@@ -100,28 +99,26 @@ def use_coupon(coupon_id):
     try:
         user_email = request.form.get('user_email', '').strip()
         
-        # Get coupon by ID
-        all_coupons = supabase_service.get_all_coupons()
-        coupon = None
-        for c in all_coupons:
-            if c['id'] == coupon_id:
-                coupon = c
-                break
+        # Redeem by primary key in one conditional update
+        storage = get_storage()
+        result = storage.redeem_coupon(coupon_id)
+        coupon = result['coupon']
         
-        if not coupon:
+        if result['outcome'] == NOT_FOUND:
             return render_template('claim.html', error="Coupon not found")
+        if result['outcome'] == ALREADY_USED:
+            return render_template('claim.html', error="This coupon has already been used")
+        if result['outcome'] == EXPIRED:
+            return render_template('claim.html', error="This coupon has expired")
         
-        # Mark coupon as used
-        success = supabase_service.mark_coupon_used(coupon['code'])
-        
-        if success:
+        if result['outcome'] == REDEEMED:
             # Update usage tracking
             order_data = {
                 'user_email': user_email,
                 'discount_amount': float(coupon['discount_value']),
                 'used_at': datetime.utcnow().isoformat()
             }
-            supabase_service.update_coupon_usage_tracking(coupon['code'], order_data)
+            storage.update_coupon_usage_tracking(coupon['code'], order_data)
             
             return render_template('claim.html', 
                                  success="Coupon claimed successfully!", 
@@ -189,14 +186,10 @@ def update_coupon_status(coupon_id):
         if new_status not in ['active', 'inactive']:
             return jsonify({'error': 'Invalid status'}), 400
         
-        # Update coupon (you might need to implement status field in your schema)
-        updates = {'updated_at': datetime.utcnow().isoformat()}
-        if new_status == 'inactive':
-            updates['is_used'] = True  # Mark as used to make it inactive
-        else:
-            updates['is_used'] = False
-        
-        updated_coupon = supabase_service.update_coupon(coupon_id, updates)
+        # Status maps onto is_used; toggling keeps coupon_stats in step
+        updated_coupon = None
+        if supabase_service.toggle_coupon_status(coupon_id, new_status):
+            updated_coupon = supabase_service.get_coupon_by_id(coupon_id)
         
         if updated_coupon:
             return jsonify({'message': f'Coupon {new_status}', 'coupon': updated_coupon})
@@ -226,12 +219,7 @@ def delete_coupon(coupon_id):
 @app.route('/api/coupons/<coupon_id>')
 def get_coupon_api(coupon_id):
     try:
-        all_coupons = supabase_service.get_all_coupons()
-        coupon = None
-        for c in all_coupons:
-            if c['id'] == coupon_id:
-                coupon = c
-                break
+        coupon = get_storage().get_coupon_by_id(coupon_id)
         
         if coupon:
             return jsonify(coupon)
@@ -244,14 +232,25 @@ def get_coupon_api(coupon_id):
 
 # Get analytics (API)
 @app.route('/api/stats')
+@conditional(lambda: get_storage().get_data_version(), window=app.config['ANALYTICS_ETAG_WINDOW'])
 def get_stats():
     try:
-        analytics = supabase_service.get_coupon_analytics()
+        analytics = get_storage().get_coupon_analytics()
         return jsonify(analytics)
     except Exception as e:
         app.logger.error(f"Error fetching stats: {str(e)}")
         return jsonify({'error': 'An error occurred'}), 500
 
+# Lookup cache counters (API)
+@app.route('/api/cache/stats')
+def cache_stats():
+    return jsonify(supabase_service.cache.stats())
+
+# Supabase connection pool counters (API)
+@app.route('/api/pool/stats')
+def connection_pool_stats():
+    return jsonify(pool_stats())
+
 # Shopify integration routes
 @app.route('/shopify')
 def shopify_integration():
@@ -353,16 +352,43 @@ def create_referral():
             'message': 'An error occurred while creating referral'
         }), 500
 
-# Get user's coupons
+# Get user's coupons: a bare list as before, one page at a time. The next
+# page, if any, is in the Link header (rel="next").
 @app.route('/api/user/<email>/coupons')
+@conditional(lambda: get_storage().get_data_version(), window=app.config['SYNC_SETTLE_SECONDS'])
 def get_user_coupons(email):
     try:
-        coupons = supabase_service.get_coupons_by_email(email)
-        return jsonify(coupons)
+        limit = parse_limit(request.args.get('limit'), app.config['COUPONS_PER_PAGE'], app.config['MAX_COUPONS_PER_PAGE'])
+        columns = parse_fields(request.args.get('fields'))
+        coupons, next_cursor = get_storage().get_coupons_page(limit, request.args.get('cursor'), email, columns)
+        response = jsonify(coupons)
+        link = next_link(request.path, request.args.to_dict(), next_cursor)
+        if link:
+            response.headers['Link'] = link
+        return response
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         app.logger.error(f"Error fetching user coupons for {email}: {str(e)}")
         return jsonify({'error': 'An error occurred'}), 500
 
+# Delta sync for clients that keep a local copy of the coupons. resync: true
+# means the watermark predates the kept tombstones; drop the copy first.
+@app.route('/api/coupons/changes')
+@conditional(supabase_service.get_data_version, window=app.config['SYNC_SETTLE_SECONDS'])
+def get_coupon_changes():
+    try:
+        limit = parse_limit(request.args.get('limit'), app.config['MAX_COUPONS_PER_PAGE'], app.config['MAX_COUPONS_PER_PAGE'])
+        columns = parse_fields(request.args.get('fields'))
+        changes = supabase_service.get_coupon_changes(request.args.get('since'), limit, columns,
+                                                      app.config['SYNC_SETTLE_SECONDS'])
+        return jsonify(changes)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"Error fetching coupon changes: {str(e)}")
+        return jsonify({'error': 'An error occurred'}), 500
+
 # Generate coupon for user
 @app.route('/api/user/<email>/generate-coupon', methods=['POST'])
 def generate_user_coupon(email):
@@ -410,14 +436,14 @@ def bulk_delete_coupons():
         data = request.get_json()
         coupon_ids = data.get('couponIds', [])
         
-        deleted_count = 0
-        for coupon_id in coupon_ids:
-            if supabase_service.delete_coupon(coupon_id):
-                deleted_count += 1
+        result = supabase_service.bulk_delete_coupons(coupon_ids, app.config['BULK_CHUNK_SIZE'])
         
         return jsonify({
             'success': True,
-            'message': f'{deleted_count} coupons deleted successfully'
+            'message': f"{result['processed_count']} coupons deleted successfully",
+            'deleted_count': result['processed_count'],
+            'chunks': result['chunks'],
+            'failed_ids': result['failed_ids']
         })
         
     except Exception as e:
@@ -434,16 +460,17 @@ def bulk_update_status():
         coupon_ids = data.get('couponIds', [])
         status = data.get('status')
         
-        updated_count = 0
-        updates = {'is_used': status == 'inactive'}
+        if status not in ['active', 'inactive']:
+            return jsonify({'success': False, 'message': 'Invalid status'}), 400
         
-        for coupon_id in coupon_ids:
-            if supabase_service.update_coupon(coupon_id, updates):
-                updated_count += 1
+        result = supabase_service.bulk_update_status(coupon_ids, status, app.config['BULK_CHUNK_SIZE'])
         
         return jsonify({
             'success': True,
-            'message': f'{updated_count} coupons updated successfully'
+            'message': f"{result['processed_count']} coupons updated successfully",
+            'updated_count': result['processed_count'],
+            'chunks': result['chunks'],
+            'failed_ids': result['failed_ids']
         })
         
     except Exception as e: